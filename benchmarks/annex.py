@@ -0,0 +1,94 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for the Annexificator"""
+
+import os
+from os.path import join as opj
+
+from datalad.support.stats import ActivityStats
+
+from datalad_crawler.nodes.annex import Annexificator
+
+from .common import CallCounter
+from .common import LocalHTTPServer
+from .common import TempDirBenchmarks
+from .common import get_rng
+
+
+class AnnexificatorStatus(TempDirBenchmarks):
+    """Number of `git status` invocations while adding files"""
+
+    params = ([10, 100], [False, True])
+    param_names = ['nfiles', 'batch_status']
+    # every run needs a fresh repository with files yet to be added
+    number = 1
+
+    def setup(self, nfiles, batch_status):
+        super(AnnexificatorStatus, self).setup()
+        self.annex = Annexificator(
+            path=self.path, batch_status=batch_status,
+            largefiles="exclude=*.txt")
+        self.fnames = ['f%d.txt' % i for i in range(nfiles)]
+        for fname in self.fnames:
+            with open(opj(self.path, fname), 'w') as f:
+                f.write(fname)
+        self.counter = CallCounter(
+            self.annex.repo.call_git, key=lambda args, **kw: args[0])
+        self.annex.repo.call_git = self.counter
+
+    def _add_all(self):
+        stats = ActivityStats()
+        for fname in self.fnames:
+            list(self.annex({'filename': fname, 'datalad_stats': stats}))
+        list(self.annex.finalize()({'datalad_stats': stats}))
+
+    def time_add(self, nfiles, batch_status):
+        self._add_all()
+
+    def track_status_calls(self, nfiles, batch_status):
+        self._add_all()
+        return self.counter.count('status')
+    track_status_calls.unit = "git status calls"
+
+
+class AnnexificatorIngest(TempDirBenchmarks):
+    """Adding 10k files served by a local HTTP server"""
+
+    params = (['relaxed', 'full'], [10000])
+    param_names = ['mode', 'nfiles']
+    number = 1
+    repeat = 1
+    timeout = 3600
+
+    def setup(self, mode, nfiles):
+        super(AnnexificatorIngest, self).setup()
+        rng = get_rng()
+        served = opj(self.path, 'served')
+        self.files = []
+        for i in range(nfiles):
+            path, fname = 'd%02d' % (i % 100), 'f%05d.dat' % i
+            os.makedirs(opj(served, path), exist_ok=True)
+            with open(opj(served, path, fname), 'wb') as f:
+                f.write(rng.randbytes(rng.randint(0, 4096)))
+            self.files.append((path, fname))
+        self.server = LocalHTTPServer(served)
+        self.annex = Annexificator(path=opj(self.path, 'repo'), mode=mode)
+
+    def teardown(self, mode, nfiles):
+        self.server.stop()
+        super(AnnexificatorIngest, self).teardown()
+
+    def time_ingest(self, mode, nfiles):
+        stats = ActivityStats()
+        url = self.server.url
+        for path, fname in self.files:
+            list(self.annex({'url': '%s%s/%s' % (url, path, fname),
+                             'path': path, 'filename': fname,
+                             'datalad_stats': stats}))
+        list(self.annex.finalize()({'datalad_stats': stats}))
@@ -0,0 +1,82 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Helpers shared among benchmarks"""
+
+import random
+import tempfile
+import threading
+
+from functools import partial
+from http.server import SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from datalad.utils import rmtree
+
+# benchmarks which generate random data should do it using `get_rng`, so
+# they operate on the same data across runs and could be compared
+SEED = 20201217
+
+
+def get_rng(seed=SEED):
+    """Return a random numbers generator initialized with a fixed seed"""
+    return random.Random(seed)
+
+
+class TempDirBenchmarks(object):
+    """Base class for benchmarks which need a temporary directory"""
+
+    # manually set a number since otherwise takes way too long!
+    # see https://github.com/spacetelescope/asv/issues/497
+    number = 3
+    # although seems to work ok with a timer which accounts for subprocesses
+
+    def setup(self, *args):
+        self.path = tempfile.mkdtemp(prefix='datalad_crawler_bm_')
+
+    def teardown(self, *args):
+        rmtree(self.path)
+
+
+class CallCounter(object):
+    """Wrap a callable to count invocations, e.g. of `call_git` per command"""
+
+    def __init__(self, func, key=None):
+        self._func = func
+        self._key = key
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append(self._key(*args, **kwargs) if self._key else args)
+        return self._func(*args, **kwargs)
+
+    def count(self, key):
+        return sum(1 for c in self.calls if c == key)
+
+
+class _QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalHTTPServer(object):
+    """Serve a directory over HTTP from a thread, as a stand-in for a website"""
+
+    def __init__(self, path):
+        self._server = ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            partial(_QuietHTTPRequestHandler, directory=path))
+        self.url = 'http://127.0.0.1:%d/' % self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -0,0 +1,82 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for crawler's DBs"""
+
+from datalad.support.gitrepo import GitRepo
+from datalad.support.status import FileStatus
+
+from datalad_crawler.dbs.files import JsonFileStatusesDB
+from datalad_crawler.dbs.files import JournaledFileStatusesDB
+from datalad_crawler.dbs.versions import SingleVersionDB
+
+from .common import TempDirBenchmarks
+from .common import get_rng
+
+
+class SingleVersionDBUpdates(TempDirBenchmarks):
+    """Recording the last processed key as crawl_s3 does for every key"""
+
+    params = ([1, None],)
+    param_names = ['save_every']
+
+    def setup(self, save_every):
+        super(SingleVersionDBUpdates, self).setup()
+        self.repo = GitRepo(self.path, create=True)
+
+    def time_set_version(self, save_every):
+        db = SingleVersionDB(self.repo, save_every=save_every)
+        for i in range(200):
+            db.version = {
+                'last-modified': '2020-01-01T00:00:00.000Z',
+                'name': 'key%d' % i,
+                'version-id': str(i)}
+        # checkpoint
+        db.save()
+
+
+class FileStatusesDBOps(TempDirBenchmarks):
+    """Operations on a statuses DB with 500k files, 1% of which get changed"""
+
+    params = (['json', 'journal'],)
+    param_names = ['db']
+    timeout = 600
+    number = 1
+    repeat = 3
+
+    nfiles = 500000
+
+    def setup(self, db):
+        super(FileStatusesDBOps, self).setup()
+        self.cls = {'json': JsonFileStatusesDB, 'journal': JournaledFileStatusesDB}[db]
+        self.repo = GitRepo(self.path, create=True)
+        rng = get_rng()
+        self.fpaths = ['sub-%03d/ses-%d/f%06d.nii.gz' % (i % 1000, i % 3, i)
+                       for i in range(self.nfiles)]
+        self.statuses = [FileStatus(size=rng.randint(0, 2 ** 30),
+                                    mtime=rng.randint(10 ** 9, 2 * 10 ** 9))
+                         for _ in range(self.nfiles)]
+        self.db = self.cls(annex=self.repo)
+        for fpath, status in zip(self.fpaths, self.statuses):
+            self.db.set(fpath, status)
+        self.db.save()
+        self.changed = rng.sample(range(self.nfiles), self.nfiles // 100)
+
+    def time_load_get(self, db):
+        db = self.cls(annex=self.repo)
+        for fpath in self.fpaths:
+            db.get(fpath)
+
+    def time_set(self, db):
+        for fpath, status in zip(self.fpaths, self.statuses):
+            self.db.set(fpath, status)
+
+    def time_update_save(self, db):
+        for i in self.changed:
+            self.db.set(self.fpaths[i], FileStatus(size=i, mtime=i))
+        self.db.save()
@@ -0,0 +1,61 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for matchers over large pages"""
+
+from datalad_crawler.nodes import matches
+from datalad_crawler.nodes.matches import a_href_match, xpath_match
+
+
+def _get_listing(nlinks):
+    """Generate a directory listing-like page with nlinks links"""
+    rows = ''.join(
+        '<tr><td><a href="sub%03d/file%06d.nii.gz">file%06d.nii.gz</a></td>'
+        '<td>2020-01-01 00:00</td><td>%d</td></tr>\n' % (i % 100, i, i, i)
+        for i in range(nlinks))
+    return '<html><body><table>\n%s</table></body></html>' % rows
+
+
+class MatchersOnListing(object):
+    """10 matchers applied to the same ~5MB listing page"""
+
+    params = [False, True]
+    param_names = ['shared']
+    timeout = 300
+
+    def setup(self, shared):
+        self.data = {'response': _get_listing(50000), 'url': 'http://example.com/'}
+        self.matchers = \
+            [a_href_match('.*/file0%d.*' % i) for i in range(5)] + \
+            [xpath_match('//tr[%d]/td[3]/text()' % (i + 1)) for i in range(5)]
+
+    def time_matchers(self, shared):
+        # parsed page is shared only among matchers given the same page object
+        for matcher in self.matchers:
+            data = self.data if shared else \
+                dict(self.data, response=''.join(self.data['response']))
+            for _ in matcher(data):
+                pass
+
+
+class AnchorsMatch(object):
+    """Matching anchors of a listing with 100k links"""
+
+    params = ['a_href_match', 'a_text_match']
+    param_names = ['matcher']
+    timeout = 300
+
+    def setup(self, matcher):
+        self.data = {'response': _get_listing(100000), 'url': 'http://example.com/'}
+        self.matcher = getattr(matches, matcher)(r'.*file0999\d\d.*')
+        # parse it ahead, so only matching is timed
+        matches._get_selector(self.data['response'])
+
+    def time_match(self, matcher):
+        for _ in self.matcher(self.data):
+            pass
@@ -0,0 +1,73 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for the overhead of running pipelines"""
+
+from datalad.utils import updated
+
+from datalad_crawler.nodes.misc import range_node
+from datalad_crawler.support.data import LayeredDict
+from datalad_crawler.pipeline import xrun_pipeline
+
+
+def _passthrough(data):
+    yield data
+
+
+class PipelineOverhead(object):
+    """Per-item overhead of engines for pipelines of trivial nodes"""
+
+    params = (['recursive', 'iterative'], [10, 50, 100])
+    param_names = ['engine', 'nnodes']
+
+    nitems = 1000
+
+    def setup(self, engine, nnodes):
+        self.pipeline = [range_node(self.nitems)] + [_passthrough] * (nnodes - 1)
+
+    def time_run(self, engine, nnodes):
+        for _ in xrun_pipeline(self.pipeline, engine=engine):
+            pass
+
+
+class NodeOverhead(object):
+    """Cost per item of running a node within a pipeline vs calling it directly"""
+
+    params = ['direct', 'recursive', 'iterative']
+    param_names = ['engine']
+
+    nitems = 10000
+
+    def setup(self, engine):
+        self.node = range_node(self.nitems)
+
+    def time_node(self, engine):
+        if engine == 'direct':
+            for _ in self.node({}):
+                pass
+        else:
+            for _ in xrun_pipeline([self.node], engine=engine):
+                pass
+
+
+class RecordDerivation(object):
+    """Deriving data records by a chain of nodes, as typically done via `updated`"""
+
+    params = (['dict', 'LayeredDict'], [10, 100, 1000])
+    param_names = ['record', 'nkeys']
+
+    def setup(self, record, nkeys):
+        data = {'key%d' % i: 'value' * i for i in range(nkeys)}
+        self.data = LayeredDict(data) if record == 'LayeredDict' else data
+
+    def time_derive(self, record, nkeys):
+        for i in range(1000):
+            data = self.data
+            for step in range(20):
+                data = updated(data, {'step': step})
+            data.get('key0')
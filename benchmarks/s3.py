@@ -0,0 +1,121 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for S3 bucket listing"""
+
+from unittest.mock import patch
+
+from datalad.support.gitrepo import GitRepo
+from datalad.support.stats import ActivityStats
+
+from datalad_crawler.nodes import s3
+from datalad_crawler.nodes.s3 import crawl_s3
+from datalad_crawler.nodes.s3 import _drop_older
+from datalad_crawler.nodes.s3 import _get_version_cmp
+from datalad_crawler.nodes.s3 import _list_bucket
+from datalad_crawler.nodes.s3 import _skip_processed
+from datalad_crawler.nodes.s3 import _sorted_entries
+from datalad_crawler.nodes.s3 import _VERSION_FIELDS
+from datalad_crawler.nodes.tests.utils import StubS3Client
+
+from .common import TempDirBenchmarks
+
+
+class ListBucket(object):
+    """Listing of a stubbed bucket with 1M keys under 100 top level prefixes"""
+
+    params = ([1, 4, 16],)
+    param_names = ['jobs']
+    timeout = 300
+    number = 1
+    repeat = 3
+
+    def setup_cache(self):
+        return ['%02d/%03d/%04d.dat' % (i // 10000, (i // 100) % 100, i % 100)
+                for i in range(1000000)]
+
+    def setup(self, keys, jobs):
+        # stubbed request latency is nowhere close to real S3's ~50ms
+        # but makes benefits of parallel listing visible
+        self.client = StubS3Client(keys, latency=0.005)
+
+    def time_list_bucket(self, keys, jobs):
+        for _ in _list_bucket(self.client, 'bucket', None, True, True, jobs=jobs):
+            pass
+
+
+class ResumeUnchanged(object):
+    """Resuming from the stored version while nothing has changed in the bucket"""
+
+    params = ([False, True],)
+    param_names = ['drop_older']
+
+    def setup(self, drop_older):
+        self.client = StubS3Client(
+            ['%03d/%04d.dat' % (i // 1000, i % 1000) for i in range(200000)])
+        last = max(
+            _list_bucket(self.client, 'bucket', None, True, True),
+            key=lambda e: e['LastModified'])
+        self.prev_version = dict(zip(_VERSION_FIELDS, _get_version_cmp(last)))
+
+    def time_resume(self, drop_older):
+        entries = _list_bucket(self.client, 'bucket', None, True, True)
+        if drop_older:
+            entries = _drop_older(entries, self.prev_version)
+        for _ in _skip_processed(_sorted_entries(entries), self.prev_version):
+            pass
+
+
+class _StubProviders(object):
+    """Providers giving a downloader with the stubbed client for any url"""
+
+    def __init__(self, client):
+        self.client = client
+        self._bucket_name = 'bucket'
+
+    def from_config_files(self):
+        return self
+
+    def get_provider(self, url):
+        return self
+
+    def get_downloader(self, url):
+        return self
+
+    def get_status(self, url):
+        return None
+
+
+class CrawlS3(TempDirBenchmarks):
+    """crawl_s3 over a stubbed bucket with 250k keys, 4 versions each"""
+
+    params = ([None, 100000],)
+    param_names = ['max_in_memory']
+    timeout = 600
+    number = 1
+    repeat = 3
+
+    def setup(self, max_in_memory):
+        super(CrawlS3, self).setup()
+        self.repo = GitRepo(self.path, create=True)
+        client = StubS3Client(
+            ['%02d/%03d/%04d.dat' % (i // 10000, (i // 100) % 100, i % 100)
+             for i in range(250000)],
+            nversions=4)
+        self._patch = patch.object(s3, 'Providers', _StubProviders(client))
+        self._patch.start()
+
+    def teardown(self, max_in_memory):
+        self._patch.stop()
+        super(CrawlS3, self).teardown()
+
+    def time_crawl_s3(self, max_in_memory):
+        node = crawl_s3('bucket', repo=self.repo, recursive=True,
+                        max_in_memory=max_in_memory)
+        for _ in node({'datalad_stats': ActivityStats()}):
+            pass
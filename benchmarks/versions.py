@@ -0,0 +1,33 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for versions extraction"""
+
+from datalad_crawler.support.versions import get_versions
+
+from .common import get_rng
+
+
+class GetVersions(object):
+    """Extracting versions of 1000 files across many releases"""
+
+    params = [10, 100, 1000]
+    param_names = ['nversions']
+    timeout = 300
+
+    def setup(self, nversions):
+        self.staged = [
+            'sub-%02d/file%03d_R1.%d.%d.nii.gz' % (i % 10, i, v // 10, v % 10)
+            for v in range(nversions)
+            for i in range(1000)
+        ]
+        # as listed by git status, i.e. not grouped by version
+        get_rng().shuffle(self.staged)
+
+    def time_get_versions(self, nversions):
+        get_versions(self.staged, r'_R(?P<version>[\d.]+?)\.nii')
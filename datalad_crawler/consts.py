@@ -24,3 +24,5 @@ CRAWLER_META_CONFIG_PATH = join(CRAWLER_META_DIR, CRAWLER_META_CONFIG_FILENAME)
 CRAWLER_META_VERSIONS_DIR = join(CRAWLER_META_DIR, 'versions')
 # TODO: RENAME THIS UGLINESS?
 CRAWLER_META_STATUSES_DIR = join(CRAWLER_META_DIR, 'statuses')
+# local (not committed) cache of fetched pages
+CRAWLER_META_PAGES_CACHE_DIR = join(CRAWLER_META_DIR, 'cache', 'pages')
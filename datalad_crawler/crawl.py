@@ -11,15 +11,21 @@
 __docformat__ = 'restructuredtext'
 
 
-from os.path import exists
+import pickle
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from os.path import abspath, exists, splitext
+from pathlib import PurePath
 from datalad.interface.base import Interface
 from datalad.interface.base import build_doc
 
 from datalad.support.param import Parameter
-from datalad.support.constraints import EnsureStr, EnsureNone
+from datalad.support.constraints import EnsureInt, EnsureStr, EnsureNone
 from datalad_crawler.pipeline import initiate_pipeline_config
 from datalad.support.stats import ActivityStats
 from datalad import utils
+from datalad.log import log_progress
 
 from logging import getLogger
 lgr = getLogger('datalad.api.crawl')
@@ -56,7 +62,28 @@ class Crawl(Interface):
         recursive=Parameter(
             args=("-r", "--recursive"),
             action="store_true",
-            doc="""flag to crawl subdatasets as well (for now serially)"""),
+            doc="""flag to crawl subdatasets as well"""),
+        jobs=Parameter(
+            args=("-J", "--jobs"),
+            constraints=EnsureInt() | EnsureNone(),
+            doc="""number of subdatasets to crawl in parallel (in separate
+            processes) if [CMD: --recursive CMD][PY: recursive=True PY].
+            A subdataset is crawled only after all its parent subdatasets
+            were crawled.  Outputs of the subdatasets crawled in separate
+            processes retain only the values which could be pickled.
+            If not specified, `datalad.crawl.jobs`
+            configuration variable is consulted (default: 1)"""),
+        profile=Parameter(
+            args=("--profile",),
+            metavar='FILE',
+            constraints=EnsureStr() | EnsureNone(),
+            doc="""profile the nodes of the pipeline, saving the profile (as
+            JSON) into FILE, and logging it as a table at the end.  Profiles
+            of the subdatasets (if [CMD: --recursive CMD][PY: recursive=True PY])
+            are saved into files named after FILE with the path of the
+            subdataset appended.  If not specified,
+            `datalad.crawl.pipeline.profile` configuration variable
+            is consulted"""),
         chdir=Parameter(
             args=("-C", "--chdir"),
             constraints=EnsureStr() | EnsureNone(),
@@ -72,7 +99,7 @@ class Crawl(Interface):
 
     @staticmethod
     def __call__(path=None, is_pipeline=False, is_template=False,
-                 recursive=False, chdir=None):  # dry_run=False,
+                 recursive=False, chdir=None, jobs=None, profile=None):  # dry_run=False,
         dry_run = False
 
         from datalad_crawler.pipeline import (
@@ -80,8 +107,13 @@ class Crawl(Interface):
             get_repo_pipeline_config_path, get_repo_pipeline_script_path
         )
         from datalad_crawler.pipeline import run_pipeline
+        from datalad_crawler.support.ratecontrol import get_controller as get_ratecontroller
         from datalad.utils import chpwd  # import late so we could mock during tests
 
+        if profile:
+            # relative to the current directory, not the one to chdir to
+            profile = abspath(profile)
+
         with chpwd(chdir):
 
             assert not (is_pipeline and is_template), "it is either a pipeline or a template name, can't be both"
@@ -127,13 +159,16 @@ class Crawl(Interface):
             # TODO: capture the state of all branches so in case of crash
             # we could gracefully reset back
             try:
-                output = run_pipeline(pipeline, stats=stats)
+                output = run_pipeline(pipeline, stats=stats, profile=profile)
             except Exception as exc:
                 # TODO: config.crawl.failure = full-reset | last-good-master
                 # probably ask via ui which action should be performed unless
                 # explicitly specified
                 raise
             stats.datasets_crawled += 1
+            controller = get_ratecontroller()
+            if controller is not None:
+                lgr.info("Requests to remote hosts: %s", controller.as_str())
 
             # TODO:  Move gc/clean over here!
 
@@ -144,37 +179,150 @@ class Crawl(Interface):
                 ## ? assert path_orig is None, "Otherwise not sure what to do with path=%r in subdatasets" % path
                 import os
                 from datalad.distribution.dataset import Dataset
-                from datalad.api import crawl
-                from datalad.utils import swallow_logs
                 from datalad.dochelpers import exc_str
                 # Note: we could collect all datasets to be crawled here or pass recursive=True
                 # into the subdatasets' crawl.  We will collect all of them here so we might later
                 # also introduce automatic commits when super-dataset got successfully updated
                 subdatasets = Dataset(os.curdir).subdatasets(recursive=recursive, result_xfm='relpaths')
 
+                if jobs is None:
+                    jobs = int(cfg.obtain('datalad.crawl.jobs', default=1))
                 lgr.info("Crawling %d subdatasets", len(subdatasets))
                 output = [output]
-                # TODO: parallelize
                 # TODO: assumes that all sub-datasets are 'crawllable', and if not
                 # just adds them to crawl_failed count.  But may be we should make it more
                 # explicit, that some sub-datasets might not need to be crawled, so they get
                 # skipped explicitly?
-                for ds_ in subdatasets:
+                outputs = {}
+                for ds_, res in _crawl_subdatasets(subdatasets, jobs, profile=profile):
                     ds_logfile = utils.get_logfilename(ds_, 'crawl')
-                    try:
-                        # TODO: might be cool to be able to report a 'heart beat' from the swallow into pbar or smth
-                        with swallow_logs(file_=ds_logfile) as cml:
-                            output_, stats_ = crawl(chdir=ds_)
-                            stats_total += stats_
-                            output.append(output_)
-                        lgr.info("Crawled %s: %s (log: %s)", ds_, stats_.as_str(mode='line'), ds_logfile)
-                    except Exception as exc:
+                    if isinstance(res, Exception):
                         stats_total.datasets_crawl_failed += 1
                         stats_total.datasets_crawled += 1
-                        output += [None]
+                        outputs[ds_] = None
                         lgr.warning("Crawling of %s has failed (more in %s): %s.",  # Log output: %s",
-                                    ds_, ds_logfile, exc_str(exc))  # , cml.out)
+                                    ds_, ds_logfile, exc_str(res))  # , cml.out)
+                    else:
+                        output_, stats_ = res
+                        stats_total += stats_
+                        outputs[ds_] = output_
+                        lgr.info("Crawled %s: %s (log: %s)", ds_, stats_.as_str(mode='line'), ds_logfile)
+                output += [outputs[ds_] for ds_ in subdatasets]
 
             lgr.info("Total stats: %s", stats_total.as_str(mode='line'))
 
             return output, stats_total
+
+
+def _get_subdataset_profile(profile, ds_):
+    """Return filename for the profile of the subdataset, given the top one"""
+    if not profile:
+        return profile
+    root, ext = splitext(profile)
+    return '%s-%s%s' % (root, '-'.join(PurePath(ds_).parts), ext)
+
+
+def _is_picklable(value):
+    """Return True if value could be pickled, e.g. to pass it between processes"""
+    try:
+        # some (e.g. ActivityStats) get pickled but fail to load
+        pickle.loads(pickle.dumps(value))
+    except Exception:
+        return False
+    return True
+
+
+def _get_picklable(output):
+    """Return output of the pipeline retaining only values which could be pickled
+
+    Output is a list of data dicts (or of such lists, if crawled recursively)
+    """
+    if isinstance(output, list):
+        return [_get_picklable(o) for o in output]
+    if isinstance(output, dict):
+        out = {}
+        for k, v in output.items():
+            if _is_picklable(v):
+                out[k] = v
+            else:
+                lgr.debug("Not passing %r of %s type from a subdataset crawl",
+                          k, type(v))
+        return out
+    return output if _is_picklable(output) else None
+
+
+def _crawl_subdataset(ds_, profile=None, picklable=False):
+    """Crawl a subdataset while logging into its own log file
+
+    Might be ran in a separate process, so imports are done within, and
+    with `picklable` output is reduced to what could be passed back from it,
+    and stats are returned as a dict.
+    """
+    from datalad.api import crawl
+    from datalad.utils import swallow_logs
+    ds_logfile = utils.get_logfilename(ds_, 'crawl')
+    # TODO: might be cool to be able to report a 'heart beat' from the swallow into pbar or smth
+    with swallow_logs(file_=ds_logfile):
+        output, stats = crawl(
+            chdir=ds_, profile=_get_subdataset_profile(profile, ds_))
+    if picklable:
+        return _get_picklable(output), stats.as_dict()
+    return output, stats
+
+
+def _crawl_subdatasets(subdatasets, jobs=1, profile=None):
+    """Crawl subdatasets, possibly in parallel, yielding (path, (output, stats) or exception)
+
+    With multiple jobs, a subdataset is crawled only after all its
+    parent datasets among `subdatasets` are done, since crawling of a parent
+    might modify the subdataset (e.g., install or update it).
+    Results are yielded in the order of completion.
+    """
+    pid = 'crawl-subdatasets-%s' % id(subdatasets)
+    log_progress(lgr.info, pid, 'Start crawling %d subdatasets', len(subdatasets),
+                 total=len(subdatasets), label='Crawling', unit=' Datasets')
+
+    def _done(ds_):
+        log_progress(lgr.info, pid, 'Crawled %s', ds_, update=1, increment=True)
+
+    if jobs <= 1:
+        for ds_ in subdatasets:
+            try:
+                res = _crawl_subdataset(ds_, profile=profile)
+            except Exception as exc:
+                res = exc
+            _done(ds_)
+            yield ds_, res
+    else:
+        all_ds = set(subdatasets)
+        parents = {
+            ds_: {str(p) for p in PurePath(ds_).parents} & all_ds
+            for ds_ in subdatasets
+        }
+        todo = list(subdatasets)
+        done = set()
+        running = {}
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            while todo or running:
+                todo_ = []
+                for ds_ in todo:
+                    if len(running) < jobs and parents[ds_] <= done:
+                        running[executor.submit(
+                            _crawl_subdataset, ds_,
+                            profile=profile, picklable=True)] = ds_
+                    else:
+                        todo_.append(ds_)
+                todo = todo_
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    ds_ = running.pop(future)
+                    done.add(ds_)
+                    exc = future.exception()
+                    _done(ds_)
+                    if exc is not None:
+                        yield ds_, exc
+                    else:
+                        output_, stats_ = future.result()
+                        yield ds_, (output_, ActivityStats(**stats_))
+
+    log_progress(lgr.info, pid, 'Finished crawling subdatasets')
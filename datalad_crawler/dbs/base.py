@@ -11,16 +11,19 @@
 """
 
 import os
+import sys
 import json
+import time
 from abc import ABCMeta, abstractmethod
 
 from os.path import join as opj, exists, lexists, realpath, basename, dirname
 from os.path import normpath
 from os.path import isabs
+from os.path import sep
 
 from datalad.utils import auto_repr
-from datalad.utils import find_files
 from datalad_crawler.consts import HANDLE_META_DIR
+from datalad_crawler.support.status import ChecksumFileStatus
 
 import logging
 lgr = logging.getLogger('datalad.crawler.dbs')
@@ -32,15 +35,38 @@ __docformat__ = 'restructuredtext'
 class JsonBaseDB(metaclass=ABCMeta):
     """
     Base class for DBs which would store to JSON files
+
+    Changes to the DB should be announced by subclasses via `_mark_dirty`
+    (or `_changed`), so saving could be skipped if nothing has changed since
+    the DB was loaded or saved.
     """
 
-    def __init__(self, repo, name=None):
+    def __init__(self, repo, name=None, save_every=1, save_interval=None):
+        """
+
+        Parameters
+        ----------
+        repo : GitRepo
+        name : str, optional
+          Name of the DB.  If not provided, name of the active branch is used
+        save_every : int, optional
+          For DBs which save themselves upon changes (see `_changed`), after how
+          many changes to save.  If None, no saving based on the number of changes
+        save_interval : float, optional
+          For DBs which save themselves upon changes (see `_changed`), save if
+          that many seconds passed since the last save
+        """
         #super(JsonBaseDB, self).__init__()
         self.repo = repo
         self.name = name
+        self.save_every = save_every
+        self.save_interval = save_interval
         self._filepath = None
         self._loaded = None
         self.__db = None
+        # generations of the DB -- current one, and the one which was saved/loaded
+        self._generation = self._saved_generation = 0
+        self._saved_time = time.time()
 
     def _assure_loaded(self):
         """Make it lazy loading/creation so we get actual active branch where it is used
@@ -68,10 +94,36 @@ class JsonBaseDB(metaclass=ABCMeta):
             json_db = json.load(f)  # return f.read().strip()
         self.__db = self._get_loaded_db(json_db)
 
-    def save(self):
-        if self._filepath is None:
+    @property
+    def dirty(self):
+        """Either there were changes since the DB was loaded or saved"""
+        return self._generation != self._saved_generation
+
+    def _mark_dirty(self):
+        self._generation += 1
+
+    def _changed(self):
+        """Mark DB as changed and save it if it is due according to save_every/save_interval"""
+        self._mark_dirty()
+        if (self.save_every and
+                self._generation - self._saved_generation >= self.save_every) \
+                or (self.save_interval is not None and
+                    time.time() - self._saved_time >= self.save_interval):
+            self.save()
+
+    def save(self, stage=True):
+        """Write the DB into its file if it has changed
+
+        Parameters
+        ----------
+        stage : bool, optional
+          Either to also stage the file in the index of the repository
+        """
+        if self._filepath is None or not self.dirty:
             # nothing to do
             return
+        self._saved_generation = self._generation
+        self._saved_time = time.time()
         db = self._get_db_to_save()
         if (not self._loaded) and (db == self.get_empty_db()):
             lgr.debug("DB %s which we defaulted to found to be empty, not saving" % self)
@@ -81,14 +133,17 @@ class JsonBaseDB(metaclass=ABCMeta):
         if not exists(d):
             os.makedirs(d)
         lgr.debug("Writing %s to %s" % (self.__class__.__name__, self._filepath))
-        if lexists(self._filepath):
-            # might be annexed, can't open for over-write, thuse just remove first
-            os.unlink(self._filepath)
-        with open(self._filepath, 'w') as f:
+        # write into a temporary file first, so a crash would not leave the DB
+        # truncated.  Replacing (instead of over-writing) also takes care
+        # about the file being annexed
+        temp_filepath = self._filepath + '.tmp'
+        with open(temp_filepath, 'w') as f:
             json.dump(db, f, indent=2, sort_keys=True, separators=(',', ': '))
+        os.replace(temp_filepath, self._filepath)
 
-        # stage to be committed:
-        self.repo.add(self._filepath, git=True)
+        if stage:
+            # stage to be committed:
+            self.repo.add(self._filepath, git=True)
 
     @property
     def db_version(self):
@@ -137,7 +192,9 @@ class FileStatusesBaseDB(object):
         self.annex = annex
         # which file paths were referred
         self._track_queried = track_queried
-        self._queried_filepaths = set()
+        # paths relative to the top of the repo (in POSIX form, as git
+        # reports them), interned so they are not duplicated in memory
+        self._queried_paths = set()
 
     @property
     def track_queried(self):
@@ -145,7 +202,23 @@ class FileStatusesBaseDB(object):
 
     @property
     def queried_filepaths(self):
-        return self._queried_filepaths
+        return {self._get_filepath(p) for p in self._queried_paths}
+
+    def _get_relpath(self, filepath):
+        """Return path relative to the top of the repo in POSIX form, as git reports it
+
+        Paths outside of the repository are returned as is
+        """
+        topdir = self.annex.path.rstrip(sep) + sep
+        if not filepath.startswith(topdir):
+            return filepath
+        path = filepath[len(topdir):]
+        if sep != '/':
+            path = path.replace(sep, '/')
+        return path
+
+    def _add_queried(self, filepath):
+        self._queried_paths.add(sys.intern(self._get_relpath(filepath)))
 
     def _get_filepath(self, fpath):
         if isabs(fpath):
@@ -166,7 +239,7 @@ class FileStatusesBaseDB(object):
         """
         filepath = self._get_filepath(fpath)
         if self._track_queried:
-            self._queried_filepaths.add(filepath)
+            self._add_queried(filepath)
 
         return self._get(filepath)
 
@@ -178,7 +251,7 @@ class FileStatusesBaseDB(object):
         """
         filepath = self._get_filepath(fpath)
         if self._track_queried:
-            self._queried_filepaths.add(filepath)
+            self._add_queried(filepath)
         self._set(filepath, status)
 
     def _set(self, filepath, status):
@@ -200,24 +273,62 @@ class FileStatusesBaseDB(object):
             old_status.filename = basename(fpath)
         return old_status != status
 
+    def is_same_content(self, fpath, status):
+        """Return True if file pointed by fpath is known to have the same content as in status
+
+        It could be known only if both statuses carry checksums (e.g. ETag),
+        so content does not need to be fetched again even if e.g. mtime changed
+        """
+        old_status = self.get(fpath)
+        return isinstance(old_status, ChecksumFileStatus) and \
+            old_status.is_same_content(status)
+
+    def _iter_repo_paths(self):
+        """Yield paths (relative to the top of the repo) of files known to git
+
+        Those are files in the index along with untracked files which are not
+        ignored.  Subdatasets (gitlinks or untracked nested repositories) are
+        not included.
+        """
+        call_git_items_ = self.annex.call_git_items_
+        # with -s, each entry is "<mode> <object> <stage>\t<path>"
+        for entry in call_git_items_(
+                ['ls-files', '-z', '-s', '--cached'], read_only=True, sep='\0'):
+            info, path = entry.split('\t', 1)
+            if info.startswith('160000 '):
+                continue  # subdataset
+            yield path
+        for path in call_git_items_(
+                ['ls-files', '-z', '--others', '--exclude-standard'],
+                read_only=True, sep='\0'):
+            if path.endswith('/'):
+                continue  # untracked nested repository
+            yield path
+
     def get_obsolete(self):
         """Returns full paths for files which weren't queried, thus must have been deleted
 
+        Files are listed from the git index (and untracked but not ignored
+        files), so the working tree does not need to be traversed.
+
         Note that it doesn't track across branches, etc.
         """
         if not self._track_queried:
             raise RuntimeError("Cannot determine which files were removed since track_queried was set to False")
-        obsolete = []
+        queried_paths = self._queried_paths
         # those aren't tracked by annexificator
-        datalad_path = opj(self.annex.path, HANDLE_META_DIR)
-        for fpath in find_files('.*', topdir=self.annex.path):
-            filepath = self._get_filepath(fpath)
-            if filepath.startswith(datalad_path):
+        datalad_prefix = HANDLE_META_DIR + '/'
+        obsolete = []
+        # paths could be repeated (e.g. for unmerged entries)
+        seen = set()
+        for path in self._iter_repo_paths():
+            if path in queried_paths or path.startswith(datalad_prefix) \
+                    or path in seen:
                 continue
-            if fpath not in self._queried_filepaths:
-                obsolete.append(filepath)
+            seen.add(path)
+            obsolete.append(self._get_filepath(path))
         return obsolete
 
     def reset(self):
         """Reset internal state, e.g. about known queried filed paths"""
-        self._queried_filepaths = set()
+        self._queried_paths = set()
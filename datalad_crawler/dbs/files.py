@@ -10,9 +10,12 @@
 
 """
 
+import json
 import os
+import time
 from os.path import exists, lexists, islink, realpath, sep
 
+from datalad import cfg
 from datalad.dochelpers import exc_str
 from datalad.support.status import FileStatus
 from datalad.support.exceptions import CommandError
@@ -21,12 +24,17 @@ from datalad.utils import disable_logger
 from datalad_crawler.consts import CRAWLER_META_STATUSES_DIR
 
 from .base import JsonBaseDB, FileStatusesBaseDB
+from ..support.status import ChecksumFileStatus
 import logging
 lgr = logging.getLogger('datalad.crawler.dbs')
 
 __docformat__ = 'restructuredtext'
 
-__all__ = ['PhysicalFileStatusesDB']
+# files changed this close before the sizes were requested might still be
+# given an earlier ctime, since filesystems use a coarser clock
+_CTIME_MARGIN = 0.05
+
+__all__ = ['PhysicalFileStatusesDB', 'JsonFileStatusesDB', 'JournaledFileStatusesDB']
 
 #
 # Concrete implementations
@@ -42,8 +50,91 @@ class PhysicalFileStatusesDB(FileStatusesBaseDB):
     In general, this should not be used since neither git nor annex stores any files
     meta-information (besides mode and size), so mtime would get lost while switching
     the branches and dropping the load
+
+    With `prefetch`, sizes of all annexed files get requested from annex in a
+    single call upon the first query, instead of a call per each file.  Sizes
+    of the files which get set or removed in the DB (i.e. were added or
+    removed by the crawler), or which got changed otherwise (according to
+    their ctime) since, are requested individually afterwards.
     """
 
+    def __init__(self, annex, track_queried=True, prefetch=None):
+        """
+
+        Parameters
+        ----------
+        annex : AnnexRepo
+          Annex repository which will be consulted on the size and full path
+        track_queried : bool, optional
+          To track what file paths were queried
+        prefetch : bool, optional
+          To request sizes of all annexed files at once.  If None, the
+          `datalad.crawl.statusdb.prefetch` configuration variable is consulted
+        """
+        FileStatusesBaseDB.__init__(self, annex, track_queried=track_queried)
+        if prefetch is None:
+            prefetch = cfg.getbool('datalad.crawl.statusdb', 'prefetch', default=False)
+        self.prefetch = prefetch
+        # relative path -> size, with None for the paths to be requested individually
+        self._annexed_sizes = None
+        self._annexed_sizes_time = None
+
+    def _get_annexed_sizes(self):
+        """Return sizes of all annexed files, requesting them from annex if not yet known"""
+        if self._annexed_sizes is None:
+            lgr.debug("Requesting sizes of all annexed files in %s", self.annex)
+            self._annexed_sizes_time = time.time()
+            sizes = {}
+            for rec in self.annex.call_annex_records(['find', '--include', '*']):
+                try:
+                    size = int(rec['bytesize'])
+                except (KeyError, TypeError, ValueError):
+                    # e.g. for keys without size information
+                    size = None
+                sizes[rec['file']] = size
+            lgr.debug("Received sizes of %d annexed files", len(sizes))
+            self._annexed_sizes = sizes
+        return self._annexed_sizes
+
+    def _invalidate(self, filepath):
+        if self._annexed_sizes is not None:
+            self._annexed_sizes[self._get_relpath(filepath)] = None
+
+    def set(self, fpath, status=None):
+        self._invalidate(self._get_filepath(fpath))
+        super(PhysicalFileStatusesDB, self).set(fpath, status=status)
+
+    def remove(self, fpath):
+        self._invalidate(self._get_filepath(fpath))
+        super(PhysicalFileStatusesDB, self).remove(fpath)
+
+    def reset(self):
+        super(PhysicalFileStatusesDB, self).reset()
+        # content of the repository could have changed since (e.g. after a merge)
+        self._annexed_sizes = None
+
+    def _get_annexed_size(self, filepath, filestat):
+        """Return size of the file as known to annex, or None if it is not annexed"""
+        if self.prefetch:
+            sizes = self._get_annexed_sizes()
+            if filestat.st_ctime < self._annexed_sizes_time - _CTIME_MARGIN:
+                path = self._get_relpath(filepath)
+                if path not in sizes:
+                    return None  # not annexed
+                size = sizes[path]
+                if size is not None:
+                    return size
+            # otherwise size is to be requested individually, since the file
+            # was changed (e.g. added to annex) after sizes were requested
+        try:
+            with disable_logger():
+                info = self.annex.info(filepath, batch=True)
+            return info['size']
+        except (CommandError, TypeError) as exc:
+            # must be under git or a plain file
+            lgr.debug("File %s must be not under annex, since info failed: %s" % (filepath, exc_str(exc)))
+            return None
+
     def _get(self, filepath):
         if not lexists(filepath):
             return None
@@ -52,13 +143,8 @@ class PhysicalFileStatusesDB(FileStatusesBaseDB):
         # be reliable, and also file might not even be here.
         # File might be under git, not annex so then we would need to assess size
         filestat = os.lstat(filepath)
-        try:
-            with disable_logger():
-                info = self.annex.info(filepath, batch=True)
-            size = info['size']
-        except (CommandError, TypeError) as exc:
-            # must be under git or a plain file
-            lgr.debug("File %s must be not under annex, since info failed: %s" % (filepath, exc_str(exc)))
+        size = self._get_annexed_size(filepath, filestat)
+        if size is None:
             size = filestat.st_size
 
         # deduce mtime from the file or a content which it points to. Take the oldest (I wonder
@@ -89,13 +175,18 @@ class PhysicalFileStatusesDB(FileStatusesBaseDB):
 @auto_repr
 class JsonFileStatusesDB(JsonBaseDB, PhysicalFileStatusesDB):
     """Persistent DB to store information about files' size/mtime/filename in a JSON file
+
+    Checksum (e.g. ETag) gets stored as well if status carries it (see
+    ChecksumFileStatus)
     """
 
     __version__ = 1
     __crawler_subdir__ = CRAWLER_META_STATUSES_DIR
 
     def __init__(self, annex, track_queried=True, name=None):
-        PhysicalFileStatusesDB.__init__(self, annex, track_queried=track_queried)
+        # statuses are stored, so annex gets consulted only for the just added files
+        PhysicalFileStatusesDB.__init__(self, annex, track_queried=track_queried,
+                                        prefetch=False)
         JsonBaseDB.__init__(self, annex, name=name)
 
     #
@@ -131,7 +222,8 @@ class JsonFileStatusesDB(JsonBaseDB, PhysicalFileStatusesDB):
         files = self._db['files']
         if fpath not in files:
             return None
-        return FileStatus(**files[fpath])
+        status = files[fpath]
+        return (ChecksumFileStatus if 'checksum' in status else FileStatus)(**status)
 
     # TODO: get URL all the way here?
     def _set(self, filepath, status):
@@ -142,12 +234,104 @@ class JsonFileStatusesDB(JsonBaseDB, PhysicalFileStatusesDB):
             # status = PhysicalFileStatusesDB._get(self, filepath)
             # NOPE since then generated files would keep changing
         else:
-            status_dict = {f: getattr(status, f)
-                           for f in ('size', 'mtime', 'filename')
-                           if getattr(status, f) is not None}
+            status_dict = {f: getattr(status, f, None)
+                           for f in ('size', 'mtime', 'filename', 'checksum')
+                           if getattr(status, f, None) is not None}
         self._db['files'][fpath] = status_dict
+        self._mark_dirty()
 
     def _remove(self, filepath):
         fpath = self._get_fpath(filepath)
         if fpath in self._db['files']:
             self._db['files'].pop(fpath)
+            self._mark_dirty()
+
+
+@auto_repr
+class JournaledFileStatusesDB(JsonFileStatusesDB):
+    """JsonFileStatusesDB which saves changes by appending them to a journal
+
+    Instead of rewriting the whole JSON file upon every save, changes
+    are appended as JSON lines to a journal file stored alongside, so saving
+    (and the diff to be committed) is proportional to the number of changes
+    and not to the number of files.  Journal gets compacted into the JSON
+    file, and emptied, whenever it would grow longer than `compact_every`
+    records.  JSON file on its own remains in the format of JsonFileStatusesDB
+    """
+
+    def __init__(self, annex, track_queried=True, name=None, compact_every=10000):
+        super(JournaledFileStatusesDB, self).__init__(
+            annex, track_queried=track_queried, name=name)
+        self.compact_every = compact_every
+        self._journal = []  # records yet to be saved
+        self._journal_saved = 0  # number of records in the journal file
+
+    @property
+    def _journal_filepath(self):
+        return self._filepath[:-len('.json')] + '.journal'
+
+    def _assure_loaded(self):
+        if self._filepath is not None:
+            return
+        super(JournaledFileStatusesDB, self)._assure_loaded()
+        journal_filepath = self._journal_filepath
+        if lexists(journal_filepath):
+            files = self._db['files']
+            with open(journal_filepath) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    self._replay(files, json.loads(line))
+                    self._journal_saved += 1
+            self._loaded = True
+
+    @staticmethod
+    def _replay(files, record):
+        if 'set' in record:
+            files[record['set']] = record['status']
+        else:
+            files.pop(record['remove'], None)
+
+    def _set(self, filepath, status):
+        super(JournaledFileStatusesDB, self)._set(filepath, status)
+        fpath = self._get_fpath(filepath)
+        self._journal.append({'set': fpath, 'status': self._db['files'][fpath]})
+
+    def _remove(self, filepath):
+        fpath = self._get_fpath(filepath)
+        if fpath in self._db['files']:
+            self._db['files'].pop(fpath)
+            self._mark_dirty()
+            self._journal.append({'remove': fpath})
+
+    def save(self):
+        if self._filepath is None or not self._journal:
+            # nothing to do
+            return
+        journal_filepath = self._journal_filepath
+        if not lexists(self._filepath) or \
+                self._journal_saved + len(self._journal) > self.compact_every:
+            self.compact()
+            return
+        lgr.debug("Appending %d records to %s", len(self._journal), journal_filepath)
+        with open(journal_filepath, 'a') as f:
+            for record in self._journal:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+        self._journal_saved += len(self._journal)
+        self._journal = []
+        self.repo.add(journal_filepath, git=True)
+
+    def compact(self):
+        """Store all statuses into the JSON file and empty the journal"""
+        self._assure_loaded()
+        if self._journal_saved:
+            # records replayed from the journal are not in the JSON file yet
+            self._mark_dirty()
+        JsonFileStatusesDB.save(self)
+        journal_filepath = self._journal_filepath
+        if lexists(journal_filepath) and (self._journal_saved or islink(journal_filepath)):
+            os.unlink(journal_filepath)
+            open(journal_filepath, 'w').close()
+            self.repo.add(journal_filepath, git=True)
+        self._journal_saved = 0
+        self._journal = []
@@ -0,0 +1,142 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Local cache of fetched pages, to be re-validated using conditional requests
+
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+from os.path import join as opj, exists, dirname
+
+from datalad.utils import auto_repr
+from datalad_crawler.consts import CRAWLER_META_PAGES_CACHE_DIR
+
+import logging
+lgr = logging.getLogger('datalad.crawler.dbs')
+
+__docformat__ = 'restructuredtext'
+
+
+@auto_repr
+class PagesCache(object):
+    """Cache of pages content along with their validators (ETag, Last-Modified)
+    and of redirects, stored under `.datalad/crawl/cache/pages` of a dataset
+
+    Each url gets its own JSON file, named after the checksum of the url, so
+    entries could be read and written independently (e.g. from multiple
+    threads).  The cache is not committed -- `.gitignore` is placed at the
+    top of the `.datalad/crawl/cache` to ignore all of its content.
+    """
+
+    __version__ = 1
+
+    def __init__(self, path):
+        """
+
+        Parameters
+        ----------
+        path : str
+          Path to the dataset
+        """
+        self.path = opj(path, CRAWLER_META_PAGES_CACHE_DIR)
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _get_filepath(self, url):
+        checksum = hashlib.md5(url.encode('utf-8')).hexdigest()
+        return opj(self.path, checksum[:2], checksum + '.json')
+
+    def _assure_initialized(self):
+        with self._lock:
+            if self._initialized:
+                return
+            gitignore = opj(dirname(self.path), '.gitignore')
+            if not exists(gitignore):
+                os.makedirs(dirname(gitignore), exist_ok=True)
+                with open(gitignore, 'w') as f:
+                    f.write('*\n')
+            self._initialized = True
+
+    def _load(self, url):
+        filepath = self._get_filepath(url)
+        if not exists(filepath):
+            return None
+        try:
+            with open(filepath) as f:
+                entry = json.load(f)
+        except ValueError as exc:
+            lgr.warning("Failed to load cached entry for %s from %s: %s", url, filepath, exc)
+            return None
+        if entry.get('db_version') != self.__version__ or entry.get('url') != url:
+            return None
+        return entry
+
+    def _save(self, url, fields):
+        """Update fields of the entry for the url, None values removing them"""
+        self._assure_initialized()
+        filepath = self._get_filepath(url)
+        with self._lock:
+            entry = self._load(url) or {}
+            entry.update(fields)
+            entry = {k: v for k, v in entry.items() if v is not None}
+            entry.update(url=url, db_version=self.__version__)
+            os.makedirs(dirname(filepath), exist_ok=True)
+            # unique per thread temporary file, so concurrent writes do not collide
+            temp_filepath = '%s.%d.tmp' % (filepath, threading.get_ident())
+            with open(temp_filepath, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp_filepath, filepath)
+
+    def get(self, url):
+        """Return cached (content, validators) for the url, or None if not cached
+
+        `validators` is a dict with 'etag' and/or 'last-modified' as provided
+        by the server
+        """
+        entry = self._load(url)
+        if entry is None or 'content' not in entry:
+            return None
+        return entry['content'], entry['validators']
+
+    def set(self, url, content, headers):
+        """Cache content of the url if headers provide any validator for it"""
+        validators = {}
+        for header, key in (('ETag', 'etag'), ('Last-Modified', 'last-modified')):
+            value = headers.get(header)
+            if value:
+                validators[key] = value
+        if not validators:
+            lgr.log(5, "No validators for %s, not caching", url)
+            return
+        # url served the content itself, so it is no longer redirected
+        self._save(url, {'content': content, 'validators': validators,
+                         'redirect': None})
+
+    def get_redirect(self, url):
+        """Return url to which url was redirected, or None if not known"""
+        entry = self._load(url)
+        return entry.get('redirect') if entry else None
+
+    def set_redirect(self, url, target):
+        """Record that url is redirected to target, or forget it if target is None"""
+        if self.get_redirect(url) != target:
+            self._save(url, {'redirect': target})
+
+    @staticmethod
+    def get_conditional_headers(validators):
+        """Given validators of the cached page, return headers for a conditional request"""
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last-modified'):
+            headers['If-Modified-Since'] = validators['last-modified']
+        return headers
@@ -8,21 +8,30 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
 import os
+import time
 from os.path import join as opj, curdir, sep
 from os.path import realpath
 from ..files import PhysicalFileStatusesDB, JsonFileStatusesDB
+from ..files import JournaledFileStatusesDB
+from .. import files
 
 from datalad.tests.utils_pytest import with_tree
 from datalad.tests.utils_pytest import assert_equal
 from datalad.tests.utils_pytest import assert_false
 from datalad.tests.utils_pytest import assert_true
 from datalad.tests.utils_pytest import chpwd
+from datalad.tests.utils_pytest import with_tempfile
 from datalad.support.annexrepo import AnnexRepo
+from datalad.support.gitrepo import GitRepo
+from datalad.support.status import FileStatus
+from datalad_crawler.support.status import ChecksumFileStatus
 
 import pytest
+from unittest.mock import patch
 
 
-@pytest.mark.parametrize("cls", [PhysicalFileStatusesDB, JsonFileStatusesDB])
+@pytest.mark.parametrize("cls", [PhysicalFileStatusesDB, JsonFileStatusesDB,
+                                 JournaledFileStatusesDB])
 @with_tree(
     tree={'file1.txt': 'load1',
           '2git': 'load',
@@ -43,7 +52,7 @@ def test_AnnexDB(path=None, *, cls):
 
     def set_db_status_from_file(fpath):
         """To test JsonFileStatusesDB, we need to keep updating the status stored"""
-        if cls is JsonFileStatusesDB:
+        if cls is not PhysicalFileStatusesDB:
             # we need first to set the status
             db.set(fpath, db._get_fileattributes_status(fpath))
 
@@ -130,3 +139,180 @@ def test_AnnexDB(path=None, *, cls):
     # underlying repos do!
     db2.get(opj(realpath(path), '2git'))
     assert_equal(db2.get_obsolete(), [])
+
+
+@with_tempfile(mkdir=True)
+def test_JournaledFileStatusesDB(path=None):
+    repo = GitRepo(path, create=True)
+    db = JournaledFileStatusesDB(annex=repo, compact_every=5)
+    db.set('f0', FileStatus(size=0, mtime=10))
+    db.save()
+    # the first save has nothing to append to, so everything gets compacted
+    assert_true(os.path.exists(db._filepath))
+    assert_false(os.path.lexists(db._journal_filepath))
+
+    def load():
+        db_ = JournaledFileStatusesDB(annex=repo)
+        return {f: db_.get(f) for f in ('f0', 'f1', 'f2', 'f3')}
+
+    with open(db._filepath) as f:
+        snapshot = f.read()
+    db.set('f1', FileStatus(size=1, mtime=11))
+    db.set('f2', FileStatus(size=2, mtime=12, filename='f2'))
+    db.remove('f0')
+    db.save()
+    # only journal has changed
+    with open(db._filepath) as f:
+        assert_equal(f.read(), snapshot)
+    with open(db._journal_filepath) as f:
+        assert_equal(len(f.readlines()), 3)
+    db.save()  # nothing to save
+    with open(db._journal_filepath) as f:
+        assert_equal(len(f.readlines()), 3)
+    target = {
+        'f0': None,
+        'f1': FileStatus(size=1, mtime=11),
+        'f2': FileStatus(size=2, mtime=12, filename='f2'),
+        'f3': None}
+    assert_equal(load(), target)
+
+    # it all gets compacted whenever journal grows too long
+    for i in range(3):
+        db.set('f3', FileStatus(size=3, mtime=13 + i))
+    db.save()
+    with open(db._journal_filepath) as f:
+        assert_equal(f.read(), '')
+    target['f3'] = FileStatus(size=3, mtime=15)
+    assert_equal(load(), target)
+    # and it is the same as JsonFileStatusesDB would store
+    json_db = JsonFileStatusesDB(annex=repo)
+    assert_equal(json_db.get('f2'), target['f2'])
+
+    # records which were only replayed from the journal get compacted as well
+    db.set('f1', FileStatus(size=1, mtime=21))
+    db.save()
+    with open(db._journal_filepath) as f:
+        assert_equal(len(f.readlines()), 1)
+    JournaledFileStatusesDB(annex=repo).compact()
+    with open(db._journal_filepath) as f:
+        assert_equal(f.read(), '')
+    target['f1'] = FileStatus(size=1, mtime=21)
+    assert_equal(load(), target)
+
+
+@with_tempfile(mkdir=True)
+def test_JsonFileStatusesDB_checksum(path=None):
+    repo = GitRepo(path, create=True)
+    db = JsonFileStatusesDB(annex=repo)
+    db.set('f1', ChecksumFileStatus(size=1, mtime=10, checksum='etag:abc'))
+    db.set('f2', FileStatus(size=2, mtime=10))
+    db.save()
+
+    db = JsonFileStatusesDB(annex=repo)
+    status = db.get('f1')
+    assert_true(isinstance(status, ChecksumFileStatus))
+    assert_equal(status.checksum, 'etag:abc')
+    assert_false(isinstance(db.get('f2'), ChecksumFileStatus))
+
+    # content re-uploaded
+    reuploaded = ChecksumFileStatus(size=1, mtime=20, checksum='etag:abc')
+    assert_true(db.is_different('f1', reuploaded))
+    assert_true(db.is_same_content('f1', reuploaded))
+    # content changed while size and mtime remained the same
+    changed = ChecksumFileStatus(size=1, mtime=10, checksum='etag:def')
+    assert_true(db.is_different('f1', changed))
+    assert_false(db.is_same_content('f1', changed))
+    # no checksum known for the file
+    assert_false(db.is_same_content(
+        'f2', ChecksumFileStatus(size=2, mtime=20, checksum='etag:abc')))
+
+
+@with_tree(
+    tree={'file1.txt': 'load1',
+          'with space.txt': 'load',
+          'untracked.txt': 'load',
+          'ignored.txt': 'load',
+          '.gitignore': 'ignored.txt\n',
+          'd': {'file2.txt': 'load2'},
+          'sub': {'file3.txt': 'load3'}})
+def test_get_obsolete(path=None):
+    repo = GitRepo(path, create=True)
+    GitRepo(opj(path, 'sub'), create=True)
+    repo.add(['file1.txt', 'with space.txt', '.gitignore', opj('d', 'file2.txt')])
+    repo.commit("initial commit")
+    os.makedirs(opj(path, '.datalad', 'crawl'))
+    with open(opj(path, '.datalad', 'crawl', 'crawl.cfg'), 'w') as f:
+        f.write('')
+
+    db = JsonFileStatusesDB(annex=repo)
+    topdir = repo.path
+    # neither ignored files, nor subdatasets or .datalad/ content are listed
+    assert_equal(
+        set(db.get_obsolete()),
+        {opj(topdir, p) for p in ['file1.txt', 'with space.txt', '.gitignore',
+                                  'untracked.txt', opj('d', 'file2.txt')]})
+    db.set('file1.txt', FileStatus(size=5, mtime=10))
+    db.get(opj(topdir, 'd', 'file2.txt'))
+    db.get(curdir + sep + 'with space.txt')
+    db.get('.gitignore')
+    assert_equal(db.get_obsolete(), [opj(topdir, 'untracked.txt')])
+    assert_equal(
+        db.queried_filepaths,
+        {opj(topdir, p) for p in ['file1.txt', 'with space.txt', '.gitignore',
+                                  opj('d', 'file2.txt')]})
+    db.reset()
+    assert_equal(len(db.get_obsolete()), 5)
+
+
+@with_tree(
+    tree={'annexed.dat': 'load1',
+          'd': {'annexed2.dat': 'load22'},
+          'ingit.txt': 'git'})
+def test_PhysicalFileStatusesDB_prefetch(path=None):
+    repo = GitRepo(path, create=True)
+    # sizes as annex would report, to see that they are the ones used
+    records = [{'file': 'annexed.dat', 'bytesize': '100'},
+               {'file': 'd/annexed2.dat', 'bytesize': '200'}]
+    # files were just created, but before the sizes get requested
+    with patch.object(files, '_CTIME_MARGIN', 0), \
+            patch.object(repo, 'call_annex_records', create=True,
+                         return_value=records) as call_annex_records, \
+            patch.object(repo, 'info', create=True,
+                         return_value={'size': 300}) as info:
+        db = PhysicalFileStatusesDB(annex=repo, prefetch=True)
+        assert_equal(db.get('annexed.dat').size, 100)
+        assert_equal(db.get(opj(repo.path, 'd', 'annexed2.dat')).size, 200)
+        # not known to annex
+        assert_equal(db.get('ingit.txt').size, 3)
+        assert_equal(call_annex_records.call_count, 1)
+        assert_false(info.called)
+        # whenever file gets (re)added, its size gets requested individually
+        db.set('annexed.dat')
+        assert_equal(db.get('annexed.dat').size, 300)
+        assert_equal(db.get(opj('d', 'annexed2.dat')).size, 200)
+        assert_equal(call_annex_records.call_count, 1)
+        # all get requested again after reset
+        db.reset()
+        assert_equal(db.get('annexed.dat').size, 100)
+        assert_equal(call_annex_records.call_count, 2)
+
+        # files changed since then without going through the DB
+        # (e.g. added to annex by another node) are requested individually
+        info.reset_mock()
+        time.sleep(0.1)  # filesystems might use a coarser clock
+        for f in ('d/annexed2.dat', 'ingit.txt'):
+            os.unlink(opj(path, f))
+            with open(opj(path, f), 'w') as fh:
+                fh.write('changed')
+        assert_equal(db.get(opj('d', 'annexed2.dat')).size, 300)
+        assert_equal(db.get('ingit.txt').size, 300)
+        assert_equal(info.call_count, 2)
+        assert_equal(db.get('annexed.dat').size, 100)
+        assert_equal(call_annex_records.call_count, 2)
+
+        # without prefetch, annex gets asked about each file
+        info.reset_mock()
+        db = PhysicalFileStatusesDB(annex=repo, prefetch=False)
+        assert_equal(db.get('annexed.dat').size, 300)
+        assert_equal(info.call_count, 1)
+        assert_equal(call_annex_records.call_count, 2)
@@ -0,0 +1,43 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+from datalad.tests.utils_pytest import assert_equal
+from datalad.tests.utils_pytest import assert_is_none
+from datalad.tests.utils_pytest import with_tempfile
+
+from ..pages import PagesCache
+
+
+@with_tempfile(mkdir=True)
+def test_PagesCache(path=None):
+    cache = PagesCache(path)
+    url = 'http://example.com/a'
+    assert_is_none(cache.get(url))
+    assert_is_none(cache.get_redirect(url))
+    # nothing to re-validate against, so not cached
+    cache.set(url, 'content', {})
+    assert_is_none(cache.get(url))
+
+    cache.set(url, 'content', {'ETag': '"123"'})
+    cache.set_redirect(url, 'http://example.com/b')
+    # redirect and content are stored in the same entry without wiping each other
+    assert_equal(cache.get(url), ('content', {'etag': '"123"'}))
+    assert_equal(cache.get_redirect(url), 'http://example.com/b')
+    assert_equal(PagesCache(path).get_redirect(url), 'http://example.com/b')
+
+    cache.set_redirect(url, None)
+    assert_is_none(cache.get_redirect(url))
+    assert_equal(cache.get(url), ('content', {'etag': '"123"'}))
+
+    # content served by the url itself means that it is no longer redirected
+    cache.set_redirect(url, 'http://example.com/b')
+    cache.set(url, 'new', {'Last-Modified': 'today'})
+    assert_is_none(cache.get_redirect(url))
+    assert_equal(cache.get(url), ('new', {'last-modified': 'today'}))
+    assert_equal(cache.get('http://example.com/b'), None)
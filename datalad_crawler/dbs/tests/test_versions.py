@@ -0,0 +1,58 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+from os.path import lexists
+from unittest.mock import patch
+
+from ..versions import SingleVersionDB
+
+from datalad.support.gitrepo import GitRepo
+from datalad.tests.utils_pytest import assert_equal
+from datalad.tests.utils_pytest import assert_false
+from datalad.tests.utils_pytest import assert_true
+from datalad.tests.utils_pytest import with_tempfile
+
+
+@with_tempfile(mkdir=True)
+def test_SingleVersionDB_saves(path=None):
+    repo = GitRepo(path, create=True)
+
+    def count_adds(db, func):
+        with patch.object(repo, 'add', wraps=repo.add) as add:
+            func(db)
+        return add.call_count
+
+    def set_versions(db, n=10):
+        for i in range(n):
+            db.version = {'name': 'f%d' % i}
+
+    # by default -- saved upon every change
+    db = SingleVersionDB(repo)
+    assert_equal(count_adds(db, set_versions), 10)
+    assert_false(db.dirty)
+    # nothing changed -- nothing to save
+    assert_equal(count_adds(db, lambda db: db.save()), 0)
+    assert_false(lexists(db._filepath + '.tmp'))
+
+    db = SingleVersionDB(repo, save_every=4)
+    assert_equal(count_adds(db, set_versions), 2)
+    assert_true(db.dirty)
+    assert_equal(SingleVersionDB(repo).version, {'name': 'f7'})
+    assert_equal(count_adds(db, lambda db: db.save()), 1)
+    assert_equal(SingleVersionDB(repo).version, {'name': 'f9'})
+
+    # only explicit saves
+    db = SingleVersionDB(repo, save_every=None)
+    assert_equal(count_adds(db, set_versions), 0)
+    db.save()
+    assert_equal(SingleVersionDB(repo).version, {'name': 'f9'})
+
+    # or saving whenever enough time has passed
+    db = SingleVersionDB(repo, save_every=None, save_interval=0)
+    assert_equal(count_adds(db, set_versions), 10)
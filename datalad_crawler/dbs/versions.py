@@ -28,8 +28,9 @@ class SingleVersionDB(JsonBaseDB):
     """
     Simple helper to store/retrieve information about the last scraped version
 
-    Since we do not expect many changes being done to this DB, it also
-    saves its state into the file upon any change
+    Since we do not expect many changes being done to this DB, by default it
+    also saves its state into the file upon any change.  Use `save_every` and
+    `save_interval` to save less often, and `save()` explicitly at checkpoints
     """
     __version__ = 1
     __crawler_subdir__ = CRAWLER_META_VERSIONS_DIR
@@ -68,7 +69,7 @@ class SingleVersionDB(JsonBaseDB):
     @version.setter
     def version(self, v):
         self._db['version'] = v
-        self.save()
+        self._changed()
 
     @property
     def versions(self):
@@ -96,4 +97,4 @@ class SingleVersionDB(JsonBaseDB):
                     raise NotImplementedError("conflict resolutions for when new item added for the same entry")
                 else:
                     fpaths[new_fpath] = entry
-        self.save()
+        self._changed()
@@ -11,8 +11,16 @@
 via Annexificator class, which could be used to add files, checkout branches, etc
 """
 
+import heapq
+import itertools
 import os
+import random
 import re
+import time
+
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 from os import listdir
 from os.path import join as opj, exists, isabs, lexists, curdir, realpath, isdir
@@ -21,7 +29,6 @@ from os.path import isdir
 from os.path import relpath
 from os import unlink
 from humanize import naturalsize
-from looseversion import LooseVersion
 
 from datalad import __version__
 from datalad.api import add_archive_content
@@ -30,7 +37,6 @@ from datalad.utils import rmtree, updated
 from datalad.utils import lmtime
 from datalad.utils import find_files
 from datalad.utils import auto_repr
-from datalad.utils import try_multiple
 from datalad.utils import ensure_list
 
 from datalad.downloaders.providers import Providers
@@ -49,10 +55,26 @@ from datalad.support.network import get_url_disposition_filename
 from datalad import cfg
 
 from datalad_crawler.pipeline import initiate_pipeline_config
+from datalad_crawler.pipeline import xrun_pipeline
+from datalad_crawler.pipeline import PIPELINE_TYPES
 from datalad_crawler.dbs.files import PhysicalFileStatusesDB
 from datalad_crawler.dbs.files import JsonFileStatusesDB
+from datalad_crawler.dbs.files import JournaledFileStatusesDB
 from datalad_crawler.dbs.versions import SingleVersionDB
 from datalad_crawler.support.versions import get_versions
+from datalad_crawler.support.versions import get_version_key
+from datalad_crawler.support.providers import ThreadProviders
+from datalad_crawler.support.ratecontrol import throttled_call
+from datalad_crawler.support.status import ChecksumFileStatus
+from datalad_crawler.support.status import get_checksum
+from datalad_crawler.support.gitindex import (
+    NULL_MODE,
+    NULL_SHA,
+    TemporaryIndex,
+    commit_tree,
+    get_staged_entries,
+    hash_file,
+)
 from datalad.customremotes.base import init_datalad_remote
 from datalad.dochelpers import exc_str
 
@@ -61,6 +83,17 @@ from logging import getLogger
 
 lgr = getLogger('datalad.crawl.annex')
 
+# A download scheduled by the concurrent download engine of the Annexificator
+_Download = namedtuple(
+    '_Download',
+    ['future', 'url', 'fpath', 'filepath', 'url_status', 'stats', 'data'])
+
+# An addurl which failed and is to be retried later. `attempt` is the number
+# of the attempt to be done next, starting from 1 for the first retry
+_Retry = namedtuple(
+    '_Retry',
+    ['url', 'fpath', 'filepath', 'options', 'url_status', 'stats', 'data', 'attempt'])
+
 
 # TODO: make use of datalad_stats
 @auto_repr
@@ -238,6 +271,10 @@ class Annexificator(object):
                  skip_problematic=False,
                  largefiles=None,
                  batch_add=True,
+                 batch_status=False,
+                 jobs=None,
+                 retries=None,
+                 retry_delay=None,
                  **kwargs):
         """
 
@@ -260,11 +297,13 @@ class Annexificator(object):
           In some cases, if e.g. adding a file in place of an existing directory or placing
           a file under a directory for which there is a file atm, we would 'finalize' before
           carrying out the operation
-        statusdb : {'json', 'fileattr'}, optional
+        statusdb : {'json', 'journal', 'fileattr'}, optional
           DB of file statuses which will be used to figure out if remote load has changed.
           If None, no statusdb will be used so Annexificator will process every given URL
           as if it leads to new content.  'json' -- JsonFileStatusesDB will
           be used which will store information about each provided file/url into a JSON file.
+          'journal' -- JournaledFileStatusesDB will be used which stores the same information
+          but saves only changes, by appending them to a journal file, until it gets compacted.
           'fileattr' -- PhysicalFileStatusesDB will be used to decide based on information in
           annex and file(s) mtime on the disk.
           Note that statusdb "lives" within the branch, so switch_branch would drop existing DB (which
@@ -279,6 +318,43 @@ class Annexificator(object):
         batch_add: bool, optional
 		  To be able to disable batched add invocation e.g. for the cases when it is 
 		  desired to manipulate that file right away (e.g. to drop)
+        batch_status: bool, optional
+          If True, do not run `git status` after adding every file to figure
+          out if it was changed.  Added paths are recorded instead and their
+          status is determined with a single `git status` call upon
+          `_precommit` (e.g. within `finalize`).  Note that `add_git`,
+          `add_annex` and `skipped` stats then get incremented only at that
+          point
+        jobs: int, optional
+          Number of concurrent downloads in 'full' mode.  If more than 1,
+          content gets downloaded by a pool of threads using datalad
+          downloaders, then added to annex in bulk, and urls are registered for
+          annexed files.  Data for a file is yielded only after its download
+          completes, and in the order of submission, so it might be yielded
+          while processing subsequent input.  To get data yielded for the
+          downloads still in progress when input is exhausted, pipeline
+          producing the input should be ran via `drain`.  Otherwise they are
+          completed upon `finalize` without their data being yielded further.
+          If None, 'datalad.crawl.annex.jobs' configuration (default 1) is
+          used
+        retries: int, optional
+          How many times to retry adding a url to annex if it fails.  Each
+          retry is delayed exponentially (with some random jitter) --
+          `retry_delay`, twice longer, etc.  If the Annexificator is ran via
+          `drain`, failed urls are not retried right away but put aside, so
+          other files get processed meanwhile.  Data for a file is then
+          yielded only after a retry succeeds, so it might be yielded while
+          processing subsequent input, and retries still pending when input
+          is exhausted are waited for by `drain`.  Otherwise retries are done
+          in place, before proceeding to the next file.
+          Files which failed all the attempts are skipped (and counted as
+          such in stats) if `skip_problematic`, or the exception is raised
+          (by `drain` only after all other files were processed).
+          If None, 'datalad.crawl.annex.retries' configuration (default 5) is
+          used
+        retry_delay: float, optional
+          Delay (in seconds) before the first retry.  If None,
+          'datalad.crawl.annex.retry_delay' configuration (default 3) is used
         **kwargs : dict, optional
           to be passed into AnnexRepo
         """
@@ -328,6 +404,34 @@ class Annexificator(object):
         self._providers = Providers.from_config_files()
         self.yield_non_updated = yield_non_updated
         self.batch_add = batch_add
+        self.batch_status = batch_status
+        # (fpath, added_to_annex, stats) for paths with status yet to be checked
+        self._pending_status = []
+        if jobs is None:
+            jobs = cfg.obtain('datalad.crawl.annex.jobs', default=1)
+        self.jobs = int(jobs)
+        self._executor = None
+        # providers of the threads downloading content
+        self._thread_providers = ThreadProviders()
+        # downloads in progress, used only by the concurrent download engine
+        self._downloads = deque() \
+            if (mode == 'full' and self.jobs > 1 and not no_annex) else None
+        if retries is None:
+            retries = cfg.obtain('datalad.crawl.annex.retries', default=5)
+        self.retries = int(retries)
+        if retry_delay is None:
+            retry_delay = cfg.obtain('datalad.crawl.annex.retry_delay', default=3)
+        self.retry_delay = float(retry_delay)
+        # heap of (when, counter, _Retry) for failed addurls to be retried
+        self._retries = []
+        self._retries_counter = itertools.count()
+        # exceptions of retries which failed for good, to be raised by _flush
+        self._failed_retries = []
+        # number of drain()s the Annexificator is ran within
+        self._draining = 0
+        # number and total size of files which content was not fetched again
+        # since only their metadata changed
+        self._metadata_only = [0, 0]
 
         if largefiles:
             repo_largefiles = self.repo.get_git_attributes().get('annex.largefiles', None)
@@ -386,11 +490,15 @@ class Annexificator(object):
             return data['url_status']
         else:
             downloader = self._providers.get_provider(url).get_downloader(url)
-            return downloader.get_status(url)
+            return throttled_call(url, downloader.get_status, url)
 
     def __call__(self, data):  # filename=None, get_disposition_filename=False):
         # some checks
         assert (self.mode is not None)
+        if self._retries:
+            # give failed addurls, which are due by now, another chance
+            for d in self._process_retries():
+                yield d
         stats = data.get('datalad_stats', ActivityStats())
 
         url = data.get('url')
@@ -411,6 +519,11 @@ class Annexificator(object):
             if fpath is None:
                 # pick it from url_status and give for "reprocessing"
                 fpath = self._get_fpath(data, stats, filename=url_status.filename)
+            if data.get('checksum') and url_status is not None \
+                    and not getattr(url_status, 'checksum', None):
+                # e.g. provided by parse_checksums
+                url_status = ChecksumFileStatus.from_status(
+                    url_status, get_checksum(data['checksum'], data.get('digest') or ''))
 
         if not fpath:
             if self.skip_problematic:
@@ -432,6 +545,7 @@ class Annexificator(object):
                 # initiate the DB
                 self._statusdb = {
                     'json': JsonFileStatusesDB,
+                    'journal': JournaledFileStatusesDB,
                     'fileattr': PhysicalFileStatusesDB}[self.statusdb](annex=self.repo)
             else:
                 # use provided persistent instance
@@ -464,6 +578,15 @@ class Annexificator(object):
                     if self.yield_non_updated:
                         yield updated_data  # there might be more to it!
                     return
+                if statusdb is not None and statusdb.is_same_content(fpath, url_status):
+                    lgr.debug("Skipping download. URL %s provides the same content for %s, "
+                              "only updating its metadata.  New status: %s",
+                              url, filepath, url_status)
+                    self._update_metadata(fpath, filepath, url, url_status)
+                    stats.skipped += 1
+                    if self.yield_non_updated:
+                        yield updated_data
+                    return
         else:
             # just to mark file as still of interest to us so it doesn't get wiped out later
             # as it should have happened if we removed creation/tracking of that file intentionally
@@ -500,6 +623,14 @@ class Annexificator(object):
             # TODO: http://git-annex.branchable.com/todo/make_addurl_respect_annex.largefiles_option/#comment-b43ef555564cc78c6dee2092f7eb9bac
             # we should make use of   matchexpression   command, but that might reincarnated
             # above code so just left it commented out for now
+            if self._downloads and any(d.fpath == fpath for d in self._downloads):
+                # the same file is still being downloaded -- finish that first
+                for d in self._complete_downloads(wait_all=True):
+                    yield d
+            if self._retries and any(r.fpath == fpath for _, _, r in self._retries):
+                # the same file is still to be retried -- finish that first
+                for d in self._process_retries(wait_all=True):
+                    yield d
             annex_options = self.options
             if self.mode == 'full':
                 lgr.debug("Downloading %s into %s and adding to annex" % (url, filepath))
@@ -523,44 +654,199 @@ class Annexificator(object):
             if self.mode == 'full' and url_status and url_status.size:  # > 1024**2:
                 lgr.info("Need to download %s from %s. No progress indication will be reported"
                          % (naturalsize(url_status.size), url))
+            if self._downloads is not None:
+                # concurrent download engine: data gets yielded whenever download completes
+                for d in self._submit_download(url, fpath, filepath, url_status, stats, updated_data):
+                    yield d
+                return
             try:
-                out_json = try_multiple(
-                    6, AnnexBatchCommandError, 3,  # up to 3**5=243 sec sleep
-                    self.repo.add_url_to_file,
-                    fpath, url,
-                    options=annex_options, batch=self.batch_add)
+                out_json = self.repo.add_url_to_file(
+                    fpath, url, options=annex_options, batch=self.batch_add)
             except AnnexBatchCommandError as exc:
-                if self.skip_problematic:
-                    lgr.warning("Skipping %s due to %s", url, exc_str(exc))
-                    return
-                else:
-                    raise
-            added_to_annex = 'key' in out_json
-
-            if self.mode == 'full' or not added_to_annex:
-                # we need to adjust our download stats since addurl doesn't do that and we do
-                # not use our downloaders here
-                stats.increment('downloaded')
-                stats.increment('downloaded_size', os.stat(filepath).st_size)
+                self._schedule_retry(
+                    _Retry(url, fpath, filepath, annex_options, url_status,
+                           stats, updated_data, 1),
+                    exc)
+                if not self._draining:
+                    # data could not be yielded later, so retry in place
+                    for d in self._process_retries(wait_all=True):
+                        yield d
+                    self._raise_failed_retries()
+                return
+            self._increment_addurl_stats(filepath, out_json, stats)
 
-        # file might have been added but really not changed anything (e.g. the same README was generated)
         # TODO:
         # if out_json:  # if not try -- should be here!
-        # File might have been not modified at all, so let's check its status first
-        changed = set().union(*self._get_status(args=[fpath]))
-        if fpath in changed:
-            stats.increment(
-                  'add_annex'
-                    if ('key' in out_json and out_json['key'] is not None)
-                    else 'add_git'
-            )
+        added_to_annex = 'key' in out_json and out_json['key'] is not None
+        self._post_add(fpath, filepath, url_status, added_to_annex, stats)
+
+        # WiP: commented out to do testing before merge
+        # db_filename = self.db.get_filename(url)
+        # if filename is not None and filename != db_filename:
+        #     # need to download new
+        #     self.repo.add_urls
+        #     # remove old
+        #     self.repo.remove([db_filename])
+        #     self.db.set_filename(url, filename)
+        # # figure out if we need to download it
+        # #if self.mode in ('relaxed', 'fast'):
+        # git annex addurl --pathdepth=-1 --backend=SHA256E '-c' 'annex.alwayscommit=false' URL
+        # with subsequent "drop" leaves no record that it ever was here
+        yield updated_data  # There might be more to it!
+
+    def _update_metadata(self, fpath, filepath, url, url_status):
+        """Record new status (and url) of the file which content has not changed"""
+        if isinstance(self.repo, AnnexRepo) and \
+                self.repo.is_under_annex([fpath], batch=True)[0]:
+            # content is the same, so the url could serve it as well
+            self.repo.add_url_to_file(
+                fpath, url, options=['--relaxed'], batch=self.batch_add)
+        if url_status.mtime:
+            lmtime(filepath, url_status.mtime)
+        self._statusdb.set(filepath, url_status)
+        self._metadata_only[0] += 1
+        self._metadata_only[1] += url_status.size or 0
+
+    def _increment_addurl_stats(self, filepath, out_json, stats):
+        added_to_annex = 'key' in out_json
+        if self.mode == 'full' or not added_to_annex:
+            # we need to adjust our download stats since addurl doesn't do that and we do
+            # not use our downloaders here
+            stats.increment('downloaded')
+            stats.increment('downloaded_size', os.stat(filepath).st_size)
+
+    def _schedule_retry(self, retry, exc):
+        """Schedule failed addurl to be retried later, or give up on it
+
+        If there is no attempts left, exception is recorded to be raised by
+        `_raise_failed_retries`, unless `skip_problematic`
+        """
+        if retry.attempt > self.retries:
+            if self.skip_problematic:
+                lgr.warning("Skipping %s after %d attempt(s) due to %s",
+                            retry.url, retry.attempt, exc_str(exc))
+                retry.stats.increment('skipped')
+                return
+            lgr.error("Failed to add %s to %s after %d attempt(s) due to %s",
+                      retry.url, retry.filepath, retry.attempt, exc_str(exc))
+            self._failed_retries.append(exc)
+            return
+        # exponential backoff with jitter, so retries for urls which failed
+        # together (e.g. due to a hiccup of the server) get spread out
+        delay = self.retry_delay * 2 ** (retry.attempt - 1) * random.uniform(0.5, 1.5)
+        lgr.debug("Failed to add %s (%s), will retry in %.1f sec",
+                  retry.url, exc_str(exc), delay)
+        heapq.heappush(
+            self._retries,
+            (time.monotonic() + delay, next(self._retries_counter), retry))
+
+    def _process_retries(self, wait_all=False):
+        """Retry failed addurls and yield data for those which succeeded
+
+        Only retries which are already due are done, unless `wait_all`, in
+        which case it waits until all of them either succeed or fail for good
+        """
+        retries = self._retries
+        while retries:
+            delay = retries[0][0] - time.monotonic()
+            if delay > 0:
+                if not wait_all:
+                    return
+                time.sleep(delay)
+            _, _, retry = heapq.heappop(retries)
+            lgr.debug("Retrying (attempt %d) to add %s", retry.attempt, retry.url)
+            try:
+                out_json = self.repo.add_url_to_file(
+                    retry.fpath, retry.url, options=retry.options, batch=self.batch_add)
+            except AnnexBatchCommandError as exc:
+                self._schedule_retry(retry._replace(attempt=retry.attempt + 1), exc)
+                continue
+            self._increment_addurl_stats(retry.filepath, out_json, retry.stats)
+            added_to_annex = 'key' in out_json and out_json['key'] is not None
+            self._post_add(retry.fpath, retry.filepath, retry.url_status,
+                           added_to_annex, retry.stats)
+            yield retry.data
+
+    def _raise_failed_retries(self):
+        """Raise exception of the first addurl which failed all the retries"""
+        if self._failed_retries:
+            exc = self._failed_retries[0]
+            self._failed_retries = []
+            raise exc
+
+    def _download(self, url, filepath):
+        # ran in a thread of the pool, so uses its own providers
+        providers = self._thread_providers.get() or self._providers
+        downloader = providers.get_provider(url).get_downloader(url)
+        return downloader.download(url, path=filepath, overwrite=True)
+
+    def _submit_download(self, url, fpath, filepath, url_status, stats, data):
+        """Schedule download, and yield data for completed downloads (if any)"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.jobs, thread_name_prefix='crawl-download',
+                initializer=self._thread_providers.init_thread)
+        lgr.debug("Scheduling download of %s into %s", url, filepath)
+        self._downloads.append(_Download(
+            self._executor.submit(self._download, url, filepath),
+            url, fpath, filepath, url_status, stats, data))
+        for d in self._complete_downloads():
+            yield d
+
+    def _complete_downloads(self, wait_all=False):
+        """Add completed downloads to annex and yield their data in order of submission
+
+        Only leading already completed downloads are processed unless there are
+        more than `jobs` downloads in flight or `wait_all`
+        """
+        downloads = self._downloads
+        completed = []
+        while downloads and (wait_all or len(downloads) > self.jobs
+                             or downloads[0].future.done()):
+            download = downloads.popleft()
+            try:
+                download.future.result()
+            except Exception as exc:
+                if self.skip_problematic:
+                    lgr.warning("Skipping %s due to %s", download.url, exc_str(exc))
+                    continue
+                raise
+            completed.append(download)
+        if not completed:
+            return
+
+        # add all of them at once so annex.largefiles gets respected
+        out = self.repo.add([d.fpath for d in completed], options=self.options)
+        keys = {r['file']: r.get('key') for r in out if 'file' in r}
+        for d in completed:
+            added_to_annex = keys.get(d.fpath) is not None
+            if added_to_annex:
+                # content is already in annex, so we just need to record the url
+                self.repo.add_url_to_file(
+                    d.fpath, d.url, options=['--relaxed'], batch=self.batch_add)
+            d.stats.increment('downloaded')
+            d.stats.increment('downloaded_size', os.stat(d.filepath).st_size)
+            self._post_add(d.fpath, d.filepath, d.url_status, added_to_annex, d.stats)
+            yield d.data
+
+    def _post_add(self, fpath, filepath, url_status, added_to_annex, stats):
+        """Account for a file which was just added to git/annex
+
+        Stats get incremented, mtime of the file gets set and statusdb updated
+        """
+        # file might have been added but really not changed anything (e.g. the same README was generated)
+        # so let's check its status first
+        if self.batch_status:
+            self._pending_status.append((fpath, added_to_annex, stats))
         else:
-            stats.increment('skipped')
+            changed = set().union(*self._get_status(args=[fpath]))
+            self._increment_add_stats(stats, fpath in changed, added_to_annex)
 
         # TODO!!:  sanity check that no large files are added to git directly!
 
         # so we have downloaded the beast
         # since annex doesn't care to set mtime for the symlink itself, we better set it ourselves
+        statusdb = self._statusdb
         if lexists(filepath):  # and islink(filepath):
             if url_status:
                 # set mtime of the symlink or git-added file itself
@@ -579,19 +865,26 @@ class Annexificator(object):
 
         self._states.add("Updated git/annex from a remote location")
 
-        # WiP: commented out to do testing before merge
-        # db_filename = self.db.get_filename(url)
-        # if filename is not None and filename != db_filename:
-        #     # need to download new
-        #     self.repo.add_urls
-        #     # remove old
-        #     self.repo.remove([db_filename])
-        #     self.db.set_filename(url, filename)
-        # # figure out if we need to download it
-        # #if self.mode in ('relaxed', 'fast'):
-        # git annex addurl --pathdepth=-1 --backend=SHA256E '-c' 'annex.alwayscommit=false' URL
-        # with subsequent "drop" leaves no record that it ever was here
-        yield updated_data  # There might be more to it!
+    @staticmethod
+    def _increment_add_stats(stats, changed, added_to_annex):
+        if changed:
+            stats.increment('add_annex' if added_to_annex else 'add_git')
+        else:
+            stats.increment('skipped')
+
+    def _flush_pending_status(self):
+        """Figure out with a single `git status` which of the added paths changed
+
+        and increment stats accordingly (see `batch_status`)
+        """
+        if not self._pending_status:
+            return
+        pending, self._pending_status = self._pending_status, []
+        fpaths = sorted(set(p[0] for p in pending))
+        lgr.debug("Checking status of %d added files", len(fpaths))
+        changed = set().union(*self._get_status(files=fpaths))
+        for fpath, added_to_annex, stats in pending:
+            self._increment_add_stats(stats, fpath in changed, added_to_annex)
 
     def _check_no_staged_changes_under_dir(self, dirpath, stats=None):
         """Helper to verify that we can "safely" remove a directory
@@ -855,8 +1148,67 @@ class Annexificator(object):
 
         return merge_branch
 
+    def _flush(self):
+        """Complete all downloads and retries, yielding their data"""
+        while self._downloads or self._retries:
+            if self._downloads:
+                for d in self._complete_downloads(wait_all=True):
+                    yield d
+            if self._retries:
+                for d in self._process_retries(wait_all=True):
+                    yield d
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._raise_failed_retries()
+
+    def drain(self, pipeline):
+        """Run the pipeline (or a node) and then yield data still held by the Annexificator
+
+        With concurrent downloads (see `jobs`) or deferred `retries`, data
+        for a file gets yielded only while processing subsequent input.
+        Since a node is not informed that its input is exhausted, this node
+        should wrap the part of the pipeline ending with this Annexificator,
+        e.g. `annex.drain([crawl_url(url), a_href_match('.*'), annex])`, so
+        data of all the files gets yielded to the nodes which follow.
+        Pipeline is ran with `output='outputs'` unless it specifies its own
+        options.  Failed addurls are retried only after the pipeline is
+        done, instead of in place (see `retries`).
+        """
+        if isinstance(pipeline, PIPELINE_TYPES) and \
+                not (pipeline and isinstance(pipeline[0], dict)):
+            pipeline = [{'output': 'outputs'}] + list(pipeline)
+
+        def _drain(data):
+            if isinstance(pipeline, PIPELINE_TYPES):
+                gen = xrun_pipeline(pipeline, data, reset=False)
+            else:
+                gen = pipeline(data)
+            self._draining += 1
+            try:
+                for data_out in gen:
+                    yield data_out
+            finally:
+                self._draining -= 1
+            for data_out in self._flush():
+                yield data_out
+
+        return _drain
+
     def _precommit(self):
+        if self._downloads or self._retries or self._failed_retries:
+            # there is no downstream to yield data to, so just finish them up
+            nlost = sum(1 for _ in self._flush())
+            if nlost:
+                lgr.warning(
+                    "Data for %d files, which were still downloaded or retried, was "
+                    "not passed further along the pipeline.  Run the pipeline "
+                    "feeding the Annexificator via its drain()", nlost)
+        elif self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
         self.repo.precommit()  # so that all batched annexes stop
+        self._flush_pending_status()
         if self._statusdb:
             self._statusdb.save()
         # there is something to commit and backends was set but no .gitattributes yet
@@ -869,17 +1221,21 @@ class Annexificator(object):
                 self.repo.set_default_backend(backends[0], commit=False)
 
     # at least use repo._git_custom_command
-    def _commit(self, msg=None, options=[]):
-        # we need a custom commit due to "fancy" merges and GitPython
-        # not supporting that ATM
-        # https://github.com/gitpython-developers/GitPython/issues/361
-        # and apparently not actively developed
+    @staticmethod
+    def _get_commit_msg(msg):
         msg = str(msg).strip()
         if not msg:
             # we need to provide some commit msg, could may be deduced from current status
             # TODO
             msg = "a commit"
-        msg = GitRepo._get_prefixed_commit_msg(msg)
+        return GitRepo._get_prefixed_commit_msg(msg)
+
+    def _commit(self, msg=None, options=[]):
+        # we need a custom commit due to "fancy" merges and GitPython
+        # not supporting that ATM
+        # https://github.com/gitpython-developers/GitPython/issues/361
+        # and apparently not actively developed
+        msg = self._get_commit_msg(msg)
         if msg is not None:
             options = options + ["-m", msg]
         self._precommit()  # so that all batched annexes stop
@@ -895,11 +1251,14 @@ class Annexificator(object):
         self.repo.add(fpaths, git=True)
         # self.repo.cmd_call_wrapper.run(["git", "add"] + fpaths)
 
-    def _get_status(self, args=[]):
+    def _get_status(self, args=[], files=None):
         """Custom check of status to see what files were staged, untracked etc
         until
         https://github.com/gitpython-developers/GitPython/issues/379#issuecomment-180101921
         is resolved
+
+        `files`, if provided, restrict the status to those paths, and would be
+        passed in chunks if the list is too long for a single command line
         """
         # out, err = self.repo.cmd_call_wrapper.run(["git", "status", "--porcelain"])
         cmd_args = ["status", "--porcelain"] + args
@@ -916,7 +1275,7 @@ class Annexificator(object):
                                      # TODO: handle "properly" by committing before D happens
         }
 
-        out = self.repo.call_git(cmd_args)
+        out = self.repo.call_git(cmd_args, files=files)
 
         for l in out.split('\n'):
             if not l:
@@ -939,15 +1298,24 @@ class Annexificator(object):
                         regex,
                         dirs=True,  # either match directory names
                         rename=False,
+                        plumbing=None,
                         **kwargs):
         """Generate multiple commits if multiple versions were staged
 
         Parameters
         ----------
         TODO
+        plumbing: bool, optional
+          Prepare trees of the versions in a temporary index and commit them
+          via git plumbing commands, instead of unstaging and staging files
+          of each version in the index of the repository (and renaming them
+          if `rename`).  If None, `datalad.crawl.commit_versions.plumbing`
+          configuration variable is consulted
         **kwargs: dict, optional
           Passed to get_versions
         """
+        if plumbing is None:
+            plumbing = cfg.getbool('datalad.crawl.commit_versions', 'plumbing', default=False)
 
         def _commit_versions(data):
             self._precommit()  # so that all batched annexes stop
@@ -1015,7 +1383,7 @@ class Annexificator(object):
                 # a sign of a problem
                 # Well -- so far in the single use-case with openfmri it was that they added
                 # derivatives for the same version, so I guess we will allow for that, thus allowing =
-                assert (all((LooseVersion(prev_version) <= LooseVersion(v)) for v in versions))
+                assert (all((get_version_key(prev_version) <= get_version_key(v)) for v in versions))
                 # old implementation when we didn't have entire versions db stored
                 # new_versions = OrderedDict(versions.items()[version_keys.index(prev_version) + 1:])
                 new_versions = versions
@@ -1026,7 +1394,7 @@ class Annexificator(object):
             if new_versions:
                 smallest_new_version = next(iter(new_versions))
                 if prev_version:
-                    if LooseVersion(smallest_new_version) < LooseVersion(prev_version):
+                    if get_version_key(smallest_new_version) < get_version_key(prev_version):
                         raise ValueError("Smallest new version %s is < prev_version %s"
                                          % (smallest_new_version, prev_version))
 
@@ -1044,6 +1412,13 @@ class Annexificator(object):
                     yield d
                 return
 
+            stats = data.get('datalad_stats', None)
+            if plumbing:
+                self._commit_versions_plumbing(new_versions, versions_db, rename, stats)
+                for _ in new_versions:
+                    yield data
+                return
+
             # unstage all versioned files from the index
             nunstaged = 0
             for version, fpaths in versions.items():
@@ -1052,7 +1427,6 @@ class Annexificator(object):
                 nunstaged += nfpaths
                 self._unstage(list(fpaths.values()))
 
-            stats = data.get('datalad_stats', None)
             stats_str = ('\n\n' + stats.as_str(mode='full')) if stats else ''
 
             for iversion, (version, fpaths) in enumerate(new_versions.items()):  # for all versions past previous
@@ -1096,6 +1470,71 @@ class Annexificator(object):
 
         return _commit_versions
 
+    def _commit_versions_plumbing(self, versions, versions_db, rename, stats):
+        """Commit each version on top of the previous one using a temporary index
+
+        Index of the repository is not modified until all the commits are done,
+        and files get renamed (if `rename`) only once at the end
+        """
+        repo = self.repo
+        stats_str = ('\n\n' + stats.as_str(mode='full')) if stats else ''
+        staged = get_staged_entries(repo)
+        versioned = {
+            vfpath for fpaths in versions.values() for vfpath in fpaths.values()}
+        versions_db_path = relpath(versions_db._filepath, repo.path)
+        parent = repo.get_hexsha()
+        nversions = len(versions)
+        nunstaged = len(versioned)
+        # DB gets written for every version, but staged only along with the rest
+        versions_db.save_every = versions_db.save_interval = None
+        with TemporaryIndex(repo) as index:
+            index.read_tree(parent)
+            # the rest of staged changes goes along with the first version
+            index.update(
+                (path, entry) for path, entry in staged.items()
+                if path not in versioned)
+            for iversion, (version, fpaths) in enumerate(versions.items()):
+                entries = []
+                for fpath, vfpath in fpaths.items():
+                    if rename:
+                        entries.append((vfpath, (NULL_MODE, NULL_SHA)))
+                    entries.append((fpath if rename else vfpath, staged[vfpath]))
+                nunstaged -= len(fpaths)
+                lgr.debug("Committing %d files for version %s", len(fpaths), version)
+                if version:
+                    setattr(versions_db, 'version', version)
+                    versions_db.save(stage=False)
+                    # DB file might be not saved if it is empty
+                    if lexists(versions_db._filepath):
+                        entries.append(
+                            (versions_db_path,
+                             ('100644', hash_file(repo, versions_db._filepath))))
+                index.update(entries)
+
+                vmsg = "Multi-version commit #%d/%d: %s. Remaining unstaged: %d" % (
+                    iversion + 1, nversions, version, nunstaged)
+                if stats:
+                    stats.reset()
+                msg = self._get_commit_msg(
+                    "%s (%s)%s" % (', '.join(self._states), vmsg, stats_str))
+                parent = commit_tree(
+                    repo, index.write_tree(), [parent] if parent else [], msg)
+        assert (nunstaged == 0)  # we at the end committed all of them!
+        repo.call_git(['update-ref', '-m', 'crawl: commit versions', 'HEAD', parent])
+
+        if rename:
+            # only the last version of a file remains in the working tree
+            last_vfpaths = {}
+            for fpaths in versions.values():
+                last_vfpaths.update(fpaths)
+            for vfpath in versioned.difference(last_vfpaths.values()):
+                os.unlink(opj(repo.path, vfpath))
+            for fpath, vfpath in last_vfpaths.items():
+                lgr.debug("Renaming %s into %s" % (vfpath, fpath))
+                os.rename(opj(repo.path, vfpath), opj(repo.path, fpath))
+        # bring the index of the repository in line with the new HEAD
+        repo.call_git(['reset', '-q'])
+
     def remove_other_versions(self, name=None, db=None,
                               overlay=None, remove_unversioned=False,
                               fpath_subs=None,
@@ -1169,8 +1608,8 @@ class Annexificator(object):
                 # sanity check since we now will have assumption that versions
                 # are sorted
                 if prev_version is not None:
-                    assert(prev_version < LooseVersion(version))
-                prev_version = LooseVersion(version)
+                    assert(prev_version < get_version_key(version))
+                prev_version = get_version_key(version)
                 overlay_version = overlay_version_func(version)
                 # we do not care about non-versioned or current "overlay" version
                 #import pdb; pdb.set_trace()
@@ -1179,7 +1618,7 @@ class Annexificator(object):
 
                 files_to_remove = []
                 if current_overlay_version == overlay_version and \
-                    LooseVersion(version) <= LooseVersion(current_version):
+                    get_version_key(version) <= get_version_key(current_version):
                     # the same overlay but before current version
                     # we need to track the last known within overlay and if
                     # current updates, remove older version
@@ -1325,6 +1764,11 @@ class Annexificator(object):
         def _finalize(data):
             self._precommit()
             stats = data.get('datalad_stats', None)
+            if self._metadata_only[0]:
+                lgr.info("Avoided downloading %d files (%s) which content did not change, "
+                         "only their metadata was updated",
+                         self._metadata_only[0], naturalsize(self._metadata_only[1]))
+                self._metadata_only = [0, 0]
             if self.repo.dirty:  # or self.tracker.dirty # for dry run
                 lgr.info("Repository found dirty -- adding and committing")
                 self.repo.add('.', options=self.options)  # so everything is committed
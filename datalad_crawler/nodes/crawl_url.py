@@ -10,20 +10,34 @@
 """
 
 
-from os.path import splitext, dirname, basename
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from os import curdir
+from os.path import splitext, dirname, basename, exists, join as opj
+from urllib.parse import urlsplit
 
+from datalad import cfg
+from datalad.utils import ensure_unicode
+from datalad.utils import get_dataset_root
 from datalad.utils import updated
 from datalad.dochelpers import exc_str
 from datalad.support.exceptions import (
+    AccessFailedError,
     DownloadError,
     UnhandledRedirectError,
 )
+from datalad.downloaders.http import HTTPDownloader
 from datalad.downloaders.providers import Providers
 
+from ..consts import CRAWLER_META_DIR
+from ..dbs.pages import PagesCache
+from ..support.providers import ThreadProviders
+from ..support.ratecontrol import throttled_call
+
 from logging import getLogger
 lgr = getLogger('datalad.crawl.crawl_url')
 
-
 class crawl_url(object):
     """Given a source url, perform the initial crawling of the page, i.e. simply
     bloody fetch it and pass along
@@ -34,7 +48,11 @@ class crawl_url(object):
                  input='url',
                  failed=None,
                  cache_redirects=True,
-                 output=('response', 'url')):
+                 output=('response', 'url'),
+                 jobs=None,
+                 max_per_host=None,
+                 cache_pages=None,
+                 refresh=None):
         """If url is None, would try to pick it up from data[input]
 
         Parameters
@@ -46,6 +64,27 @@ class crawl_url(object):
           What to do about failing urls. If None -- would consult (eventually) the config
         cache_redirects: bool, optional
           Either to remember redirects for subsequent invocations
+        jobs: int, optional
+          Number of pages (matched by matchers) to fetch concurrently.  Pages
+          are still visited and yielded in the same (depth-first) order as if
+          fetched serially.  If not specified, `datalad.crawl.crawl_url.jobs`
+          configuration variable is consulted (default: 1)
+        max_per_host: int, optional
+          Maximal number of concurrent requests to the same host.  If not
+          specified, `datalad.crawl.crawl_url.max_per_host` configuration
+          variable is consulted (default: no limit)
+        cache_pages: bool, optional
+          Either to cache fetched pages (and redirects) locally (under
+          `.datalad/crawl/cache`) if crawling within a dataset configured for
+          crawling.  Cached pages get re-validated using conditional requests
+          (If-None-Match/If-Modified-Since), so unchanged pages are not
+          transferred again.  If not specified, `datalad.crawl.crawl_url.cache`
+          configuration variable is consulted (default: True)
+        refresh: bool, optional
+          Fetch all the pages (and follow redirects) anew, without considering
+          cached ones, while still caching them.  If not specified,
+          `datalad.crawl.crawl_url.refresh` configuration variable is consulted
+          (default: False)
         """
         self._url = url
         self._matchers = matchers
@@ -57,41 +96,162 @@ class crawl_url(object):
         # https://github.com/kennethreitz/requests/issues/2997
         self._redirects_cache = {} if cache_redirects else None
         self.failed = failed
+        if jobs is None:
+            jobs = int(cfg.obtain('datalad.crawl.crawl_url.jobs', default=1))
+        self._jobs = jobs
+        if max_per_host is None:
+            max_per_host = cfg.get('datalad.crawl.crawl_url.max_per_host', None)
+        self._max_per_host = int(max_per_host) if max_per_host else None
+        # url -> (future, list of visited urls), for pages being fetched ahead
+        self._prefetched = {}
+        self._executor = None
+        # providers of the threads fetching pages ahead
+        self._thread_providers = ThreadProviders()
+        self._lock = threading.Lock()
+        self._host_semaphores = {}
+        if cache_pages is None:
+            cache_pages = cfg.getbool('datalad.crawl.crawl_url', 'cache', default=True)
+        self._pages_cache = None
+        if cache_pages:
+            ds_path = get_dataset_root(curdir)
+            if ds_path and exists(opj(ds_path, CRAWLER_META_DIR)):
+                self._pages_cache = PagesCache(ds_path)
+        if refresh is None:
+            refresh = cfg.getbool('datalad.crawl.crawl_url', 'refresh', default=False)
+        self._refresh = refresh
 
     def reset(self):
         """Reset cache of seen URLs"""
         self._seen = set()
+        for future, _ in self._prefetched.values():
+            future.cancel()
+        self._prefetched = {}
+
+    def _host_slot(self, url):
+        """Return context manager to limit the number of requests to url's host"""
+        if not self._max_per_host:
+            return nullcontext()
+        host = urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._host_semaphores[host] = \
+                    threading.BoundedSemaphore(self._max_per_host)
+        return semaphore
+
+    def _get_providers(self):
+        """Return providers to fetch pages with in the current thread
+
+        Downloaders (and their sessions) are not thread-safe, so every thread
+        fetching pages ahead uses its own providers
+        """
+        return self._thread_providers.get() or self._providers
+
+    def _fetch(self, url, visited):
+        """Fetch the page at url, following redirects
+
+        Might be ran in a separate thread, so the urls which were visited
+        (and should be considered seen) are appended to `visited` list.
+
+        Returns
+        -------
+        page, url
+          Content of the page and the url it was fetched from after redirects
+        """
+        orig_url = url
+        # redirect stored by a previous run, which might be no longer valid
+        stored_redirect = False
+        if self._redirects_cache is not None:
+            with self._lock:
+                url = self._redirects_cache.get(url, url)
+            if url == orig_url and self._pages_cache and not self._refresh:
+                url = self._pages_cache.get_redirect(url) or url
+                stored_redirect = url != orig_url
+        retry = 0
+        while True:
+            retry += 1
+            if retry > 100:
+                raise DownloadError("We have followed 100 redirects already. Something is wrong!")
+            try:
+                visited.append(url)
+                with self._host_slot(url):
+                    return throttled_call(url, self._fetch_page, url), url
+            except UnhandledRedirectError as exc:
+                stored_redirect = False
+                # since we care about tracking URL for proper full url construction
+                # we should disallow redirects and handle them manually here
+                lgr.debug("URL %s was redirected to %s" % (url, exc.url))
+                if url == exc.url:
+                    raise DownloadError("Was redirected to the same url upon %s" % exc_str(exc))
+                url = exc.url
+                if self._redirects_cache is not None:
+                    with self._lock:
+                        self._redirects_cache[orig_url] = exc.url
+                    if self._pages_cache:
+                        self._pages_cache.set_redirect(orig_url, exc.url)
+            except Exception as exc:
+                if not stored_redirect:
+                    raise
+                lgr.debug("Failed to fetch %s, to which %s was redirected before: %s. "
+                          "Fetching the original url", url, orig_url, exc_str(exc))
+                stored_redirect = False
+                self._pages_cache.set_redirect(orig_url, None)
+                url = orig_url
+
+    def _fetch_page(self, url):
+        """Fetch the page without following redirects, re-validating cached one if any"""
+        cache = self._pages_cache
+        providers = self._get_providers()
+        if cache is None:
+            return providers.fetch(url, allow_redirects=False)
+        downloader = providers.get_provider(url).get_downloader(url)
+        if not isinstance(downloader, HTTPDownloader):
+            return providers.fetch(url, allow_redirects=False)
+        cached = None if self._refresh else cache.get(url)
+        try:
+            session = downloader.access(
+                downloader.get_downloader_session, url,
+                allow_redirects=False,
+                headers=cache.get_conditional_headers(cached[1]) if cached else None)
+        except AccessFailedError as exc:
+            if cached and exc.status == 304:
+                lgr.debug("Page %s was not modified, using cached content", url)
+                return cached[0]
+            raise
+        page = ensure_unicode(session.download())
+        cache.set(url, page, session.headers)
+        return page
+
+    def _prefetch(self, urls):
+        """Start fetching pages which are about to be visited"""
+        for url in urls:
+            if url in self._seen or url in self._prefetched:
+                continue
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._jobs, thread_name_prefix='crawl-url',
+                    initializer=self._thread_providers.init_thread)
+            lgr.log(5, "Prefetching %s", url)
+            visited = []
+            self._prefetched[url] = (self._executor.submit(self._fetch, url, visited), visited)
 
     def _visit_url(self, url, data):
+        future, visited = self._prefetched.pop(url, (None, []))
         if url in self._seen:
+            if future is not None:
+                # was seen (e.g. redirected to) since it was prefetched
+                future.cancel()
             return
         # this is just a cruel first attempt
         lgr.debug("Visiting %s" % url)
 
         try:
-            retry = 0
-            orig_url = url
-            if self._redirects_cache is not None:
-                url = self._redirects_cache.get(url, url)
-            while True:
-                retry += 1
-                if retry > 100:
-                    raise DownloadError("We have followed 100 redirects already. Something is wrong!")
-                try:
-                    self._seen.add(url)
-                    page = self._providers.fetch(url, allow_redirects=False)
-                    break
-                except UnhandledRedirectError as exc:
-                    # since we care about tracking URL for proper full url construction
-                    # we should disallow redirects and handle them manually here
-                    lgr.debug("URL %s was redirected to %s" % (url, exc.url))
-                    if url == exc.url:
-                        raise DownloadError("Was redirected to the same url upon %s" % exc_str(exc))
-                    url = exc.url
-                    if self._redirects_cache is not None:
-                        self._redirects_cache[orig_url] = exc.url
+            try:
+                page, url = future.result() if future else self._fetch(url, visited)
+            finally:
+                self._seen.update(visited)
         except DownloadError as exc:
-            lgr.warning("URL %s failed to download: %s" % (url, exc_str(exc)))
+            lgr.warning("URL %s failed to download: %s" % (visited[-1] if visited else url, exc_str(exc)))
             if self.failed in {None, 'skip'}:
                 # TODO: config  -- crawl.failed='skip' should be a config option, for now always skipping
                 return
@@ -104,14 +264,25 @@ class crawl_url(object):
         matchers = self._matchers
         if matchers:
             lgr.debug("Looking for more URLs at %s using %s", url, matchers)
-            for matcher in (matchers if isinstance(matchers, (list, tuple)) else [matchers]):
-                for data_matched in matcher(data_):
-                    if 'url' not in data_matched:
-                        lgr.warning("Got data without a url from %s" % matcher)
-                        continue
-                    # proxy findings
-                    for data_matched_ in self._visit_url(data_matched['url'], data_matched):
-                        yield data_matched_
+            matched = self._get_matched(data_, matchers)
+            if self._jobs > 1:
+                # we need to know what is coming to fetch it ahead
+                matched = list(matched)
+            for i, data_matched in enumerate(matched):
+                if self._jobs > 1:
+                    self._prefetch(d['url'] for d in matched[i:i + self._jobs])
+                # proxy findings
+                for data_matched_ in self._visit_url(data_matched['url'], data_matched):
+                    yield data_matched_
+
+    @staticmethod
+    def _get_matched(data, matchers):
+        for matcher in (matchers if isinstance(matchers, (list, tuple)) else [matchers]):
+            for data_matched in matcher(data):
+                if 'url' not in data_matched:
+                    lgr.warning("Got data without a url from %s" % matcher)
+                    continue
+                yield data_matched
 
     def __call__(self, data={}):
         #assert(data == {}) # atm assume we are the first of mogican
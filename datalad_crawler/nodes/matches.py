@@ -33,6 +33,29 @@ except ImportError:  # pragma: no cover
     Response = None
 
 
+# the most recently parsed input along with its selector
+_last_selector = (None, None)
+
+
+def _get_selector(input):
+    """Return selector (parsed document) for the input, reusing the last one
+
+    Multiple matchers are commonly applied to the same page one after another
+    (e.g. a few `a_href_match` branches of a pipeline), and they get the very
+    same input object (page content or Response).  So the selector for the
+    most recent input is kept to be reused if it is the same object.  Only a
+    single one is kept, so no more than one page is held beyond its use.
+    """
+    global _last_selector
+    last_input, selector = _last_selector
+    if last_input is not None and last_input is input:
+        return selector
+    selector = Selector(response=input) \
+        if isinstance(input, Response) else Selector(text=input)
+    _last_selector = (input, selector)
+    return selector
+
+
 # for now heavily based on scrapy but we might make the backend
 # replaceable
 @auto_repr
@@ -67,13 +90,11 @@ class ExtractorMatch(object):
                 "scrapy",
                 msg="It is needed for this type of crawling"
             )
+        selector = _get_selector(input)
         if isinstance(input, Response):
-            selector = Selector(response=input)
             if hasattr(input, 'url') and input.url and ('url' not in data):
                 # take the URL of the response object
                 data = updated(data, {'url': input.url})
-        else:
-            selector = Selector(text=input)
 
         count = 0
         for entry, data_ in self._select_and_extract(selector, self.query, data):
@@ -144,27 +165,40 @@ class AExtractorMatch(ExtractorMatch):
     def _select_and_extract(self, selector, query, data):
         prev_url = data.get('url', None)
         url_query = re.compile(query)
-        for url_e in selector.xpath('//a'):
-            url = url_href = url_e.xpath('@href').extract_first()
+        target_text = self._TARGET == 'text'
+        if not target_text and self._TARGET != 'href':
+            raise ValueError("Unknown _TARGET=%r" % (self._TARGET,))
+        # Go through all the <a> elements in a single pass over the tree, instead
+        # of selecting them via xpath and querying each one of them via xpath
+        root = selector.root
+        anchors = root.iter('a') if hasattr(root, 'iter') \
+            else (url_e.root for url_e in selector.xpath('//a'))
+        for anchor in anchors:
+            url = url_href = anchor.get('href')
             if not url:
                 # it was an <a> without href
                 continue
 
-            # make it a full URL, if there was an original URL
-            if prev_url:
-                url = dlurljoin(prev_url, url_href)
-
-            if self._TARGET == 'href':
-                regex_target = url
-            elif self._TARGET == 'text':
-                regex_target = url_e.xpath('text()').extract_first()
+            if target_text:
+                url_text = _get_first_text(anchor)
+                regex_target = url_text
             else:
-                raise ValueError("Unknown _TARGET=%r" % (self._TARGET,))
+                # make it a full URL, if there was an original URL
+                if prev_url:
+                    url = dlurljoin(prev_url, url_href)
+                regex_target = url
 
             regex = url_query.match(regex_target)
             if not regex:
                 continue
 
+            if target_text:
+                # URL is needed only for the matched ones
+                if prev_url:
+                    url = dlurljoin(prev_url, url_href)
+            else:
+                url_text = _get_first_text(anchor)
+
             # enrich data with extracted keywords
             data_ = data.copy()
             for k, v in regex.groupdict().items():
@@ -174,10 +208,20 @@ class AExtractorMatch(ExtractorMatch):
             # e.g. operating on some extracted with XPATH content
             data_['url'] = url
             data_['url_href'] = url_href
-            data_['url_text'] = url_e.xpath('text()').extract_first()
+            data_['url_text'] = url_text
             lgr.log(5, "Matched %(url)s" % data_)
 
-            yield url_e, data_
+            yield Selector(root=anchor, type=selector.type), data_
+
+
+def _get_first_text(element):
+    """Return the first text node within the element, as xpath('text()') would"""
+    if element.text is not None:
+        return element.text
+    for child in element:
+        if child.tail is not None:
+            return child.tail
+    return None
 
 
 class a_href_match(AExtractorMatch):
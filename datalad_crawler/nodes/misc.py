@@ -15,9 +15,13 @@ import re
 import stat
 import pdb
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from stat import ST_MODE, S_IEXEC, S_IXOTH, S_IXGRP
 from os.path import curdir, isdir, isabs, exists, join as opj, split as ops
 
+from datalad import cfg
+from datalad.dochelpers import exc_str
 from datalad.support.network import get_url_disposition_filename
 from datalad.support.network import get_url_straight_filename
 from datalad.utils import updated
@@ -27,6 +31,8 @@ from datalad_crawler.pipeline import PIPELINE_TYPES
 from datalad.utils import auto_repr
 from datalad.utils import find_files as _find_files
 from datalad.support.network import URL
+from datalad_crawler.support.providers import ThreadProviders
+from datalad_crawler.support.ratecontrol import throttled_call
 
 from logging import getLogger
 
@@ -590,6 +596,82 @@ class debug(object):
             pdb.set_trace()
 
 
+@auto_repr
+class prefetch_url_status(object):
+    """Wrap a node to obtain statuses of the urls it yields ahead and concurrently
+
+    Statuses (as `url_status`) of the urls in the output of the node are
+    requested in a pool of threads, for up to `lookahead` items ahead of the
+    one being yielded.  The Annexificator then uses provided `url_status`
+    instead of requesting it itself, one at a time, so e.g. figuring out that
+    nothing has changed while re-crawling a site does not wait on every url.
+
+    Output is yielded in the same order as produced by the node.  Items which
+    already have `url_status` are passed through as is, as well as the ones
+    for which status could not be obtained, so downstream deals with them as
+    usual.
+    """
+
+    def __init__(self, node, jobs=None, lookahead=None):
+        """
+        Parameters
+        ----------
+        node: callable or pipeline
+          Node (or a pipeline, so it should specify desired output) producing
+          items with urls, e.g. a matcher
+        jobs: int, optional
+          Number of concurrent requests.  If not specified,
+          `datalad.crawl.prefetch_url_status.jobs` configuration variable is
+          consulted (default: 4)
+        lookahead: int, optional
+          Number of items to request statuses for ahead of the one being
+          yielded.  Default: twice the `jobs`
+        """
+        self.node = node
+        if jobs is None:
+            jobs = int(cfg.obtain('datalad.crawl.prefetch_url_status.jobs', default=4))
+        self.jobs = jobs
+        self.lookahead = lookahead or 2 * jobs
+        # downloaders are not thread-safe, so every thread uses its own
+        self._thread_providers = ThreadProviders()
+
+    def reset(self):
+        if hasattr(self.node, 'reset'):
+            self.node.reset()
+
+    def _get_url_status(self, url):
+        downloader = self._thread_providers.get().get_provider(url).get_downloader(url)
+        return throttled_call(url, downloader.get_status, url)
+
+    @staticmethod
+    def _get_output(future, data):
+        if future is None:
+            return data
+        try:
+            url_status = future.result()
+        except Exception as exc:
+            lgr.debug("Failed to prefetch status of %s: %s", data['url'], exc_str(exc))
+            return data
+        return updated(data, {'url_status': url_status})
+
+    def __call__(self, data):
+        node = self.node
+        gen = xrun_pipeline(node, data) if isinstance(node, PIPELINE_TYPES) else node(data)
+        pending = deque()  # (future, data) in the order of the output
+        with ThreadPoolExecutor(max_workers=self.jobs,
+                                thread_name_prefix='crawl-url-status',
+                                initializer=self._thread_providers.init_thread) as executor:
+            for out in gen:
+                future = None
+                if out.get('url') and 'url_status' not in out:
+                    future = executor.submit(self._get_url_status, out['url'])
+                pending.append((future, out))
+                while len(pending) > self.lookahead:
+                    yield self._get_output(*pending.popleft())
+            while pending:
+                yield self._get_output(*pending.popleft())
+
+
 def fix_url(data, keys=['url']):
     """Given data, get value within 'url' key and fix up so it is legit url
 
@@ -11,19 +11,30 @@
 
 from __future__ import annotations
 
+import heapq
+import pickle
+import queue
 import re
+import tempfile
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Any, Iterator, Optional
+from itertools import chain, islice
+from typing import Any, Iterable, Iterator, Optional
 
+from datalad import cfg
 from datalad.utils import updated
 from datalad.dochelpers import exc_str
 from datalad.downloaders.providers import Providers
 from datalad.downloaders.s3 import S3Downloader
 from datalad.support.exceptions import TargetFileAbsent
 from datalad.support.network import urlquote
-from datalad.support.status import FileStatus
 from ..dbs.versions import SingleVersionDB
+from ..support.ratecontrol import throttled_iter
+from ..support.status import ChecksumFileStatus
+from ..support.status import get_checksum
 
 from logging import getLogger
 lgr = getLogger('datalad.crawl.s3')
@@ -31,6 +42,113 @@ lgr = getLogger('datalad.crawl.s3')
 # Sentinel for sorting entries that lack LastModified (e.g. prefixes)
 _MIN_DATETIME = datetime.min.replace(tzinfo=timezone.utc)
 
+# Sentinel for the end of values passed via a queue
+_DONE = object()
+
+# Fields of the record stored in SingleVersionDB
+_VERSION_FIELDS = ['last-modified', 'name', 'version-id']
+
+
+def _prefix_entry(prefix: str) -> dict[str, Any]:
+    return {
+        '_type': 'prefix',
+        'Key': prefix,
+        'VersionId': None,
+        'LastModified': None,
+        'IsLatest': None,
+    }
+
+
+def _list_entries(
+    client: Any,
+    versioned: bool,
+    kwargs: dict[str, Any],
+    last_key: Optional[str] = None,
+) -> Iterator[dict[str, Any]]:
+    """Paginate a single listing, yielding tagged dicts (see `_list_bucket`)
+
+    If `last_key` is specified, entries with keys past it are not yielded, and
+    no further pages are requested.
+    """
+    if versioned:
+        paginator = client.get_paginator('list_object_versions')
+        fields = (('Versions', 'version'), ('DeleteMarkers', 'delete_marker'))
+    else:
+        paginator = client.get_paginator('list_objects_v2')
+        fields = (('Contents', 'version'),)
+    pages = throttled_iter('s3://%s' % kwargs['Bucket'], paginator.paginate(**kwargs))
+    for page in pages:
+        beyond = False
+        for field, type_ in fields:
+            for e in page.get(field, []):
+                if last_key is not None and e['Key'] > last_key:
+                    beyond = True
+                    continue
+                e['_type'] = type_
+                yield e
+        for cp in page.get('CommonPrefixes', []):
+            yield _prefix_entry(cp['Prefix'])
+        if beyond:
+            break
+
+
+def _iter_ordered(func, items, jobs, buffer=None, chunk_size=100):
+    """Yield values of the iterables returned by func(item), in the order of items
+
+    Up to `jobs` iterables are consumed in parallel threads, each passing its
+    values (in chunks) via a queue.  If `buffer` is specified, queues are
+    bounded, so only about that many values per iterable are kept in memory
+    ahead of the ones being yielded.
+    """
+    items = iter(items)
+    if buffer:
+        chunk_size = min(chunk_size, buffer)
+    stop = threading.Event()
+
+    def put(q, value):
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def consume(item, q):
+        try:
+            if stop.is_set():
+                return
+            values = iter(func(item))
+            for chunk in iter(lambda: list(islice(values, chunk_size)), []):
+                if not put(q, chunk):
+                    return
+        finally:
+            put(q, _DONE)
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=jobs,
+                            thread_name_prefix='crawl-s3-list') as executor:
+
+        def submit(item):
+            q = queue.Queue(maxsize=max(1, buffer // chunk_size) if buffer else 0)
+            pending.append((executor.submit(consume, item, q), q))
+
+        try:
+            for item in islice(items, jobs):
+                submit(item)
+            while pending:
+                future, q = pending.popleft()
+                for item in islice(items, 1):
+                    submit(item)
+                for chunk in iter(q.get, _DONE):
+                    yield from chunk
+                future.result()  # to raise if it has failed
+        finally:
+            # do not wait for the rest if we were interrupted
+            stop.set()
+            for future, _ in pending:
+                future.cancel()
+
 
 def _list_bucket(
     client: Any,
@@ -38,6 +156,9 @@ def _list_bucket(
     prefix: Optional[str],
     versioned: bool,
     recursive: bool,
+    jobs: Optional[int] = None,
+    split_points: Optional[list[str]] = None,
+    max_in_memory: Optional[int] = None,
 ) -> Iterator[dict[str, Any]]:
     """Paginate an S3 bucket listing, yielding tagged dicts.
 
@@ -47,6 +168,16 @@ def _list_bucket(
       'prefix'        - common prefix directory (from CommonPrefixes)
 
     For non-versioned listing, objects from Contents are tagged 'version'.
+
+    For a recursive listing, if `jobs` > 1 or `split_points` are provided,
+    the listing is sharded and up to `jobs` shards are listed in parallel.
+    Shards are defined either by `split_points` (sorted keys, each shard
+    containing keys past the previous split point and up to the next one), or
+    by the top-level `CommonPrefixes` under the `prefix`.  Entries are yielded
+    shard by shard in the lexical order of the shards, so overall order
+    differs from the one of a non-sharded listing.  If `max_in_memory` is
+    specified, shards listed ahead keep no more than about that many entries
+    (altogether) in memory.
     """
     kwargs = {'Bucket': bucket_name}
     if prefix:
@@ -54,37 +185,32 @@ def _list_bucket(
     if not recursive:
         kwargs['Delimiter'] = '/'
 
-    if versioned:
-        paginator = client.get_paginator('list_object_versions')
-        for page in paginator.paginate(**kwargs):
-            for v in page.get('Versions', []):
-                v['_type'] = 'version'
-                yield v
-            for dm in page.get('DeleteMarkers', []):
-                dm['_type'] = 'delete_marker'
-                yield dm
-            for cp in page.get('CommonPrefixes', []):
-                yield {
-                    '_type': 'prefix',
-                    'Key': cp['Prefix'],
-                    'VersionId': None,
-                    'LastModified': None,
-                    'IsLatest': None,
-                }
+    if not recursive or not (split_points or (jobs and jobs > 1)):
+        yield from _list_entries(client, versioned, kwargs)
+        return
+
+    if split_points:
+        split_points = sorted(split_points)
+        marker = 'KeyMarker' if versioned else 'StartAfter'
+        shards = [(kwargs, split_points[0])] + [
+            (dict(kwargs, **{marker: start}), end)
+            for start, end in zip(split_points, split_points[1:] + [None])
+        ]
     else:
-        paginator = client.get_paginator('list_objects_v2')
-        for page in paginator.paginate(**kwargs):
-            for obj in page.get('Contents', []):
-                obj['_type'] = 'version'
-                yield obj
-            for cp in page.get('CommonPrefixes', []):
-                yield {
-                    '_type': 'prefix',
-                    'Key': cp['Prefix'],
-                    'VersionId': None,
-                    'LastModified': None,
-                    'IsLatest': None,
-                }
+        # entries at the top level are yielded right away, while
+        # top level prefixes become the shards to list
+        shards = []
+        for e in _list_entries(client, versioned, dict(kwargs, Delimiter='/')):
+            if e['_type'] == 'prefix':
+                shards.append((dict(kwargs, Prefix=e['Key']), None))
+            else:
+                yield e
+    lgr.debug("Listing %d shards of %s using %s jobs", len(shards), bucket_name, jobs)
+    jobs = jobs or 1
+    yield from _iter_ordered(
+        lambda shard: _list_entries(client, versioned, *shard),
+        shards, jobs,
+        buffer=max(1, max_in_memory // jobs) if max_in_memory else None)
 
 
 def get_key_url(
@@ -142,6 +268,158 @@ def _strip_prefix(s: Optional[str], prefix: str) -> Optional[str]:
     return s[len(prefix):] if s and s.startswith(prefix) else s
 
 
+def _sort_key(k: dict[str, Any]) -> tuple:
+    """Key to sort listed entries in the order they should be processed in
+
+    Comparison becomes tricky whenever as if in our test bucket we have a collection
+    of rapid changes within the same ms, so they couldn't be sorted by last_modified, so we resolve based
+    on them being marked latest, or not being null (as could happen originally), and placing Delete after creation
+    In real life last_modified should be enough, but life can be as tough as we made it for 'testing'
+    """
+    # So ATM it would sort Prefixes first, but that is not necessarily correct...
+    # Theoretically the only way to sort Prefix'es with the rest is traverse that Prefix
+    # and take latest last_modified there but it is expensive, so -- big TODO if ever ;)
+    # ACTUALLY -- may be there is an API call to return sorted by last_modified, then we
+    # would need only a single entry in result to determine the last_modified for the Prefix, thus TODO
+    last_modified = k.get('LastModified')
+    return (
+        # use sentinel datetime for consistent sorting of entries without it
+        _MIN_DATETIME if last_modified is None else last_modified,
+        k['Key'] or '',
+        bool(k.get('IsLatest')),
+        k.get('VersionId', 'null') != 'null',
+        k['_type'] == 'delete_marker'
+    )
+
+
+def _read_run(f) -> Iterator[dict[str, Any]]:
+    """Yield entries pickled one after another into a file, closing it at the end"""
+    try:
+        f.seek(0)
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                break
+    finally:
+        f.close()
+
+
+def _sorted_entries(
+    entries: Iterable[dict[str, Any]],
+    max_in_memory: Optional[int] = None,
+) -> Iterator[dict[str, Any]]:
+    """Yield entries sorted with `_sort_key`
+
+    If `max_in_memory` is specified, no more than that many entries are kept
+    in memory while listing: sorted runs get spilled into temporary files
+    which are then merged.
+    """
+    if not max_in_memory:
+        yield from sorted(entries, key=_sort_key)
+        return
+
+    runs = []
+    chunk = []
+    try:
+        for e in entries:
+            chunk.append(e)
+            if len(chunk) >= max_in_memory:
+                runs.append(_spill_run(chunk))
+                chunk = []
+        chunk.sort(key=_sort_key)
+        if runs:
+            lgr.debug("Merging %d sorted runs of entries spilled to disk", len(runs))
+        yield from heapq.merge(
+            *[_read_run(f) for f in runs], chunk, key=_sort_key)
+    finally:
+        for f in runs:
+            f.close()
+
+
+def _spill_run(chunk: list[dict[str, Any]]) -> Any:
+    """Sort entries and store them into a temporary file"""
+    chunk.sort(key=_sort_key)
+    f = tempfile.TemporaryFile(prefix='datalad-crawl-s3-')
+    pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+    for e in chunk:
+        pickler.dump(e)
+        # to avoid memo growing with every entry
+        pickler.clear_memo()
+    return f
+
+
+def _last_modified_for_cmp(k: dict[str, Any]) -> str:
+    """Return LastModified as iso8601 string for version DB comparison."""
+    lm = k.get('LastModified')
+    if lm is None:
+        return ''
+    if isinstance(lm, datetime):
+        return lm.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    return lm
+
+
+def _get_version_cmp(k: dict[str, Any]) -> tuple[str, str, str]:
+    # this one will return action version_id so we could uniquely identify
+    return _last_modified_for_cmp(k), k['Key'], k.get('VersionId', '')
+
+
+def _drop_older(
+    entries: Iterable[dict[str, Any]],
+    prev_version: dict[str, str],
+    stats: Any = None,
+) -> Iterator[dict[str, Any]]:
+    """Drop entries older than the previously processed one before they get sorted
+
+    Those would be skipped by `_skip_processed` anyways, so they are also
+    accounted as skipped.  Entries as old as the previously processed one
+    are passed through, so `_skip_processed` could find where to resume from.
+    """
+    last_modified_ = prev_version['last-modified']
+    try:
+        # stored value has no subsecond precision, so comparing datetimes
+        # is equivalent to comparing the strings but cheaper
+        last_modified_dt = datetime.strptime(
+            last_modified_, '%Y-%m-%dT%H:%M:%S.000Z').replace(tzinfo=timezone.utc)
+    except ValueError:
+        last_modified_dt = None
+    for k in entries:
+        lm = k.get('LastModified')
+        if last_modified_dt is not None and isinstance(lm, datetime) \
+                and lm.tzinfo is not None and not lm.utcoffset():
+            older = lm < last_modified_dt
+        else:
+            older = _last_modified_for_cmp(k) < last_modified_
+        if older:
+            if stats:
+                stats.increment('skipped')
+            continue
+        yield k
+
+
+def _skip_processed(
+    entries: Iterable[dict[str, Any]],
+    prev_version: dict[str, str],
+    stats: Any = None,
+) -> Iterator[dict[str, Any]]:
+    """Skip sorted entries up to (and including) the previously processed one"""
+    last_modified_, name_, version_id_ = \
+        [prev_version[f] for f in _VERSION_FIELDS]
+    entries = iter(entries)
+    # roll forward until we get to the element > this
+    for k in entries:
+        lm, n, vid = _get_version_cmp(k)
+        if lm > last_modified_:
+            yield k
+            break
+        if stats:
+            stats.increment('skipped')
+        # go by name/version_id to be matched and then switch to the next one
+        if lm == last_modified_ and (n, vid) == (name_, version_id_):
+            break
+    yield from entries
+
+
 class crawl_s3(object):
     """Given a source bucket and optional prefix, generate s3:// urls for the content
 
@@ -158,6 +436,9 @@ class crawl_s3(object):
                  recursive=False,
                  versioned=True,
                  exclude=None,
+                 max_in_memory=None,
+                 jobs=None,
+                 split_points=None,
                  ):
         """
 
@@ -190,6 +471,19 @@ class crawl_s3(object):
         exclude: str, optional
           Regular expression to search to decide which files to exclude from
           consideration
+        max_in_memory: int, optional
+          Since entries need to be sorted by their modification time before
+          any of them could be processed, whole listing is kept in memory by
+          default.  If specified, no more than that many entries are kept in
+          memory at a time -- sorted runs of them are stored in temporary files
+          and then merged while processing, and shards listed in parallel
+          (see `jobs`) do not get listed too far ahead
+        jobs: int, optional
+          Number of shards of a recursive listing to list in parallel.  Top
+          level prefixes are used as shards unless `split_points` are given.
+          If None, 'datalad.crawl.s3.jobs' configuration (default 1) is used
+        split_points: list of str, optional
+          Keys to split a recursive listing into shards at
         """
         self.bucket = bucket
         if prefix and not prefix.endswith('/'):
@@ -206,6 +500,11 @@ class crawl_s3(object):
         self.recursive = recursive
         self.versioned = versioned
         self.exclude = exclude
+        self.max_in_memory = max_in_memory
+        if jobs is None:
+            jobs = cfg.obtain('datalad.crawl.s3.jobs', default=1)
+        self.jobs = int(jobs)
+        self.split_points = split_points
 
     def __call__(self, data):
         stats = data.get('datalad_stats', None)
@@ -239,7 +538,12 @@ class crawl_s3(object):
         assert bucket_name is not None
 
         if self.repo:
-            versions_db = SingleVersionDB(self.repo)
+            # saving after each processed entry would be too expensive, so
+            # it is done only periodically and whenever we reach a commit
+            versions_db = SingleVersionDB(
+                self.repo, save_every=None,
+                save_interval=float(cfg.obtain(
+                    'datalad.crawl.s3.versiondb.saveinterval', default=60)))
             prev_version = versions_db.version
             if prev_version and not prev_version.get('version-id', None):
                 # Situation might arise when a directory contains no files, only
@@ -252,72 +556,19 @@ class crawl_s3(object):
             prev_version, versions_db = None, None
 
         # Fetch all entries, sort, proceed
-        all_versions = list(_list_bucket(
-            client, bucket_name, self.prefix, self.versioned, self.recursive
-        ))
-
-        # Comparison becomes tricky whenever as if in our test bucket we have a collection
-        # of rapid changes within the same ms, so they couldn't be sorted by last_modified, so we resolve based
-        # on them being marked latest, or not being null (as could happen originally), and placing Delete after creation
-        # In real life last_modified should be enough, but life can be as tough as we made it for 'testing'
-        def kf(k: dict[str, Any], field: str) -> Any:
-            """Get field from dict, using appropriate defaults for sorting."""
-            val = k.get(field)
-            if val is None:
-                # For LastModified, use sentinel datetime for consistent sorting
-                if field == 'LastModified':
-                    return _MIN_DATETIME
-                return ''
-            return val
-
-        # So ATM it would sort Prefixes first, but that is not necessarily correct...
-        # Theoretically the only way to sort Prefix'es with the rest is traverse that Prefix
-        # and take latest last_modified there but it is expensive, so -- big TODO if ever ;)
-        # ACTUALLY -- may be there is an API call to return sorted by last_modified, then we
-        # would need only a single entry in result to determine the last_modified for the Prefix, thus TODO
-        cmp = lambda k: (
-            kf(k, 'LastModified'),
-            k['Key'],
-            bool(k.get('IsLatest')),
-            k.get('VersionId', 'null') != 'null',
-            k['_type'] == 'delete_marker'
+        # S3 provides no way to list only entries modified since some time, so
+        # we need to list all of them, but at least do not sort those already processed
+        entries = _list_bucket(
+            client, bucket_name, self.prefix, self.versioned, self.recursive,
+            jobs=self.jobs, split_points=self.split_points,
+            max_in_memory=self.max_in_memory,
         )
-
-        versions_sorted = sorted(all_versions, key=cmp)
-
-        version_fields = ['last-modified', 'name', 'version-id']
-
-        def _last_modified_for_cmp(k: dict[str, Any]) -> str:
-            """Return LastModified as iso8601 string for version DB comparison."""
-            lm = k.get('LastModified')
-            if lm is None:
-                return ''
-            if isinstance(lm, datetime):
-                return lm.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-            return lm
-
-        def get_version_cmp(k: dict[str, Any]) -> tuple[str, str, str]:
-            # this one will return action version_id so we could uniquely identify
-            return _last_modified_for_cmp(k), k['Key'], k.get('VersionId', '')
+        if prev_version:
+            entries = _drop_older(entries, prev_version, stats)
+        versions_sorted = _sorted_entries(entries, max_in_memory=self.max_in_memory)
 
         if prev_version:
-            last_modified_, name_, version_id_ = [prev_version[f] for f in version_fields]
-            # roll forward until we get to the element > this
-            # to not breed list copies
-            for i, k in enumerate(versions_sorted):
-                lm, n, vid = get_version_cmp(k)
-                if lm > last_modified_:
-                    start = i
-                    break
-                elif lm == last_modified_:
-                    # go by name/version_id to be matched and then switch to the next one
-                    if (n, vid) == (name_, version_id_):
-                        start = i+1  # from the next one
-                        if stats:
-                            stats.increment('skipped')
-                        break
-                stats.increment('skipped')
-            versions_sorted = versions_sorted[start:]
+            versions_sorted = _skip_processed(versions_sorted, prev_version, stats)
 
         # a set of items which we have already seen/yielded so hitting any of them again
         # would mean conflict/versioning is necessary since two actions came for the same item
@@ -330,94 +581,102 @@ class crawl_s3(object):
         # logic later outside
         def update_versiondb(e: Optional[dict[str, Any]], force: bool = False) -> None:
             # this way we could recover easier after a crash
-            # TODO: config crawl.crawl_s3.versiondb.saveaftereach=True
-            if e is not None and (force or True):
-                versions_db.version = dict(zip(version_fields, get_version_cmp(e)))
-        for e in versions_sorted + [None]:
-            filename = e['Key'] if e is not None else None
-            if (self.strip_prefix and self.prefix):
-                filename = _strip_prefix(filename, self.prefix)
-            if filename and self.exclude and re.search(self.exclude, filename):
-                stats.skipped += 1
-                continue
-
-            if filename in staged or e is None:
-                # we should finish this one and commit
-                if staged:
-                    if self.versionfx and e_prev is not None:
-                        version = self.versionfx(e_prev)
-                        if version is not None and version not in stats.versions:
-                            stats.versions.append(version)
-                    if versions_db:
-                        # save current "version" DB so we would know where to pick up from
-                        # upon next rerun.  Record should contain
-                        # last_modified, name, versionid
-                        # TODO?  what if e_prev was a DeleteMarker???
-                        update_versiondb(e_prev, force=True)
-                    if strategy == 'commit-versions':
-                        yield updated(data, {'datalad_action': 'commit'})
-                        if self.ncommits:
-                            ncommits += 1
-                            if self.ncommits <= ncommits:
-                                lgr.debug("Interrupting on %dth commit since asked to do %d",
-                                          ncommits, self.ncommits)
-                                break
-                    staged.clear()
-                if e is None:
-                    break  # we are done
-            if filename:
-                # might be empty if e.g. it was the self.prefix directory removed
-                staged.add(filename)
-            if e['_type'] == 'version':
-                if e['Key'].endswith('/'):
-                    # signals a directory for which we don't care explicitly (git doesn't -- we don't! ;) )
+            if e is not None:
+                versions_db.version = dict(zip(_VERSION_FIELDS, _get_version_cmp(e)))
+            if force:
+                versions_db.save()
+
+        try:
+            for e in chain(versions_sorted, [None]):
+                filename = e['Key'] if e is not None else None
+                if (self.strip_prefix and self.prefix):
+                    filename = _strip_prefix(filename, self.prefix)
+                if filename and self.exclude and re.search(self.exclude, filename):
+                    stats.skipped += 1
                     continue
-                url = get_key_url(e, bucket_name, schema=self.url_schema, versioned=self.versioned)
-                # Build FileStatus inline from the entry dict
-                last_modified = e.get('LastModified')
-                mtime = last_modified.timestamp() if isinstance(last_modified, datetime) else None
-                url_status = FileStatus(
-                    size=e.get('Size'),
-                    mtime=mtime,
-                    filename=e['Key'],
-                )
-                # generate and pass along the status right away since we can
-                yield updated(
-                    data,
-                    {
-                        'url': url,
-                        'url_status': url_status,
-                        'filename': filename,
-                        'datalad_action': 'annex',
-                    })
-                update_versiondb(e)
-            elif e['_type'] == 'delete_marker':
-                if strategy == 'commit-versions':
-                    # Since git doesn't care about empty directories for us makes sense only
-                    # in the case when DeleteMarker is not pointing to the subdirectory
-                    # and not empty (if original directory was removed)
-                    if filename and not filename.endswith('/'):
-                        yield updated(data, {'filename': filename, 'datalad_action': 'remove'})
-                    else:
-                        # Situation there is much trickier since it seems that "directory"
-                        # could also be a key itself and created/removed which somewhat interferes with
-                        # all our logic here
-                        # For an interesting example see
-                        #  s3://openneuro/ds000217/ds000217_R1.0.0/compressed
-                        lgr.info("Ignoring DeleteMarker for %s", filename)
-
-                update_versiondb(e)
-            elif e['_type'] == 'prefix':
-                # so  we were provided a directory (in non-recursive traversal)
-                assert(not self.recursive)
-                yield updated(
-                    data,
-                    {
-                        'url': url,
-                        'filename': filename.rstrip('/'),
-                        'datalad_action': 'directory',
-                    }
-                )
-            else:
-                raise ValueError("Don't know how to treat %s" % e)
-            e_prev = e
+
+                if filename in staged or e is None:
+                    # we should finish this one and commit
+                    if staged:
+                        if self.versionfx and e_prev is not None:
+                            version = self.versionfx(e_prev)
+                            if version is not None and version not in stats.versions:
+                                stats.versions.append(version)
+                        if versions_db:
+                            # save current "version" DB so we would know where to pick up from
+                            # upon next rerun.  Record should contain
+                            # last_modified, name, versionid
+                            # TODO?  what if e_prev was a DeleteMarker???
+                            update_versiondb(e_prev, force=True)
+                        if strategy == 'commit-versions':
+                            yield updated(data, {'datalad_action': 'commit'})
+                            if self.ncommits:
+                                ncommits += 1
+                                if self.ncommits <= ncommits:
+                                    lgr.debug("Interrupting on %dth commit since asked to do %d",
+                                              ncommits, self.ncommits)
+                                    break
+                        staged.clear()
+                    if e is None:
+                        break  # we are done
+                if filename:
+                    # might be empty if e.g. it was the self.prefix directory removed
+                    staged.add(filename)
+                if e['_type'] == 'version':
+                    if e['Key'].endswith('/'):
+                        # signals a directory for which we don't care explicitly (git doesn't -- we don't! ;) )
+                        continue
+                    url = get_key_url(e, bucket_name, schema=self.url_schema, versioned=self.versioned)
+                    # Build FileStatus inline from the entry dict
+                    last_modified = e.get('LastModified')
+                    mtime = last_modified.timestamp() if isinstance(last_modified, datetime) else None
+                    url_status = ChecksumFileStatus(
+                        size=e.get('Size'),
+                        mtime=mtime,
+                        filename=e['Key'],
+                        checksum=get_checksum(e['ETag'], 'etag') if e.get('ETag') else None,
+                    )
+                    # generate and pass along the status right away since we can
+                    yield updated(
+                        data,
+                        {
+                            'url': url,
+                            'url_status': url_status,
+                            'filename': filename,
+                            'datalad_action': 'annex',
+                        })
+                    update_versiondb(e)
+                elif e['_type'] == 'delete_marker':
+                    if strategy == 'commit-versions':
+                        # Since git doesn't care about empty directories for us makes sense only
+                        # in the case when DeleteMarker is not pointing to the subdirectory
+                        # and not empty (if original directory was removed)
+                        if filename and not filename.endswith('/'):
+                            yield updated(data, {'filename': filename, 'datalad_action': 'remove'})
+                        else:
+                            # Situation there is much trickier since it seems that "directory"
+                            # could also be a key itself and created/removed which somewhat interferes with
+                            # all our logic here
+                            # For an interesting example see
+                            #  s3://openneuro/ds000217/ds000217_R1.0.0/compressed
+                            lgr.info("Ignoring DeleteMarker for %s", filename)
+
+                    update_versiondb(e)
+                elif e['_type'] == 'prefix':
+                    # so  we were provided a directory (in non-recursive traversal)
+                    assert(not self.recursive)
+                    yield updated(
+                        data,
+                        {
+                            'url': url,
+                            'filename': filename.rstrip('/'),
+                            'datalad_action': 'directory',
+                        }
+                    )
+                else:
+                    raise ValueError("Don't know how to treat %s" % e)
+                e_prev = e
+        finally:
+            if versions_db:
+                # so we know where to pick up from even if interrupted
+                versions_db.save()
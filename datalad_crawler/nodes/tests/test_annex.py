@@ -16,13 +16,16 @@ from unittest.mock import patch
 
 from ..annex import initiate_dataset
 from ..annex import Annexificator
+from datalad.utils import chpwd
 from datalad.utils import swallow_logs
-from datalad.tests.utils_pytest import assert_equal, assert_in
+from datalad.utils import updated
+from datalad.tests.utils_pytest import assert_equal, assert_in, assert_not_in
 from datalad.tests.utils_pytest import assert_raises
 from datalad.tests.utils_pytest import assert_true, assert_false
 from datalad.tests.utils_pytest import with_tree, serve_path_via_http
 from datalad.tests.utils_pytest import ok_file_under_git
 from datalad.tests.utils_pytest import ok_file_has_content
+from datalad.tests.utils_pytest import ok_clean_git
 from datalad.tests.utils_pytest import assert_cwd_unchanged
 from datalad.tests.utils_pytest import put_file_under_git
 from datalad.tests.utils_pytest import skip_if
@@ -30,6 +33,7 @@ from ...pipeline import load_pipeline_from_config
 from datalad_crawler.consts import CRAWLER_META_CONFIG_PATH, DATALAD_SPECIAL_REMOTE, ARCHIVES_SPECIAL_REMOTE
 from datalad.support.stats import ActivityStats
 from datalad.support.annexrepo import AnnexRepo
+from datalad.support.exceptions import AnnexBatchCommandError
 from datalad.support.external_versions import external_versions
 
 import pytest
@@ -200,6 +204,160 @@ def test_annex_file(topdir=None, topurl=None, outdir=None, *, mode):
     assert_equal(output[0]['datalad_stats'], ActivityStats(files=1, add_git=1))
 
 
+@pytest.mark.parametrize("batch_status", (False, True))
+@with_tempfile(mkdir=True)
+def test_annex_batch_status(outdir=None, *, batch_status):
+    annex = Annexificator(path=outdir, batch_status=batch_status,
+                          largefiles="exclude=*.txt")
+    # one file which would not change after being re-added
+    with open(opj(outdir, 'same.txt'), 'w') as f:
+        f.write("same")
+    list(annex({'filename': 'same.txt'}))
+    list(annex.finalize()({}))
+
+    fnames = ['same.txt'] + ['f%d.txt' % i for i in range(5)]
+    for fname in fnames[1:]:
+        with open(opj(outdir, fname), 'w') as f:
+            f.write(fname)
+
+    stats = ActivityStats()
+    status_calls = []
+    get_status = annex._get_status
+
+    def _get_status(*args, **kwargs):
+        status_calls.append((args, kwargs))
+        return get_status(*args, **kwargs)
+
+    with patch.object(annex, '_get_status', _get_status):
+        for fname in fnames:
+            list(annex({'filename': fname, 'datalad_stats': stats}))
+        eq_(len(status_calls), 0 if batch_status else len(fnames))
+        list(annex.finalize()({'datalad_stats': stats}))
+        eq_(len(status_calls), 1 if batch_status else len(fnames))
+    eq_(stats.get_total(), ActivityStats(files=6, add_git=5, skipped=1))
+    assert_false(annex.repo.dirty)
+
+
+@with_tree(tree={'%d.dat' % i: '%d load' % i for i in range(5)})
+@serve_path_via_http()
+@with_tempfile(mkdir=True)
+def test_annex_file_jobs(topdir=None, topurl=None, outdir=None):
+    annex = Annexificator(path=outdir, mode='full', statusdb='json', jobs=2,
+                          largefiles="exclude=0.dat")
+    fnames = sorted('%d.dat' % i for i in range(5))
+    stats = ActivityStats()
+
+    def produce(data):
+        for fname in fnames:
+            yield updated(data, {'url': topurl + fname, 'filename': fname})
+
+    output = list(annex.drain([produce, annex])({'datalad_stats': stats}))
+    # all data is yielded exactly once and in the original order
+    eq_([d['filename'] for d in output], fnames)
+    assert_false(annex._downloads)
+    ok_(annex._executor is None)
+    list(annex.finalize()({'datalad_stats': stats}))
+    total = stats.get_total()
+    total.downloaded_time = 0
+    eq_(total, ActivityStats(files=5, urls=5, downloaded=5, downloaded_size=30,
+                             add_git=1, add_annex=4))
+    for fname in fnames:
+        tfile = opj(outdir, fname)
+        ok_file_has_content(tfile, fname.replace('.dat', ' load'))
+        ok_file_under_git(tfile, annexed=fname != '0.dat')
+        if fname != '0.dat':
+            assert_in(annex.repo.WEB_UUID, annex.repo.whereis(tfile))
+    assert_false(annex.repo.dirty)
+
+    # nothing changed -- nothing should be downloaded again
+    output = list(annex({'url': topurl + '1.dat', 'filename': '1.dat'}))
+    eq_(output, [])
+
+
+@pytest.mark.parametrize("drain", (False, True))
+@pytest.mark.parametrize("skip_problematic", (False, True))
+@with_tree(tree={'%d.dat' % i: '%d load' % i for i in range(3)})
+@serve_path_via_http()
+@with_tempfile(mkdir=True)
+def test_annex_file_retries(topdir=None, topurl=None, outdir=None, *,
+                            skip_problematic, drain):
+    annex = Annexificator(path=outdir, mode='fast', retries=2, retry_delay=0,
+                          skip_problematic=skip_problematic)
+    # 0.dat fails once, 1.dat keeps failing, 2.dat is just fine
+    failures = {'0.dat': 1, '1.dat': 10}
+    add_url_to_file = annex.repo.add_url_to_file
+
+    def _add_url_to_file(fpath, url, **kwargs):
+        if failures.get(fpath):
+            failures[fpath] -= 1
+            raise AnnexBatchCommandError("failed to add %s" % url)
+        return add_url_to_file(fpath, url, **kwargs)
+
+    def produce(data):
+        for fname in ['0.dat', '1.dat', '2.dat']:
+            yield updated(data, {'url': topurl + fname, 'filename': fname})
+
+    def run_annex(data):
+        for data_ in produce(data):
+            for data_out in annex(data_):
+                yield data_out
+
+    stats = ActivityStats()
+    output = []
+
+    def run():
+        # under drain failed ones do not hold up the rest, and get retried
+        # meanwhile.  Otherwise they are retried in place
+        node = annex.drain([produce, annex]) if drain else run_annex
+        for data in node({'datalad_stats': stats}):
+            output.append(data['filename'])
+
+    with patch.object(annex.repo, 'add_url_to_file', _add_url_to_file):
+        if skip_problematic:
+            run()
+        else:
+            assert_raises(AnnexBatchCommandError, run)
+    eq_(failures, {'0.dat': 0, '1.dat': 7})
+    # under drain the failure is raised only after the rest was processed
+    eq_(output, ['0.dat', '2.dat'] if skip_problematic or drain else ['0.dat'])
+    if not skip_problematic:
+        return
+    list(annex.finalize()({'datalad_stats': stats}))
+    ok_file_under_git(opj(outdir, '0.dat'), annexed=True)
+    total = stats.get_total()
+    eq_((total.urls, total.add_annex, total.skipped), (3, 2, 1))
+
+
+@with_tree(tree={'%d.dat' % i: '%d load' % i for i in range(3)})
+@serve_path_via_http()
+@with_tempfile(mkdir=True)
+def test_annex_file_retry_last(topdir=None, topurl=None, outdir=None):
+    annex = Annexificator(path=outdir, mode='fast', retries=2, retry_delay=0)
+    fnames = ['%d.dat' % i for i in range(3)]
+    # the last one fails once, so it is retried only after input is exhausted
+    failures = {'2.dat': 1}
+    add_url_to_file = annex.repo.add_url_to_file
+
+    def _add_url_to_file(fpath, url, **kwargs):
+        if failures.get(fpath):
+            failures[fpath] -= 1
+            raise AnnexBatchCommandError("failed to add %s" % url)
+        return add_url_to_file(fpath, url, **kwargs)
+
+    def produce(data):
+        for fname in fnames:
+            yield updated(data, {'url': topurl + fname, 'filename': fname})
+
+    stats = ActivityStats()
+    with patch.object(annex.repo, 'add_url_to_file', _add_url_to_file):
+        output = list(annex.drain([produce, annex])({'datalad_stats': stats}))
+    eq_(failures, {'2.dat': 0})
+    eq_([d['filename'] for d in output], fnames)
+    list(annex.finalize()({'datalad_stats': stats}))
+    for fname in fnames:
+        ok_file_under_git(opj(outdir, fname), annexed=True)
+
+
 @assert_cwd_unchanged()  # we are passing annex, not chpwd
 @with_tree(tree={'1.tar': {'file.txt': 'load',
                            '1.dat': 'load2'}})
@@ -285,8 +443,76 @@ def test_add_dir_file(repo_path=None, p=None, topurl=None):
     ok_file_under_git(path1, annexed=True)
 
 
-def test_commit_versions():
-    pytest.skip("TODO: is tested only as a part of test_openfmri.py")
+def _commit_versions(repo_path, plumbing, rename):
+    """Stage versioned files, commit them via commit_versions and return history
+
+    History is a list of (message, changes) for the new commits, where
+    changes are as reported by diff-tree, so could be compared across
+    repositories
+    """
+    annex = Annexificator(path=repo_path, create=True)
+    repo = annex.repo
+    nrevs = int(repo.call_git(['rev-list', '--count', 'HEAD']))
+    files = {
+        'f_R1.0.0.txt': 'f 1.0.0',
+        'f_R2.0.0.txt': 'f 2.0.0',
+        'g_R2.0.0.txt': 'g 2.0.0',
+        'h_R1.0.0.txt': 'h 1.0.0',
+    }
+    for fname, content in files.items():
+        with open(opj(repo_path, fname), 'w') as f:
+            f.write(content)
+    repo.add(sorted(files), git=True)
+    stats = ActivityStats(files=len(files), add_git=len(files))
+    # renaming without plumbing operates on paths relative to the repository
+    with chpwd(repo_path), patch.object(repo, 'add', wraps=repo.add) as add:
+        out = list(annex.commit_versions(
+            r'_R(?P<version>\d+[\.\d]*)(?=[\._])',
+            rename=rename,
+            plumbing=plumbing)({'datalad_stats': stats}))
+    eq_(len(out), 2)  # one per version
+    if plumbing:
+        # versions DB is staged only once, upon recording all the versions,
+        # and not for every version committed
+        eq_(add.call_count, 1)
+    ncommits = int(repo.call_git(['rev-list', '--count', 'HEAD'])) - nrevs
+    ok_clean_git(repo_path)
+    return [
+        (repo.call_git(['log', '-1', '--format=%B', 'HEAD~%d' % i]),
+         repo.call_git(['diff-tree', '-r', 'HEAD~%d' % (i + 1), 'HEAD~%d' % i]))
+        for i in reversed(range(ncommits))
+    ]
+
+
+@pytest.mark.parametrize("rename", (False, True))
+@pytest.mark.parametrize("plumbing", (False, True))
+@with_tempfile(mkdir=True)
+def test_commit_versions(repo_path=None, *, plumbing, rename):
+    history = _commit_versions(repo_path, plumbing, rename)
+    eq_(len(history), 2)
+    assert_in("Multi-version commit #1/2: 1.0.0", history[0][0])
+    assert_in("Multi-version commit #2/2: 2.0.0", history[1][0])
+    if rename:
+        eq_(sorted(f for f in listdir(repo_path) if f.endswith('.txt')),
+            ['f.txt', 'g.txt', 'h.txt'])
+        ok_file_has_content(opj(repo_path, 'f.txt'), 'f 2.0.0')
+        ok_file_has_content(opj(repo_path, 'h.txt'), 'h 1.0.0')
+        assert_in('\tf.txt', history[0][1])
+        assert_in('\tg.txt', history[1][1])
+    else:
+        assert_in('\tf_R1.0.0.txt', history[0][1])
+        assert_in('\th_R1.0.0.txt', history[0][1])
+        assert_not_in('f_R2.0.0.txt', history[0][1])
+        assert_in('\tf_R2.0.0.txt', history[1][1])
+
+
+@pytest.mark.parametrize("rename", (False, True))
+@with_tempfile(mkdir=True)
+@with_tempfile(mkdir=True)
+def test_commit_versions_plumbing_same(path1=None, path2=None, *, rename):
+    # the same trees and commit messages
+    eq_(_commit_versions(path1, False, rename),
+        _commit_versions(path2, True, rename))
 
 
 @with_tempfile(mkdir=True)
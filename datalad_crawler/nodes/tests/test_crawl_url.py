@@ -8,15 +8,30 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 # now with some recursive structure of directories
 
+import os
+import threading
+import time
 from glob import glob
 from os.path import exists, join as opj
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+import pytest
+
+from datalad.downloaders.http import HTTPDownloaderSession
+from datalad.support.exceptions import UnhandledRedirectError
+from datalad.support.gitrepo import GitRepo
+from datalad.utils import chpwd
 from datalad.tests.utils_pytest import eq_, ok_
 from datalad.tests.utils_pytest import serve_path_via_http, with_tree
+from datalad.tests.utils_pytest import with_tempfile
 
 from datalad.tests.utils_pytest import skip_if_scrapy_without_selector
 skip_if_scrapy_without_selector()
 
 from ..crawl_url import crawl_url
+from ...consts import CRAWLER_META_DIR
+from ...dbs.pages import PagesCache
 from ..crawl_url import parse_checksums
 from ..matches import a_href_match
 from ...pipeline import run_pipeline
@@ -78,3 +93,207 @@ bcd  d1/f1.txt
     assert_equal(out[1]['path'], 'd1')
     assert_equal(out[1]['filename'], 'f1.txt')
     assert_equal(out[1]['url'], 'http://example.com/subdir/d1/f1.txt')
+
+
+pages_tree = dict(
+    tree=(
+        ('index.html', """<html><body>
+                            <a href="d1/index.html">d1</a>
+                            <a href="d2/index.html">d2</a>
+                            <a href="page1.html">page1</a>
+                          </body></html>"""),
+        ('page1.html', '<html><body><a href="d1/index.html">d1</a></body></html>'),
+        ('d1', (
+            ('index.html', """<html><body>
+                                <a href="p1.html">p1</a>
+                                <a href="p2.html">p2</a>
+                                <a href="../page1.html">page1</a>
+                              </body></html>"""),
+            ('p1.html', '<html><body>p1</body></html>'),
+            ('p2.html', '<html><body>p2</body></html>'),
+        )),
+        ('d2', (
+            ('index.html', """<html><body>
+                                <a href="p3.html">p3</a>
+                                <a href="missing.html">missing</a>
+                              </body></html>"""),
+            ('p3.html', '<html><body>p3</body></html>'),
+        )),
+    )
+)
+
+
+@with_tree(**pages_tree)
+@serve_path_via_http()
+def test_crawl_url_jobs_order(path=None, url=None):
+    def visit(jobs):
+        crawler = crawl_url(url, matchers=[a_href_match('.*')], jobs=jobs)
+        return [d['url'].replace(url, '') for d in crawler()]
+
+    target = ['', 'd1/index.html', 'd1/p1.html', 'd1/p2.html', 'page1.html',
+              'd2/index.html', 'd2/p3.html']
+    eq_(visit(1), target)
+    # concurrent fetching yields in the same order
+    for jobs in (2, 4):
+        eq_(visit(jobs), target)
+
+
+class StubProviders(object):
+    """Serve pages from a dict, keeping track of concurrent requests per host"""
+
+    def __init__(self, pages, redirects):
+        self.pages = pages
+        self.redirects = redirects
+        self.fetched = []
+        self.threads = set()
+        self.active = {}
+        self.max_active = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, url, allow_redirects=True):
+        host = urlsplit(url).netloc
+        with self._lock:
+            self.fetched.append(url)
+            self.threads.add(threading.current_thread())
+            self.active[host] = self.active.get(host, 0) + 1
+            self.max_active[host] = max(self.max_active.get(host, 0), self.active[host])
+        try:
+            time.sleep(0.01)
+            if url in self.redirects:
+                raise UnhandledRedirectError(url=self.redirects[url])
+            return self.pages[url]
+        finally:
+            with self._lock:
+                self.active[host] -= 1
+
+
+@pytest.mark.parametrize("jobs", [1, 6])
+def test_crawl_url_max_per_host(jobs):
+    pages = {
+        'http://a.test/': ''.join(
+            '<a href="http://%s.test/%d">%d</a>' % (host, i, i)
+            for i in range(6) for host in ('a', 'b')),
+    }
+    pages.update({
+        'http://%s.test/%d' % (host, i): 'nothing'
+        for i in range(6) for host in ('a', 'b')
+    })
+    # redirected to a page which is to be visited later
+    redirects = {'http://a.test/1': 'http://b.test/5'}
+    crawler = crawl_url('http://a.test/', matchers=[a_href_match('.*')],
+                        jobs=jobs, max_per_host=2)
+    providers = crawler._providers = StubProviders(pages, redirects)
+    with patch('datalad_crawler.support.providers.load_providers',
+               return_value=providers):
+        urls = [d['url'] for d in crawler()]
+    eq_(urls,
+        ['http://a.test/', 'http://a.test/0', 'http://b.test/0',
+         'http://b.test/5',  # a.test/1 got redirected
+         'http://b.test/1', 'http://a.test/2', 'http://b.test/2',
+         'http://a.test/3', 'http://b.test/3', 'http://a.test/4', 'http://b.test/4',
+         'http://a.test/5'])
+    ok_(max(providers.max_active.values()) <= 2)
+    if jobs > 1:
+        eq_(providers.max_active, {'a.test': 2, 'b.test': 2})
+    # redirect is cached and used upon subsequent visit
+    crawler.reset()
+    eq_([d['url'] for d in crawler.recurse({'url': 'http://a.test/1'})], ['http://b.test/5'])
+    eq_(providers.fetched[-1], 'http://b.test/5')
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_crawl_url_prefetched_seen(jobs):
+    pages = {
+        'http://a.test/': ''.join(
+            '<a href="http://a.test/%d">%d</a>' % (i, i) for i in range(4)),
+    }
+    pages.update({'http://a.test/%d' % i: 'nothing' for i in range(4)})
+    # redirected to a page which gets prefetched before it
+    redirects = {'http://a.test/1': 'http://a.test/3'}
+    crawler = crawl_url('http://a.test/', matchers=[a_href_match('.*')], jobs=jobs)
+    crawler._providers = StubProviders(pages, redirects)
+    thread_providers = []
+
+    def load_providers():
+        providers = StubProviders(pages, redirects)
+        thread_providers.append(providers)
+        return providers
+
+    with patch('datalad_crawler.support.providers.load_providers', load_providers):
+        urls = [d['url'] for d in crawler()]
+    eq_(urls, ['http://a.test/', 'http://a.test/0', 'http://a.test/3', 'http://a.test/2'])
+    # prefetched page which was seen since then is not left behind
+    eq_(crawler._prefetched, {})
+    eq_(crawler._providers.threads, {threading.current_thread()})
+    if jobs > 1:
+        ok_(thread_providers)
+        # pages fetched ahead use providers of their thread
+        for providers in thread_providers:
+            eq_(len(providers.threads), 1)
+        eq_(len(set.union(*(p.threads for p in thread_providers))),
+            len(thread_providers))
+    else:
+        eq_(thread_providers, [])
+
+
+pages_cached = dict(
+    tree=(
+        ('index.html', """<html><body>
+                            <a href="page1.html">page1</a>
+                            <a href="d1">d1</a>
+                          </body></html>"""),
+        ('page1.html', '<html><body>page1</body></html>'),
+        ('d1', (
+            ('index.html', '<html><body>d1</body></html>'),
+        )),
+    )
+)
+
+
+@with_tree(**pages_cached)
+@serve_path_via_http()
+@with_tempfile(mkdir=True)
+def test_crawl_url_cache(path=None, url=None, ds_path=None):
+    GitRepo(ds_path, create=True)
+    os.makedirs(opj(ds_path, CRAWLER_META_DIR))
+
+    def visit(**kwargs):
+        with chpwd(ds_path), \
+                patch.object(HTTPDownloaderSession, 'download', autospec=True,
+                             side_effect=HTTPDownloaderSession.download) as download:
+            crawler = crawl_url(url, matchers=[a_href_match('.*')], **kwargs)
+            pages = [(d['url'].replace(url, ''), d['response']) for d in crawler()]
+        return pages, download.call_count
+
+    pages, ndownloads = visit()
+    eq_([p[0] for p in pages], ['', 'page1.html', 'd1/'])
+    eq_(ndownloads, 3)
+    # cache is not to be committed
+    eq_(GitRepo(ds_path).untracked_files, [])
+
+    # nothing has changed, so no page is transferred again
+    eq_(visit(), (pages, 0))
+    # unless caching is disabled or refresh is requested
+    eq_(visit(cache_pages=False), (pages, 3))
+    eq_(visit(refresh=True), (pages, 3))
+
+    # redirect was stored
+    eq_(PagesCache(ds_path).get_redirect(url + 'd1'), url + 'd1/')
+
+    # a modified page gets transferred
+    page1 = opj(path, 'page1.html')
+    with open(page1, 'w') as f:
+        f.write('<html><body>page1 changed</body></html>')
+    os.utime(page1, (time.time() + 10, time.time() + 10))
+    pages, ndownloads = visit()
+    eq_(ndownloads, 1)
+    eq_(pages[1], ('page1.html', '<html><body>page1 changed</body></html>'))
+
+    # redirect which is no longer valid is not followed
+    cache = PagesCache(ds_path)
+    cache.set_redirect(url + 'page1.html', url + 'gone.html')
+    # content and redirect of the same url do not override each other
+    ok_(cache.get(url + 'page1.html'))
+    eq_(visit(), (pages, 0))
+    eq_(cache.get_redirect(url + 'page1.html'), None)
+    ok_(cache.get(url + 'page1.html'))
@@ -8,10 +8,14 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
 import inspect
+import re
+from unittest.mock import patch
 from datalad.tests.utils_pytest import ok_, eq_, assert_raises
 from datalad.tests.utils_pytest import skip_if_scrapy_without_selector
 skip_if_scrapy_without_selector()
 from ..matches import *
+from datalad.support.network import dlurljoin
+from scrapy.selector import Selector
 import pytest
 
 class sample1:
@@ -118,3 +122,76 @@ def test_a_href_match_pattern3():
     eq_(len(hits), 2)
     eq_([u['url'] for u in hits], ['http://w.buxxxx.com/', 'http://w.buxxxx.com/buga/duga/du'])
     eq_([u['custom'] for u in hits], ['buxx', 'buga'])
+
+
+def test_matchers_share_selector():
+    from .. import matches
+    data = dict(response=sample1.response)
+    matchers = [xpath_match('//a'), css_match('a'), a_href_match('.*'), a_text_match('.*')]
+
+    def nparsed(selector):
+        # not counting selectors for already parsed elements
+        return sum('root' not in c[1] for c in selector.call_args_list)
+
+    with patch.object(matches, 'Selector', wraps=matches.Selector) as selector, \
+            patch.object(matches, '_last_selector', (None, None)):
+        hits = [list(m(dict(data))) for m in matchers]
+        # the page was parsed only once
+        eq_(nparsed(selector), 1)
+        # it is the identity of the content which matters, not its value
+        data['response'] = ''.join(sample1.response)
+        list(matchers[0](data))
+        eq_(nparsed(selector), 2)
+    eq_([len(h) for h in hits], [3, 3, 3, 3])
+    # incoming data is not modified
+    eq_(list(data), ['response'])
+
+    # results are identical to the ones without sharing
+    with patch.object(matches, 'Selector', wraps=matches.Selector) as selector:
+        eq_([list(m(dict(response=''.join(sample1.response)))) for m in matchers],
+            hits)
+        eq_(nparsed(selector), 4)
+
+
+@pytest.mark.parametrize("matcher,query", [
+    (a_href_match, '.*'),
+    (a_href_match, r'.*/(?P<name>[^/]+)\.txt$'),
+    (a_text_match, '.*'),
+    (a_text_match, '(?P<first>[a-z])'),
+])
+def test_a_match_as_xpath(matcher, query):
+    # results must be identical to the ones obtained by querying anchors via xpath
+    response = """<html><body>
+        <a href="d/f1.txt">f1</a>
+        <a href="">empty href</a>
+        <a name="noref">no href</a>
+        <p><a href="/f2.txt"><b>bold</b> tail</a></p>
+        <a href="f3.txt"><!-- comment -->after comment</a>
+        <a href="http://example.com/f4.txt" class="c">  spaced </a>
+        <a href="f5.txt"><img src="i.png"/></a>
+    </body></html>"""
+    data = dict(response=response, url='http://w.example.com/d0/')
+
+    def xpath_extract(data):
+        url_query = re.compile(query)
+        for url_e in Selector(text=data['response']).xpath('//a'):
+            url_href = url_e.xpath('@href').extract_first()
+            if not url_href:
+                continue
+            url = dlurljoin(data['url'], url_href)
+            url_text = url_e.xpath('text()').extract_first()
+            target = url if matcher is a_href_match else url_text
+            if target is None:
+                continue
+            regex = url_query.match(target)
+            if regex:
+                yield dict(data, url=url, url_href=url_href, url_text=url_text,
+                           match=url_e.extract(), **regex.groupdict())
+
+    if matcher is a_text_match:
+        # anchor without any text would not be matched
+        response = response.replace('<a href="f5.txt"><img src="i.png"/></a>', '')
+        data['response'] = response
+    target = list(xpath_extract(data))
+    ok_(len(target) >= 2)
+    eq_(list(matcher(query)(data)), target)
@@ -31,6 +31,7 @@ from ..misc import rename
 from ..misc import debug
 from ..misc import Sink
 from ..misc import fix_url
+from ..misc import prefetch_url_status
 from ...pipeline import FinishPipeline
 from datalad.tests.utils_pytest import with_tree
 from datalad.utils import updated
@@ -46,7 +47,7 @@ from datalad.tests.utils_pytest import swallow_logs
 
 import logging
 
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
 
@@ -473,6 +474,51 @@ def test_debug(msg, args):
             cml.assert_logged(msg, level='INFO')
 
 
+@pytest.mark.parametrize("as_pipeline", (False, True))
+def test_prefetch_url_status(as_pipeline):
+    produced = []
+
+    def node(data):
+        for i in range(6):
+            produced.append(i)
+            out = {'url': 'http://example.com/%d' % i, 'i': i}
+            if i == 3:
+                out['url_status'] = 'given'
+            elif i == 4:
+                del out['url']
+            yield out
+
+    def get_status(url):
+        if url.endswith('/5'):
+            raise IOError("failed")
+        return url.upper()
+
+    loaded = []
+
+    def load_providers():
+        providers = MagicMock()
+        providers.get_provider.return_value.get_downloader.return_value \
+            .get_status.side_effect = get_status
+        loaded.append(providers)
+        return providers
+
+    with patch('datalad_crawler.support.providers.load_providers', load_providers):
+        prefetch = prefetch_url_status(
+            [{'output': 'outputs'}, node] if as_pipeline else node,
+            jobs=2, lookahead=3)
+        gen = prefetch({})
+        first = next(gen)
+        # statuses are requested ahead
+        eq_(produced, list(range(4)))
+        out = [first] + list(gen)
+    eq_([d['i'] for d in out], list(range(6)))
+    eq_([d.get('url_status') for d in out],
+        ['HTTP://EXAMPLE.COM/%d' % i for i in range(3)] + ['given', None, None])
+    # every thread of the pool uses its own providers
+    ok_(1 <= len(loaded) <= 2)
+    eq_(sum(p.get_provider.call_count for p in loaded), 4)
+
+
 def test_fix_url():
     eq_(list(fix_url({'url': "http://site/u r"})), [{'url': "http://site/u%20r"}])
     eq_(list(fix_url({'url': "http://site/ur "})), [{'url': "http://site/ur%20"}]) # trailing spaces are still spaces
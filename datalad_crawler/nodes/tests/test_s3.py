@@ -9,9 +9,21 @@
 # now with some recursive structure of directories
 
 import logging
+import random
+import time
+from itertools import islice
+import pytest
+from datetime import datetime, timedelta, timezone
 from ..s3 import crawl_s3
 from ..s3 import _strip_prefix
 from ..s3 import get_key_url
+from ..s3 import _sort_key
+from ..s3 import _sorted_entries
+from ..s3 import _skip_processed
+from ..s3 import _drop_older
+from ..s3 import _list_bucket
+from ..s3 import _iter_ordered
+from .utils import StubS3Client
 
 from ..misc import switch
 from ..annex import Annexificator
@@ -22,7 +34,7 @@ from datalad.support.stats import ActivityStats
 from datalad.utils import swallow_logs
 from datalad.utils import rmtree
 
-from datalad.tests.utils_pytest import eq_
+from datalad.tests.utils_pytest import eq_, ok_
 from datalad.tests.utils_pytest import assert_not_equal
 from datalad.tests.utils_pytest import assert_in, assert_not_in
 from datalad.tests.utils_pytest import skip_if_no_network
@@ -228,3 +240,148 @@ def test_get_key_url():
     entry = {'Key': 'e', 'VersionId': '123'}
     eq_(get_key_url(entry, 'bucket'), 'http://bucket.s3.amazonaws.com/e?versionId=123')
     eq_(get_key_url(entry, 'bucket', versioned=False), 'http://bucket.s3.amazonaws.com/e')
+
+
+def _gen_entries(n, seed=0):
+    rng = random.Random(seed)
+    t0 = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            '_type': rng.choice(['version', 'version', 'delete_marker']),
+            'Key': 'd%d/f%d' % (rng.randint(0, 3), rng.randint(0, 20)),
+            # plenty of collisions in time to exercise the rest of sorting key
+            'LastModified': t0 + timedelta(seconds=rng.randint(0, 10)),
+            'IsLatest': rng.choice([True, False]),
+            'VersionId': 'v%d' % i,
+        }
+        for i in range(n)
+    ]
+
+
+def test_sorted_entries():
+    entries = _gen_entries(100)
+    target = sorted(entries, key=_sort_key)
+    eq_(list(_sorted_entries(iter(entries))), target)
+    for max_in_memory in (1, 7, 100, 1000):
+        eq_(list(_sorted_entries(iter(entries), max_in_memory=max_in_memory)),
+            target)
+    eq_(list(_sorted_entries([], max_in_memory=10)), [])
+
+
+def test_skip_processed():
+    entries = sorted(_gen_entries(20), key=_sort_key)
+
+    def version(e):
+        return {
+            'last-modified': e['LastModified'].strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'name': e['Key'],
+            'version-id': e['VersionId']}
+
+    for i in (0, 10, 19):
+        stats = ActivityStats()
+        eq_(list(_skip_processed(iter(entries), version(entries[i]), stats)),
+            entries[i + 1:])
+        eq_(stats.skipped, i + 1)
+
+    # recorded version is no longer there but everything is older
+    prev = version(entries[-1])
+    prev['version-id'] = 'gone'
+    stats = ActivityStats()
+    eq_(list(_skip_processed(entries, prev, stats)), [])
+    eq_(stats.skipped, 20)
+
+
+def test_drop_older():
+    entries = _gen_entries(50, seed=1)
+    sorted_entries = sorted(entries, key=_sort_key)
+    for e in sorted_entries[7::7]:
+        prev = {
+            'last-modified': e['LastModified'].strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'name': e['Key'],
+            'version-id': e['VersionId']}
+        stats, stats_dropped = ActivityStats(), ActivityStats()
+        dropped = list(_drop_older(entries, prev, stats_dropped))
+        assert len(dropped) < len(entries)
+        # the same result as if we did not drop anything in advance
+        eq_(list(_skip_processed(_sorted_entries(dropped), prev, stats_dropped)),
+            list(_skip_processed(sorted_entries, prev, stats)))
+        eq_(stats_dropped, stats)
+
+
+@pytest.mark.parametrize("versioned", [False, True])
+def test_list_bucket_sharded(versioned):
+    keys = ['top%d' % i for i in range(3)] + [
+        'd%d/s%d/f%d' % (i, j, k)
+        for i in range(5) for j in range(3) for k in range(4)
+    ]
+    client = StubS3Client(keys, page_size=7)
+
+    def list_keys(**kwargs):
+        entries = list(
+            _list_bucket(client, 'bucket', kwargs.pop('prefix', None),
+                         versioned, True, **kwargs))
+        assert all(e['_type'] == 'version' for e in entries)
+        return [e['Key'] for e in entries]
+
+    target = sorted(keys)
+    eq_(list_keys(), target)
+    eq_(list_keys(jobs=1), target)
+    nrequests = client.requests
+    for jobs in (2, 10):
+        out = list_keys(jobs=jobs)
+        # top level entries come first, and then all shards in order
+        eq_(out, target[-3:] + target[:-3])
+    eq_(list_keys(split_points=['d2/s1/f3', 'd0', 'zzz']), target)
+    eq_(list_keys(jobs=3, split_points=['d1/', 'd3/s2']), target)
+    # shards listed ahead are buffered only up to max_in_memory
+    eq_(list_keys(jobs=3, max_in_memory=4), target[-3:] + target[:-3])
+    eq_(list_keys(prefix='d1/', jobs=2),
+        [k for k in target if k.startswith('d1/')])
+    assert client.requests > nrequests
+
+    # no sharding for non-recursive listing
+    entries = list(_list_bucket(client, 'bucket', None, versioned, False, jobs=4))
+    eq_(sorted((e['_type'], e['Key']) for e in entries),
+        [('prefix', 'd%d/' % i) for i in range(5)] +
+        [('version', 'top%d' % i) for i in range(3)])
+
+
+def test_iter_ordered():
+    produced = {}
+
+    def produce(i):
+        for j in range(100):
+            produced[i] = j + 1
+            if (i, j) == (3, 50):
+                raise ValueError("listing failed")
+            yield i, j
+
+    out = _iter_ordered(produce, range(3), jobs=2, buffer=6, chunk_size=3)
+    eq_(list(islice(out, 10)), [(0, j) for j in range(10)])
+    time.sleep(0.1)
+    # shards listed ahead are not consumed much further than the buffer
+    ok_(produced[0] <= 12 + 6 + 3 + 1)
+    ok_(produced[1] <= 6 + 3 + 1)
+    assert_not_in(2, produced)
+    eq_(list(out), [(0, j) for j in range(10, 100)] +
+        [(i, j) for i in (1, 2) for j in range(100)])
+    # listing ahead is not waited for if the consumer is done
+    produced.clear()
+    out = _iter_ordered(produce, range(10), jobs=3, buffer=5, chunk_size=5)
+    eq_(next(out), (0, 0))
+    out.close()
+    ok_(len(produced) <= 3)
+    # failures are raised in order
+    with pytest.raises(ValueError):
+        for i, j in _iter_ordered(produce, range(5), jobs=2):
+            ok_(i < 3 or j < 50)
+
+
+def test_sorted_entries_multiple_versions():
+    client = StubS3Client(['a', 'b/c', 'd'], nversions=3)
+    entries = list(_sorted_entries(_list_bucket(client, 'bucket', None, True, True)))
+    eq_(len(entries), 9)
+    # older versions of all the keys come before the latest ones
+    eq_([e['Key'] for e in entries[-3:]], ['a', 'b/c', 'd'])
+    ok_(all(e['IsLatest'] for e in entries[-3:]))
+    ok_(not any(e['IsLatest'] for e in entries[:-3]))
@@ -0,0 +1,102 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Helpers for testing nodes"""
+
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+
+
+class StubS3Client(object):
+    """A minimal stand-in for a boto3 S3 client to list a static set of keys
+
+    Only paginators for list_objects_v2 and list_object_versions are provided,
+    and every key has `nversions` versions (the latest one listed first).
+    `latency` (in seconds) gets added to every page request.
+    """
+
+    def __init__(self, keys, page_size=1000, latency=0, nversions=1):
+        self.keys = sorted(keys)
+        self.page_size = page_size
+        self.latency = latency
+        self.nversions = nversions
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def get_paginator(self, operation):
+        assert operation in ('list_objects_v2', 'list_object_versions')
+        return _StubPaginator(self, operation == 'list_object_versions')
+
+    def _entry(self, i, versioned, version=0):
+        latest = self.nversions - 1
+        entry = {
+            'Key': self.keys[i],
+            'LastModified': datetime(2020, 1, 1, tzinfo=timezone.utc)
+                            + timedelta(days=version - latest, seconds=i % 86400),
+            'Size': (i + version) % 1000,
+        }
+        if versioned:
+            entry.update({'VersionId': 'v%d' % i if version == latest else 'v%d.%d' % (i, version),
+                          'IsLatest': version == latest})
+        return entry
+
+    def _page(self, indexes, prefixes, versioned):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if versioned:
+            entries = [self._entry(i, versioned, v)
+                       for i in indexes
+                       for v in reversed(range(self.nversions))]
+        else:
+            entries = [self._entry(i, versioned, self.nversions - 1) for i in indexes]
+        page = {'CommonPrefixes': [{'Prefix': p} for p in prefixes]}
+        if versioned:
+            page.update({'Versions': entries, 'DeleteMarkers': []})
+        else:
+            page['Contents'] = entries
+        return page
+
+
+class _StubPaginator(object):
+
+    def __init__(self, client, versioned):
+        self._client = client
+        self._versioned = versioned
+
+    def paginate(self, Bucket, Prefix='', Delimiter=None,
+                 StartAfter=None, KeyMarker=None):
+        client = self._client
+        keys = client.keys
+        i = bisect_left(keys, Prefix)
+        marker = StartAfter or KeyMarker
+        if marker:
+            i = max(i, bisect_right(keys, marker))
+        indexes, prefixes = [], []
+        npages = 0
+        while i < len(keys) and keys[i].startswith(Prefix):
+            key = keys[i]
+            d = key.find(Delimiter, len(Prefix)) if Delimiter else -1
+            if d >= 0:
+                common_prefix = key[:d + len(Delimiter)]
+                prefixes.append(common_prefix)
+                # jump past all the keys under that common prefix
+                i = bisect_left(keys, common_prefix[:-1] + chr(ord(common_prefix[-1]) + 1))
+            else:
+                indexes.append(i)
+                i += 1
+            if len(indexes) + len(prefixes) >= client.page_size:
+                yield client._page(indexes, prefixes, self._versioned)
+                npages += 1
+                indexes, prefixes = [], []
+        if indexes or prefixes or not npages:
+            # there is always at least a single (possibly empty) page
+            yield client._page(indexes, prefixes, self._versioned)
@@ -15,6 +15,11 @@ a shallow copy of original dict).  For a node to be parametrized it should be
 implemented as a callable (i.e. define __call__) class, which could obtain parameters
 in its constructor.
 
+If `datalad.crawl.pipeline.layered` configuration variable is set, the pipeline
+runner provides `data` as a `LayeredDict`, so those copies (e.g. via `.copy()` or
+`datalad.utils.updated`) do not copy all the items.  It pays off only for records
+with many (thousands of) items.
+
 TODO:  describe   PIPELINE_OPTS  and how to specify them for a given (sub-)pipeline.
 
 The `data` dictionary is used primarily to carry the scraped/produced data, but besides that
@@ -48,6 +53,7 @@ somewhat similar loose/flexible pipelining in Python approaches
 - https://github.com/freeman-lab/pipeit
 """
 
+import logging
 import sys
 from glob import glob
 from os.path import dirname, join as opj, isabs, exists, curdir, basename
@@ -55,6 +61,8 @@ from os import makedirs
 
 from datalad_crawler.consts import CRAWLER_META_DIR, HANDLE_META_DIR, CRAWLER_META_CONFIG_PATH
 from datalad_crawler.consts import CRAWLER_META_CONFIG_FILENAME
+from datalad_crawler.support.data import LayeredDict
+from datalad_crawler.support.profiler import PipelineProfiler, get_active_profiler
 from datalad.utils import updated
 from datalad.utils import get_dataset_root
 from datalad.dochelpers import exc_str
@@ -62,6 +70,7 @@ from datalad.support.gitrepo import GitRepo
 from datalad.support.network import parse_url_opts
 from datalad.support.stats import ActivityStats
 from datalad.support.exceptions import PipelineNotSpecifiedError
+from datalad import cfg
 from configparser import ConfigParser
 
 from logging import getLogger
@@ -136,15 +145,157 @@ def _get_pipeline_opts(pipeline):
     return opts, pipeline
 
 
-def xrun_pipeline(pipeline, data=None, stats=None, reset=True):
+def _get_pipeline_output(opts):
+    """Verify pipeline options and return output mode to be used for its steps
+    """
+    # verify that we know about all specified options
+    unknown_opts = set(opts).difference(set(PIPELINE_OPTS))
+    if unknown_opts:
+        raise ValueError("Unknown pipeline options %s" % str(unknown_opts))
+
+    output = opts['output']
+    if output not in ('input',  'last-output', 'outputs', 'input+outputs'):
+        raise ValueError("Unknown output=%r" % output)
+
+    if opts['loop'] and output == 'input':
+        lgr.debug("Assigning output='last-output' for sub-pipeline since we want "
+                  "to loop until pipeline returns anything")
+        return 'last-output'
+    return output
+
+
+# plans of the (top-level) pipelines being ran
+_active_plans = []
+
+
+class InstrumentationPlan(object):
+    """What (and at which level) to log while running a pipeline
+
+    Decided once per run of a (top-level) pipeline and shared with all nested
+    pipelines and steps, so per-item processing does not need to query the
+    logger for the effective level, and node labels (which could be
+    expensive to produce, e.g. via `auto_repr`) are computed only if
+    they are going to be logged (or profiled), and only once per node.
+    Configuration of the engine is resolved at the same point.
+
+    While a pipeline runs, its plan is active (see `get_active_plan`), so
+    pipelines ran by its nodes (e.g. `switch`) share it as well.
+    """
+
+    __slots__ = ('log_level', 'debug', 'profiler', 'engine', 'layered', '_labels')
+
+    def __init__(self, log_level=None):
+        self.log_level = lgr.getEffectiveLevel() if log_level is None else log_level
+        self.debug = self.log_level <= logging.DEBUG
+        self.profiler = get_active_profiler()
+        self.engine = cfg.obtain('datalad.crawl.pipeline.engine', default='recursive')
+        self.layered = cfg.getbool('datalad.crawl.pipeline', 'layered', default=False)
+        self._labels = {}
+
+    def run_active(self, gen):
+        """Yield from the generator of the pipeline, keeping the plan active
+
+        The plan is active only while the generator runs, and not while
+        its output is consumed
+        """
+        while True:
+            _active_plans.append(self)
+            try:
+                data_out = next(gen)
+            except StopIteration:
+                return
+            finally:
+                _active_plans.remove(self)
+            yield data_out
+
+    def run_node(self, node, data):
+        """Run node on data, profiling it if profiler is active"""
+        if self.profiler is None:
+            return node(data)
+        return self.profiler.run(node, data, label=self.label)
+
+    def enabled(self, level):
+        return self.log_level <= level
+
+    def label(self, node):
+        """Return (cached) label of the node to be used in log messages"""
+        # nodes are alive for the duration of the run, so id is sufficient
+        # and does not require nodes to be hashable
+        key = id(node)
+        try:
+            return self._labels[key]
+        except KeyError:
+            label = self._labels[key] = _get_node_str(node)
+            return label
+
+
+def get_active_plan():
+    """Return plan of the pipeline which is currently ran, or None"""
+    return _active_plans[-1] if _active_plans else None
+
+
+def _get_plan(plan):
+    """Return the given plan, or the active one, or a new one if none is active"""
+    if plan is None:
+        plan = get_active_plan() or InstrumentationPlan()
+    return plan
+
+
+def _get_node_str(node):
+    try:
+        return node._custom_str
+    except AttributeError:
+        return str(node)
+
+
+def xrun_pipeline(pipeline, data=None, stats=None, reset=True, engine=None,
+                  profile=None, _plan=None):
     """Yield results from the pipeline.
 
+    Parameters
+    ----------
+    engine: {'recursive', 'iterative'}, optional
+      Which engine to use to run the pipeline steps.  'recursive' runs
+      them via (recursive) `xrun_pipeline_steps`, whenever 'iterative' compiles
+      the pipeline into flat lists of steps once and runs them using
+      `xrun_compiled_steps`.  If not specified, `datalad.crawl.pipeline.engine`
+      configuration variable is consulted (default: 'recursive').
+    profile: str, optional
+      Filename to save (as JSON) the profile of the pipeline nodes to,
+      which is also logged as a table at the end.  If not specified,
+      `datalad.crawl.pipeline.profile` configuration variable is consulted.
+      Ignored if the pipeline is ran while some other pipeline is being
+      profiled already, since then it gets profiled as a part of it.
     """
-    id_pipeline = "Pipe #%s" % id(pipeline)
+    # not a nested pipeline ran by the engine itself
+    outer = _plan is None
+    if outer and profile is None:
+        # might be ran by a node of the pipeline being ran
+        _plan = get_active_plan()
+    if _plan is None:
+        if get_active_profiler() is None:
+            if profile is None:
+                profile = cfg.get('datalad.crawl.pipeline.profile', None)
+            if profile:
+                for data_out in _xrun_profiled(
+                        profile, pipeline, data=data, stats=stats, reset=reset,
+                        engine=engine):
+                    yield data_out
+                return
+        plan = InstrumentationPlan()
+        for data_out in plan.run_active(_xrun_pipeline(
+                pipeline, data, stats, reset, engine, plan, outer)):
+            yield data_out
+        return
 
-    def _log(msg, *args):
-        """Helper for uniform debug messages"""
-        lgr.log(5, "%s: " + msg, id_pipeline, *args)
+    for data_out in _xrun_pipeline(
+            pipeline, data, stats, reset, engine, _plan, outer):
+        yield data_out
+
+
+def _xrun_pipeline(pipeline, data, stats, reset, engine, plan, outer):
+    """Actual body of `xrun_pipeline`, ran with an already decided plan"""
+    _log = _get_pipeline_log(plan, id(pipeline))
 
     _log("%s", pipeline)
 
@@ -155,6 +306,9 @@ def xrun_pipeline(pipeline, data=None, stats=None, reset=True):
     # just for paranoids and PEP8-disturbed, since theoretically every node
     # should not change the data, so having default {} should be sufficient
     data = data or {}
+    if outer and plan.layered and not isinstance(data, LayeredDict):
+        # so nodes could derive their records from it without copying all items
+        data = LayeredDict(data)
 
     if 'datalad_stats' in data:
         if stats is not None:
@@ -165,33 +319,69 @@ def xrun_pipeline(pipeline, data=None, stats=None, reset=True):
     if not len(pipeline):
         return
 
-    # options for this pipeline
-    opts, pipeline = _get_pipeline_opts(pipeline)
+    if engine is None:
+        engine = plan.engine
 
-    # verify that we know about all specified options
-    unknown_opts = set(opts).difference(set(PIPELINE_OPTS))
-    if unknown_opts:
-        raise ValueError("Unknown pipeline options %s" % str(unknown_opts))
+    if engine == 'recursive':
+        # options for this pipeline
+        opts, pipeline = _get_pipeline_opts(pipeline)
+        output_sub = _get_pipeline_output(opts)
 
-    data_to_process = [data]
-    output = opts['output']
-    if output not in ('input',  'last-output', 'outputs', 'input+outputs'):
-        raise ValueError("Unknown output=%r" % output)
+        def run_steps(data_in):
+            return xrun_pipeline_steps(pipeline, data_in, output=output_sub, _plan=plan)
+    elif engine == 'iterative':
+        compiled = compile_pipeline(pipeline)
+        opts = compiled.opts
 
-    if opts['loop'] and output == 'input':
-        lgr.debug("Assigning output='last-output' for sub-pipeline since we want "
-                  "to loop until pipeline returns anything")
-        output_sub = 'last-output'
+        def run_steps(data_in):
+            return xrun_compiled_steps(compiled, data_in, _plan=plan)
     else:
-        output_sub = output
+        raise ValueError("Unknown pipeline engine=%r" % engine)
+
+    for data_out in _xrun_pipeline_loop(run_steps, data, opts, _log, plan):
+        yield data_out
+
+
+def _xrun_profiled(profile, *args, **kwargs):
+    """Run xrun_pipeline while profiling it, and report the profile at the end"""
+    profiler = PipelineProfiler()
+    try:
+        with profiler:
+            for data_out in xrun_pipeline(*args, **kwargs):
+                yield data_out
+    finally:
+        profiler.save(profile)
+        lgr.info("Profile of the pipeline nodes (saved to %s):\n%s",
+                 profile, profiler.as_table())
+
+
+def _get_pipeline_log(plan, pipeline_id):
+    """Return helper for uniform debug messages about the pipeline"""
+    if not plan.enabled(5):
+        return lambda msg, *args: None
+    id_pipeline = "Pipe #%s" % pipeline_id
+
+    def _log(msg, *args):
+        """Helper for uniform debug messages"""
+        lgr.log(5, "%s: " + msg, id_pipeline, *args)
+    return _log
+
+
+def _xrun_pipeline_loop(run_steps, data, opts, _log, plan):
+    """Feed data (and possibly its outputs if looping) through pipeline steps
 
-    log_level = lgr.getEffectiveLevel()
+    Handles `loop` and `output` options of the pipeline, and stops whenever
+    FinishPipeline is raised.
+    """
+    output = opts['output']
+    data_to_process = [data]
+    log_level = plan.log_level
     data_out = None
     while data_to_process:
         _log("processing data. %d left to go", len(data_to_process))
         data_in = data_to_process.pop(0)
         try:
-            for idata_out, data_out in enumerate(xrun_pipeline_steps(pipeline, data_in, output=output_sub)):
+            for idata_out, data_out in enumerate(run_steps(data_in)):
                 if log_level <= 3:
                         # provide details of what keys got changed
                         # TODO: unify with 2nd place where it was invoked
@@ -225,7 +415,7 @@ def xrun_pipeline(pipeline, data=None, stats=None, reset=True):
         yield data
 
 
-def xrun_pipeline_steps(pipeline, data, output='input'):
+def xrun_pipeline_steps(pipeline, data, output='input', _plan=None):
     """Actually run pipeline steps, feeding yielded results to the next node
     and yielding results back.
 
@@ -237,12 +427,15 @@ def xrun_pipeline_steps(pipeline, data, output='input'):
     if not len(pipeline):
         return
 
+    plan = _get_plan(_plan)
+    log_level = plan.log_level
     node, pipeline_tail = pipeline[0], pipeline[1:]
 
     if isinstance(node, (list, tuple)):
-        lgr.debug("Pipe: %s" % str(node))
+        if plan.debug:
+            lgr.debug("Pipe: %s" % str(node))
         # we have got a step which is yet another entire pipeline
-        pipeline_gen = xrun_pipeline(node, data, reset=False)
+        pipeline_gen = xrun_pipeline(node, data, reset=False, engine='recursive', _plan=plan)
         if pipeline_gen:
             # should be similar to as running a node
             data_in_to_loop = pipeline_gen
@@ -256,15 +449,11 @@ def xrun_pipeline_steps(pipeline, data, output='input'):
         # since it is done below at the node level
     else:  # it is a "node" which should generate (or return) us an iterable to feed
         # its elements into the rest of the pipeline
-        try:
-            node_str = node._custom_str
-        except AttributeError:
-            node_str = str(node)
-        lgr.debug("Node: %s", node_str)
+        if plan.debug:
+            lgr.debug("Node: %s", plan.label(node))
         prev_stats = data.get('datalad_stats', None)  # so we could check if the node doesn't dump it
-        data_in_to_loop = node(data)
+        data_in_to_loop = plan.run_node(node, data)
 
-    log_level = lgr.getEffectiveLevel()
     data_out = None
     if data_in_to_loop:
         for data_ in data_in_to_loop:
@@ -281,9 +470,10 @@ def xrun_pipeline_steps(pipeline, data, output='input'):
                 stats_str = data_['datalad_stats'].as_str(mode='line') if 'datalad_stats' in data_ else ''
                 lgr.log(4, "O1: +%s, -%s, ch%s, ch?%s %s", *(_compare_dicts(data, data_) + (stats_str,)))
             if pipeline_tail:
-                lgr.log(7, " pass %d keys into tail with %d elements", len(data_), len(pipeline_tail))
-                lgr.log(5, " passed keys: %s", data_.keys())
-                for data_out in xrun_pipeline_steps(pipeline_tail, data_, output=output):
+                if log_level <= 7:
+                    lgr.log(7, " pass %d keys into tail with %d elements", len(data_), len(pipeline_tail))
+                    lgr.log(5, " passed keys: %s", data_.keys())
+                for data_out in xrun_pipeline_steps(pipeline_tail, data_, output=output, _plan=plan):
                     if log_level <= 3:
                         # provide details of what keys got changed
                         # TODO: difference from previous stats!
@@ -302,6 +492,146 @@ def xrun_pipeline_steps(pipeline, data, output='input'):
         yield data_out
 
 
+class CompiledPipeline(object):
+    """Pipeline "compiled" into a flat list of steps, to be ran by `xrun_compiled_steps`
+
+    Options of the pipeline are verified and nested pipelines get compiled
+    only once, so there is no need to repeat that for every processed item.
+    """
+
+    __slots__ = ('id', 'opts', 'output', 'steps')
+
+    def __init__(self, pipeline):
+        self.id = id(pipeline)
+        self.opts, pipeline = _get_pipeline_opts(pipeline)
+        self.output = _get_pipeline_output(self.opts)
+        # (node, nested compiled pipeline or None)
+        self.steps = tuple(
+            (node, compile_pipeline(node) if isinstance(node, PIPELINE_TYPES) else None)
+            for node in pipeline
+        )
+
+    def __repr__(self):
+        return "<%s Pipe #%s: %d steps>" % (self.__class__.__name__, self.id, len(self.steps))
+
+
+def compile_pipeline(pipeline):
+    """Compile pipeline (with all its nested pipelines) into a CompiledPipeline
+
+    Returns None for an empty pipeline, which would not produce anything
+    """
+    if not len(pipeline):
+        return None
+    return CompiledPipeline(pipeline)
+
+
+def _xrun_compiled(compiled, data, plan):
+    """Equivalent of `xrun_pipeline(reset=False)` for a compiled nested pipeline"""
+    if compiled is None:
+        return
+
+    if 'datalad_stats' not in data:
+        data = updated(data, {'datalad_stats': ActivityStats()})
+
+    for data_out in _xrun_pipeline_loop(
+            lambda data_in: xrun_compiled_steps(compiled, data_in, _plan=plan),
+            data, compiled.opts, _get_pipeline_log(plan, compiled.id), plan):
+        yield data_out
+
+
+class _Frame(object):
+    """State of a single step in `xrun_compiled_steps` stack"""
+
+    __slots__ = ('istep', 'data_in', 'data_in_to_loop', 'prev_stats', 'data_out')
+
+    def __init__(self, istep, data_in, data_in_to_loop, prev_stats):
+        self.istep = istep
+        self.data_in = data_in
+        self.data_in_to_loop = data_in_to_loop
+        self.prev_stats = prev_stats
+        self.data_out = None
+
+
+def xrun_compiled_steps(compiled, data, _plan=None):
+    """Run steps of a compiled pipeline, feeding yielded results to the next node
+    and yielding results back.
+
+    Non-recursive equivalent of `xrun_pipeline_steps`: instead of a chain
+    of generators (one per step) an explicit stack of frames is maintained,
+    so the overhead per item does not grow with the depth of the pipeline.
+    """
+    steps = compiled.steps
+    nsteps = len(steps)
+    if not nsteps:
+        return
+    output = compiled.output
+    yield_outputs = 'outputs' in output
+    last_output = output == 'last-output'
+    plan = _get_plan(_plan)
+    log_level = plan.log_level
+
+    stack = []
+
+    def push(istep, data_):
+        node, nested = steps[istep]
+        if isinstance(node, PIPELINE_TYPES):
+            if plan.debug:
+                lgr.debug("Pipe: %s" % str(node))
+            # should be similar to as running a node
+            data_in_to_loop = _xrun_compiled(nested, data_, plan)
+            prev_stats = None  # stats are checked at the node level
+        else:
+            if plan.debug:
+                lgr.debug("Node: %s", plan.label(node))
+            prev_stats = data_.get('datalad_stats', None)
+            data_in_to_loop = plan.run_node(node, data_)
+        if data_in_to_loop:
+            stack.append(_Frame(istep, data_, iter(data_in_to_loop), prev_stats))
+        elif istep < nsteps - 1:
+            lgr.warning("%s returned None, although there is still a tail in the pipeline" % node)
+
+    push(0, data)
+    while stack:
+        frame = stack[-1]
+        try:
+            data_ = next(frame.data_in_to_loop)
+        except StopIteration:
+            stack.pop()
+            if last_output and frame.data_out:
+                if stack:
+                    stack[-1].data_out = frame.data_out
+                else:
+                    yield frame.data_out
+            continue
+
+        prev_stats = frame.prev_stats
+        if prev_stats is not None:
+            new_stats = data_.get('datalad_stats', None)
+            if new_stats is None or new_stats is not prev_stats:
+                lgr.debug("Node %s has changed stats to %s from %s. Updating and using previous one",
+                          steps[frame.istep][0], prev_stats, new_stats)
+                if new_stats is not None:
+                    prev_stats += new_stats
+                data_['datalad_stats'] = prev_stats
+        if log_level <= 4:
+            # provide details of what keys got changed
+            stats_str = data_['datalad_stats'].as_str(mode='line') if 'datalad_stats' in data_ else ''
+            lgr.log(4, "O1: +%s, -%s, ch%s, ch?%s %s", *(_compare_dicts(frame.data_in, data_) + (stats_str,)))
+
+        if frame.istep < nsteps - 1:
+            if log_level <= 7:
+                lgr.log(7, " pass %d keys into tail with %d elements", len(data_), nsteps - frame.istep - 1)
+                lgr.log(5, " passed keys: %s", data_.keys())
+            push(frame.istep + 1, data_)
+        else:
+            frame.data_out = data_
+            if yield_outputs:
+                if log_level <= 3:
+                    stats_str = data_['datalad_stats'].as_str(mode='line') if 'datalad_stats' in data_ else ''
+                    lgr.log(3, "O2: +%s, -%s, ch%s, ch?%s %s", *(_compare_dicts(data, data_) + (stats_str,)))
+                yield data_
+
+
 def _compare_dicts(d1, d2):
     """Given two dictionaries, return what keys were added, removed, changed or might be changed
     """
@@ -90,7 +90,8 @@ def pipeline(url=None,
         ]
         if rename:
             incoming_pipeline += [sub({'filename': get_replacement_dict(rename)})]
-        incoming_pipeline += [annex]
+        # so data for files downloaded concurrently gets yielded as well
+        incoming_pipeline = [annex.drain(incoming_pipeline + [annex])]
     else:
         # no URL -- nothing to crawl -- but then should have been provided
         assert incoming_pipeline
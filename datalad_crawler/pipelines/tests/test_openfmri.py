@@ -49,6 +49,7 @@ from datalad.tests.utils_pytest import (
     ok_clean_git,
     ok_file_has_content,
     ok_file_under_git,
+    patch_config,
     serve_path_via_http,
     skip_if,
     skip_if_no_module,
@@ -62,6 +63,7 @@ from .. import openfmri
 from ..openfmri import pipeline as ofpipeline
 
 import logging
+import pytest
 from logging import getLogger
 lgr = getLogger('datalad.crawl.tests')
 
@@ -243,6 +245,7 @@ def test_openfmri_addperms(ind=None, topurl=None, outd=None, clonedir=None):
 
 
 @integration
+@pytest.mark.parametrize("plumbing", (False, True))
 @with_tree(tree={
     'ds666': {
         # there could also be a case of a file with "unique" name without versioned counterpart
@@ -269,7 +272,9 @@ def test_openfmri_addperms(ind=None, topurl=None, outd=None, clonedir=None):
 @skip_if('2.20.1' <= external_versions['cmd:system-git'] < '2.23.0',
          msg="Skip since system git is %s (underlying issue remains unresolved mystery)"
              % external_versions['cmd:system-git'])
-def test_openfmri_pipeline1(ind=None, topurl=None, outd=None, clonedir=None):
+def test_openfmri_pipeline1(ind=None, topurl=None, outd=None, clonedir=None, *, plumbing):
+    # multi-version commits must come out the same with and without plumbing
+    plumbing_config = {'datalad.crawl.commit_versions.plumbing': str(plumbing)}
     index_html = opj(ind, 'ds666', 'index.html')
 
     list(initiate_dataset(
@@ -290,7 +295,7 @@ def test_openfmri_pipeline1(ind=None, topurl=None, outd=None, clonedir=None):
     # --amend so we do not cause change in # of commits below
     repo.commit("gitattributes", files=dotdatalad_attributes_file, options=['--amend'])
 
-    with chpwd(outd):
+    with chpwd(outd), patch_config(plumbing_config):
         pipeline = ofpipeline('ds666', versioned_urls=False, topurl=topurl)
         out = run_pipeline(pipeline)
     eq_(len(out), 1)
@@ -313,7 +318,7 @@ def test_openfmri_pipeline1(ind=None, topurl=None, outd=None, clonedir=None):
     #
     add_to_index(index_html, content=_versioned_files)
 
-    with chpwd(outd):
+    with chpwd(outd), patch_config(plumbing_config):
         pipeline = ofpipeline('ds666', versioned_urls=False, topurl=topurl)
         out = run_pipeline(pipeline)
     eq_(len(out), 1)
@@ -529,7 +534,8 @@ def test_openfmri_pipeline1(ind=None, topurl=None, outd=None, clonedir=None):
     def _pipeline(*args, **kwargs):
         """Helper to mock openfmri.pipeline invocation so it looks at our 'server'"""
         kwargs = updated(kwargs, {'topurl': topurl, 'versioned_urls': False})
-        return ofpipeline(*args,  **kwargs)
+        with patch_config(plumbing_config):
+            return ofpipeline(*args,  **kwargs)
 
     with chpwd(clonedir), patch.object(openfmri, 'pipeline', _pipeline):
         output, stats = crawl()  # we should be able to recrawl without doing anything
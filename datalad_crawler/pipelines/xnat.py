@@ -19,6 +19,7 @@ Notes:
 import json
 from ..nodes.misc import assign
 from ..nodes.annex import Annexificator
+from ..support.ratecontrol import throttled_call
 from datalad.utils import updated
 
 # Possibly instantiate a logger if you would like to log
@@ -108,7 +109,7 @@ class XNATServer(object):
         if options:
             # TODO: use the helper we have
             query_url += "?" + '&'.join(("%s=%s" % (o, v) for o, v in options.items()))
-        out = self.downloader.fetch(query_url)
+        out = throttled_call(query_url, self.downloader.fetch, query_url)
         if format == 'json':
             j = json.loads(out)
             j = lower_case_the_keys(j)
@@ -0,0 +1,149 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Data records passed along the pipeline"""
+
+from collections.abc import MutableMapping
+
+__docformat__ = 'restructuredtext'
+
+
+# marker for keys removed in a layer while present in some parent layer
+_REMOVED = object()
+
+
+class _Layer(object):
+    """Frozen layer of a LayeredDict, possibly shared among multiple records"""
+
+    __slots__ = ('items', 'parent', 'depth')
+
+    def __init__(self, items, parent):
+        self.items = items
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 1
+
+
+class LayeredDict(MutableMapping):
+    """A dict-like record which could be copied in O(1)
+
+    Nodes of the pipeline typically yield a copy of the input `data` with
+    a few keys added or changed (see `datalad.utils.updated`).  Instead of
+    copying all the items (which might include e.g. entire page bodies) on
+    each `copy()`, items assigned so far are "frozen" into a layer shared
+    between the original and the copy, and each of them carries on
+    recording its own changes on top of it.  Removed keys are recorded
+    as "tombstones" in the own layer.
+
+    To keep lookups cheap, the layers get squashed into a single one whenever
+    there are more than `max_depth` of them.
+    """
+
+    __slots__ = ('_own', '_parent')
+
+    max_depth = 8
+
+    def __init__(self, *args, **kwargs):
+        self._own = {}
+        self._parent = None
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    def _lookup(self, key):
+        value = self._own.get(key, _REMOVED)
+        if value is _REMOVED and key not in self._own:
+            layer = self._parent
+            while layer is not None:
+                items = layer.items
+                if key in items:
+                    return items[key]
+                layer = layer.parent
+        return value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _REMOVED:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _REMOVED
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _REMOVED else value
+
+    def __setitem__(self, key, value):
+        self._own[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if self._parent is None:
+            del self._own[key]
+        else:
+            self._own[key] = _REMOVED
+
+    def update(self, *args, **kwargs):
+        if len(args) == 1 and not kwargs and isinstance(args[0], dict):
+            # fast path for the most common use, e.g. by `updated`
+            self._own.update(args[0])
+        else:
+            super(LayeredDict, self).update(*args, **kwargs)
+
+    def _flat(self):
+        """Return a dict with all the items, including tombstones"""
+        layers = []
+        layer = self._parent
+        while layer is not None:
+            layers.append(layer.items)
+            layer = layer.parent
+        flat = {}
+        for items in reversed(layers):
+            flat.update(items)
+        flat.update(self._own)
+        return flat
+
+    def __iter__(self):
+        if self._parent is None:
+            return iter(self._own)
+        return (k for k, v in self._flat().items() if v is not _REMOVED)
+
+    def __len__(self):
+        if self._parent is None:
+            return len(self._own)
+        return sum(1 for v in self._flat().values() if v is not _REMOVED)
+
+    @property
+    def depth(self):
+        """Number of the frozen layers underneath"""
+        return self._parent.depth if self._parent is not None else 0
+
+    def copy(self):
+        """Return a copy which shares all the current items with this one"""
+        if self._own:
+            parent = self._parent
+            if parent is not None and parent.depth >= self.max_depth:
+                parent = _Layer(
+                    {k: v for k, v in self._flat().items() if v is not _REMOVED},
+                    None)
+            else:
+                parent = _Layer(self._own, parent)
+            self._parent = parent
+            self._own = {}
+        d = LayeredDict.__new__(self.__class__)
+        d._own = {}
+        d._parent = self._parent
+        return d
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, dict(self))
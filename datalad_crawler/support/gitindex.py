@@ -0,0 +1,135 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Helpers to prepare git trees and commits without touching the index of the repository
+"""
+
+import os
+import tempfile
+
+from os.path import join as opj
+
+from datalad.cmd import GitWitlessRunner, StdOutErrCapture
+from datalad.utils import rmtree
+
+from logging import getLogger
+lgr = getLogger('datalad.crawler.support.gitindex')
+
+__docformat__ = 'restructuredtext'
+
+# mode and object to use in index entries to remove the path from the index
+NULL_MODE = '0'
+NULL_SHA = '0' * 40
+
+
+def get_staged_entries(repo):
+    """Return entries staged in the index of the repository
+
+    Returns
+    -------
+    dict
+      path -> (mode, sha), with NULL_MODE for paths removed from the index
+    """
+    if repo.get_hexsha() is None:
+        # no commits yet, so everything in the index is staged
+        args = ['ls-files', '-z', '-s']
+    else:
+        args = ['diff-index', '-z', '--cached', '--no-renames', 'HEAD']
+    out = repo.call_git(args, read_only=True)
+    entries = {}
+    if args[0] == 'ls-files':
+        # "<mode> <sha> <stage>\t<path>"
+        for item in out.split('\0'):
+            if not item:
+                continue
+            info, path = item.split('\t', 1)
+            mode, sha, _ = info.split(' ')
+            entries[path] = (mode, sha)
+    else:
+        # ":<old mode> <new mode> <old sha> <new sha> <status>" and the path
+        items = out.split('\0')
+        for info, path in zip(items[0::2], items[1::2]):
+            _, mode, _, sha, status = info.split(' ')
+            if status == 'D':
+                mode, sha = NULL_MODE, NULL_SHA
+            entries[path] = (mode, sha)
+    return entries
+
+
+class TemporaryIndex(object):
+    """Index in a temporary file to prepare trees for the repository
+
+    Should be used as a context manager, so the index file gets removed
+    upon exit
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self._tempdir = None
+        self.path = None
+
+    def __enter__(self):
+        self._tempdir = tempfile.mkdtemp(prefix='datalad_crawl_index_')
+        # git does not like an empty file as an index, so let it create one
+        self.path = opj(self._tempdir, 'index')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        rmtree(self._tempdir)
+        self._tempdir = self.path = None
+
+    @property
+    def _env(self):
+        env = os.environ.copy()
+        env['GIT_INDEX_FILE'] = self.path
+        return env
+
+    def read_tree(self, treeish=None):
+        """Populate the index from the treeish, or empty it if None"""
+        self.repo.call_git(
+            ['read-tree', treeish if treeish is not None else '--empty'],
+            env=self._env)
+
+    def update(self, entries):
+        """Add entries to the index
+
+        Parameters
+        ----------
+        entries : iterable of (path, (mode, sha))
+          With mode NULL_MODE, path gets removed from the index
+        """
+        stdin = ''.join(
+            '%s %s\t%s\0' % (mode, sha, path) for path, (mode, sha) in entries
+        )
+        if not stdin:
+            return
+        lgr.log(5, "Updating %s with %d entries", self.path, stdin.count('\0'))
+        GitWitlessRunner(cwd=self.repo.path, env=self._env).run(
+            ['git', 'update-index', '-z', '--index-info'],
+            protocol=StdOutErrCapture,
+            stdin=stdin.encode('utf-8'))
+
+    def write_tree(self):
+        """Write the tree from the index and return its sha"""
+        return self.repo.call_git(['write-tree'], env=self._env).strip()
+
+
+def hash_file(repo, path):
+    """Store the file as a blob in the repository, and return its sha"""
+    return repo.call_git(['hash-object', '-w', '--', path]).strip()
+
+
+def commit_tree(repo, tree, parents, msg):
+    """Create a commit for the tree, and return its sha
+
+    Note that no branch gets updated -- use `update-ref` for that
+    """
+    args = ['commit-tree', tree]
+    for parent in parents:
+        args += ['-p', parent]
+    return repo.call_git(args + ['-m', msg]).strip()
@@ -0,0 +1,216 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Profiling of the pipeline nodes
+
+"""
+
+import json
+import threading
+import time
+
+from functools import wraps
+
+from datalad.cmd import BatchedCommand
+from datalad.runner.runner import WitlessRunner
+
+from logging import getLogger
+lgr = getLogger('datalad.crawler.profiler')
+
+__docformat__ = 'restructuredtext'
+
+# profilers which are currently active, so pipelines ran by the nodes
+# themselves (e.g. by `switch`) get profiled as well
+_active_profilers = []
+
+
+def get_active_profiler():
+    """Return profiler which is currently active, or None"""
+    return _active_profilers[-1] if _active_profilers else None
+
+
+# methods which wait on subprocesses, to be timed while profiling: runs of
+# commands (git, git-annex), and requests to batched ones (e.g. annex addurl)
+_SUBPROCESS_METHODS = ((WitlessRunner, 'run'), (BatchedCommand, '__call__'))
+# wall clock time the profiled thread spent waiting on subprocesses
+_subprocess_wall = 0.
+# not to time nested calls (e.g. the start of a batched command) twice
+_subprocess_depth = 0
+_profiled_thread = None
+
+
+def _timed(func):
+    """Wrap func to account for the time it takes if called by the profiled thread"""
+    @wraps(func)
+    def timed(*args, **kwargs):
+        global _subprocess_wall, _subprocess_depth
+        if _subprocess_depth or threading.get_ident() != _profiled_thread:
+            return func(*args, **kwargs)
+        _subprocess_depth += 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _subprocess_depth -= 1
+            _subprocess_wall += time.perf_counter() - start
+    return timed
+
+
+def _time_subprocesses(enable):
+    """Start (or stop) timing of the calls waiting on subprocesses"""
+    global _profiled_thread
+    for cls, name in _SUBPROCESS_METHODS:
+        if enable:
+            setattr(cls, name, _timed(cls.__dict__[name]))
+        else:
+            setattr(cls, name, cls.__dict__[name].__wrapped__)
+    _profiled_thread = threading.get_ident() if enable else None
+
+
+def _get_times():
+    return (time.perf_counter(),
+            time.process_time(),
+            _subprocess_wall)
+
+
+class NodeProfile(object):
+    """Accumulated timings of a single node"""
+
+    __slots__ = ('label', 'calls', 'items_out', 'wall', 'cpu', 'subprocess')
+
+    def __init__(self, label):
+        self.label = label
+        self.calls = 0  # i.e. items in
+        self.items_out = 0
+        self.wall = self.cpu = self.subprocess = 0.
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class PipelineProfiler(object):
+    """Profiler of the nodes of a pipeline, including nested pipelines
+
+    For each node it records the number of calls (items in), number of
+    yielded items, and the time spent within the node itself (i.e. creating
+    and advancing its generator, without the time spent by the downstream
+    nodes or by the nodes of the pipelines it runs itself):
+
+    - wall: wall clock time
+    - cpu: CPU time of this (Python) process, across all threads
+    - subprocess: wall clock time spent waiting on subprocesses (e.g. git,
+      git-annex), including requests to the batched ones.  Only the waiting
+      of the thread running the pipeline is accounted for, and not e.g. of
+      the threads downloading content concurrently.  Output of the commands
+      ran with generator protocols is not waited for within the runner, so
+      it is not accounted for either
+
+    Should be used as a context manager, so that profiling of all pipelines
+    ran within is done by this profiler.
+    """
+
+    def __init__(self):
+        self._profiles = {}   # id(node) -> NodeProfile, in the order of first call
+        # (times upon entering, [times spent in nested nodes]) for nodes being run
+        self._stack = []
+        self._start = None
+        self.total = None
+
+    def __enter__(self):
+        if not _active_profilers:
+            _time_subprocesses(True)
+        _active_profilers.append(self)
+        self._start = _get_times()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.total = [e - s for e, s in zip(_get_times(), self._start)]
+        _active_profilers.remove(self)
+        if not _active_profilers:
+            _time_subprocesses(False)
+
+    @property
+    def profiles(self):
+        return list(self._profiles.values())
+
+    def _get_profile(self, node, label):
+        key = id(node)
+        try:
+            return self._profiles[key]
+        except KeyError:
+            profile = self._profiles[key] = NodeProfile(label(node))
+            return profile
+
+    def _enter(self):
+        self._stack.append((_get_times(), [0., 0., 0.]))
+
+    def _exit(self, profile):
+        start, nested = self._stack.pop()
+        spent = [e - s for e, s in zip(_get_times(), start)]
+        profile.wall += spent[0] - nested[0]
+        profile.cpu += spent[1] - nested[1]
+        profile.subprocess += spent[2] - nested[2]
+        if self._stack:
+            parent_nested = self._stack[-1][1]
+            for i, t in enumerate(spent):
+                parent_nested[i] += t
+
+    def run(self, node, data, label=str):
+        """Run node on data and return its output, to be profiled while consumed
+
+        Parameters
+        ----------
+        label: callable, optional
+          To produce label of the node for the report
+        """
+        profile = self._get_profile(node, label)
+        profile.calls += 1
+        self._enter()
+        try:
+            out = node(data)
+        finally:
+            self._exit(profile)
+        if not out:
+            return out
+        return self._iter(profile, iter(out))
+
+    def _iter(self, profile, out):
+        while True:
+            self._enter()
+            try:
+                data = next(out)
+            except StopIteration:
+                return
+            finally:
+                self._exit(profile)
+            profile.items_out += 1
+            yield data
+
+    def as_dict(self):
+        return {
+            'total': dict(zip(('wall', 'cpu', 'subprocess'), self.total or [])),
+            'nodes': [p.as_dict() for p in self.profiles],
+        }
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
+
+    def as_table(self, max_label=60):
+        """Return a human-readable table with nodes sorted by wall time"""
+        lines = ["%-*s %8s %8s %9s %9s %9s" % (
+            max_label, 'node', 'in', 'out', 'wall', 'cpu', 'subproc')]
+        for p in sorted(self.profiles, key=lambda p: p.wall, reverse=True):
+            label = p.label if len(p.label) <= max_label \
+                else p.label[:max_label - 3] + '...'
+            lines.append("%-*s %8d %8d %9.3f %9.3f %9.3f" % (
+                max_label, label, p.calls, p.items_out, p.wall, p.cpu, p.subprocess))
+        if self.total:
+            lines.append("%-*s %8s %8s %9.3f %9.3f %9.3f" % (
+                (max_label, 'TOTAL', '', '') + tuple(self.total)))
+        return '\n'.join(lines)
@@ -0,0 +1,50 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Providers of downloaders for the threads of a pool
+
+Downloaders (and their sessions) are not thread-safe, so the threads
+requesting urls concurrently should not share them.
+"""
+
+import threading
+
+from datalad.downloaders.providers import Providers
+
+__docformat__ = 'restructuredtext'
+
+_providers_lock = threading.Lock()
+
+
+def load_providers():
+    """Load providers anew, so their downloaders are not shared with other threads"""
+    with _providers_lock:
+        # do not replace providers cached by from_config_files for others
+        default = Providers._DEFAULT_PROVIDERS
+        try:
+            return Providers.from_config_files(reload=True)
+        finally:
+            Providers._DEFAULT_PROVIDERS = default
+
+
+class ThreadProviders(object):
+    """Own providers for every thread of a pool
+
+    `init_thread` should be used as the `initializer` of the pool
+    (e.g. ThreadPoolExecutor), so each thread loads its own providers.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def init_thread(self):
+        self._local.providers = load_providers()
+
+    def get(self):
+        """Return providers of the current thread, or None if it is not of the pool"""
+        return getattr(self._local, 'providers', None)
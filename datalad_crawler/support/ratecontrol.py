@@ -0,0 +1,358 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Adaptive (AIMD) control of the concurrency and rate of requests to remote hosts
+
+Components which hit remote servers (pages crawling, url status checks,
+S3 listings, XNAT queries) could run their requests via `throttled_call`, so
+that the requests to the same host are limited by a shared controller.  For
+each host it maintains
+
+- a concurrency window, i.e. the number of requests allowed to be in flight,
+  which grows additively while requests succeed (starting exponentially,
+  until the first sign of congestion), and gets halved upon congestion, i.e.
+  if the server throttles the requests (429, 503, S3 SlowDown etc), fails
+  with other server errors, or latency grows considerably
+- a token bucket, which limits the rate of requests after the server
+  throttled them, and then also increases additively while requests succeed
+
+Datalad downloaders already retry throttled requests (and server errors)
+with a backoff, so the failure which reaches the controller is the final
+one.  Therefore, by default, the controller does not retry requests on its
+own, but only slows down the subsequent ones.  Retries could be enabled via
+`datalad.crawl.ratecontrol.retries` for requests done without downloaders.
+
+Control is disabled unless `datalad.crawl.ratecontrol` configuration is set
+to true.  Configuration is read once, upon the first request.
+"""
+
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+from datalad import cfg
+from datalad.dochelpers import exc_str
+
+from logging import getLogger
+lgr = getLogger('datalad.crawler.support.ratecontrol')
+
+__docformat__ = 'restructuredtext'
+
+# HTTP statuses and error codes (of S3 etc) with which servers ask to slow down
+THROTTLING_STATUSES = {429, 503}
+THROTTLING_CODES = {
+    'SlowDown',
+    'Throttling',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'TooManyRequests',
+    'TooManyRequestsException',
+}
+
+
+def _get_error_status(exc):
+    """Return (HTTP status, error code) for the exception if known
+
+    Handles datalad's AccessFailedError (and alike) with `status` and
+    botocore's ClientError with `response`
+    """
+    status = getattr(exc, 'status', None)
+    code = None
+    response = getattr(exc, 'response', None)
+    if isinstance(response, dict):
+        code = response.get('Error', {}).get('Code')
+        status = status or response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    try:
+        status = int(status) if status is not None else None
+    except (TypeError, ValueError):
+        status = None
+    return status, code
+
+
+def is_throttling(exc):
+    """Return True if the exception signals that the server throttles requests"""
+    status, code = _get_error_status(exc)
+    return status in THROTTLING_STATUSES or code in THROTTLING_CODES
+
+
+class HostController(object):
+    """AIMD controller of the requests to a single host
+
+    Parameters
+    ----------
+    host : str
+    max_window : int, optional
+      Maximal number of concurrent requests
+    min_rate : float, optional
+      Minimal rate (requests per second) to decrease to
+    decrease : float, optional
+      Factor to multiply window and rate with upon congestion
+    latency_factor : float, optional
+      Latency (moving average) exceeding the minimal observed one by this
+      factor is considered to be a sign of congestion
+    """
+
+    # weight of the new sample in the moving average of latency
+    _LATENCY_ALPHA = 0.2
+    # number of samples needed before latency is considered for congestion
+    _LATENCY_SAMPLES = 10
+
+    def __init__(self, host, max_window=32, min_rate=0.1, decrease=0.5,
+                 latency_factor=4.):
+        self.host = host
+        self.max_window = max_window
+        self.min_rate = min_rate
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.window = 1.
+        # window until which it grows exponentially, None until congestion
+        self.threshold = None
+        self.rate = None  # requests per second, None -- not limited
+        self.inflight = 0
+        self.latency = None
+        self.min_latency = None
+        # counters
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.decreases = 0
+        self._tokens = 0.
+        self._refilled = time.monotonic()
+        self._decreased = None
+        self._cond = threading.Condition()
+
+    def _take_token(self, now):
+        """Return 0 if token was taken, or how long to wait for one"""
+        if self.rate is None:
+            return 0
+        self._tokens = min(max(self.rate, 1.),
+                           self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Wait until the request could be issued"""
+        with self._cond:
+            while True:
+                if self.inflight < int(self.window):
+                    wait = self._take_token(time.monotonic())
+                    if not wait:
+                        break
+                else:
+                    wait = None  # until some request finishes
+                self._cond.wait(wait)
+            self.inflight += 1
+            self.requests += 1
+
+    def release(self, latency, exc=None):
+        """Account for the finished request
+
+        Parameters
+        ----------
+        latency : float
+          Time the request took
+        exc : Exception, optional
+          Exception the request failed with, if any
+        """
+        with self._cond:
+            self.inflight -= 1
+            if exc is not None:
+                status, _ = _get_error_status(exc)
+                if is_throttling(exc):
+                    self.throttled += 1
+                    self._decrease("throttled: %s" % exc_str(exc), limit_rate=True)
+                elif status is not None and status >= 500:
+                    self.errors += 1
+                    self._decrease("server error: %s" % exc_str(exc))
+                else:
+                    # not a failure due to the load (404, redirect etc)
+                    self._account_latency(latency)
+            else:
+                self._account_latency(latency)
+            self._cond.notify_all()
+
+    def _account_latency(self, latency):
+        self.min_latency = latency if self.min_latency is None \
+            else min(self.min_latency, latency)
+        self.latency = latency if self.latency is None \
+            else self.latency + self._LATENCY_ALPHA * (latency - self.latency)
+        if self.requests >= self._LATENCY_SAMPLES and \
+                self.latency > self.latency_factor * max(self.min_latency, 1e-3):
+            self._decrease("latency %.3f sec vs %.3f sec at best"
+                           % (self.latency, self.min_latency))
+            return
+        # additive increase: by 1 per window of successful requests, unless
+        # still before the first congestion, when it is by 1 per request
+        if self.threshold is None or self.window < self.threshold:
+            self.window += 1
+        else:
+            self.window += 1. / self.window
+        self.window = min(self.window, float(self.max_window))
+        if self.rate is not None:
+            # similarly -- by 1 request/sec per second
+            self.rate += 1. / self.rate
+
+    def _decrease(self, reason, limit_rate=False):
+        now = time.monotonic()
+        # decrease only once per the round trip, since all the requests
+        # which were in flight most likely suffered from the same congestion
+        if self._decreased is not None and \
+                now - self._decreased < (self.latency or 0):
+            return
+        self._decreased = now
+        self.decreases += 1
+        self.window = self.threshold = max(1., self.window * self.decrease)
+        if limit_rate:
+            if self.rate is None:
+                # start from the rate at which requests were issued
+                rate = max(self.inflight + 1, 1) / max(self.latency or 1., 1e-3)
+            else:
+                rate = self.rate
+            self.rate = max(self.min_rate, rate * self.decrease)
+            self._tokens = 0.
+        lgr.debug("Slowing down requests to %s (%s): window=%.1f, rate=%s",
+                  self.host, reason, self.window,
+                  '%.2f/sec' % self.rate if self.rate is not None else 'unlimited')
+
+    def get_metrics(self):
+        with self._cond:
+            return {
+                'window': self.window,
+                'rate': self.rate,
+                'inflight': self.inflight,
+                'latency': self.latency,
+                'min_latency': self.min_latency,
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'errors': self.errors,
+                'decreases': self.decreases,
+            }
+
+
+class RateController(object):
+    """Controllers of the requests to all the hosts
+
+    Parameters
+    ----------
+    retries : int, optional
+      How many times to retry a throttled request.  Should be left 0 for
+      requests which are retried by datalad downloaders already
+    **kwargs
+      Passed to `HostController` for every host
+    """
+
+    def __init__(self, retries=0, **kwargs):
+        self.retries = retries
+        self._kwargs = kwargs
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def get_host_controller(self, url):
+        """Return controller for the host of the url (or of the name if not a url)"""
+        host = urlsplit(url).netloc or url
+        with self._lock:
+            controller = self._hosts.get(host)
+            if controller is None:
+                controller = self._hosts[host] = HostController(host, **self._kwargs)
+            return controller
+
+    def call(self, url, func, *args, **kwargs):
+        """Call func(*args, **kwargs) issuing request(s) to the host of the url"""
+        controller = self.get_host_controller(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            controller.acquire()
+            start = time.monotonic()
+            try:
+                out = func(*args, **kwargs)
+            except Exception as exc:
+                controller.release(time.monotonic() - start, exc)
+                if attempt > self.retries or not is_throttling(exc):
+                    raise
+                lgr.debug("Retrying (attempt %d) throttled request to %s",
+                          attempt, url)
+                continue
+            controller.release(time.monotonic() - start)
+            return out
+
+    def get_metrics(self):
+        """Return metrics of all the hosts, host -> dict"""
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: c.get_metrics() for host, c in sorted(hosts.items())}
+
+    def as_str(self):
+        """Return a summary of metrics of all the hosts in a single line"""
+        return '; '.join(
+            "%s: %d requests, %d throttled, %d errors, window=%.1f, rate=%s" % (
+                host, m['requests'], m['throttled'], m['errors'], m['window'],
+                '%.2f/sec' % m['rate'] if m['rate'] is not None else 'unlimited')
+            for host, m in self.get_metrics().items())
+
+
+# shared RateController, False if disabled, None until configuration is read
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    """Return the shared RateController, or None if not enabled in configuration"""
+    global _controller
+    controller = _controller
+    if controller is None:
+        with _controller_lock:
+            if _controller is None:
+                if cfg.getbool('datalad.crawl', 'ratecontrol', default=False):
+                    _controller = RateController(
+                        retries=int(cfg.obtain('datalad.crawl.ratecontrol.retries', default=0)),
+                        max_window=int(cfg.obtain('datalad.crawl.ratecontrol.max_window', default=32)),
+                    )
+                else:
+                    _controller = False
+            controller = _controller
+    return controller or None
+
+
+def throttled_call(url, func, *args, **kwargs):
+    """Call func(*args, **kwargs) under the shared controller if it is enabled"""
+    controller = get_controller()
+    if controller is None:
+        return func(*args, **kwargs)
+    return controller.call(url, func, *args, **kwargs)
+
+
+def throttled_iter(url, iterable):
+    """Iterate over iterable, e.g. pages of a listing, under the shared controller
+
+    Each item is considered to be a separate request.  Throttled requests
+    are not retried, since iterator can't be restarted
+    """
+    controller = get_controller()
+    if controller is None:
+        yield from iterable
+        return
+    controller = controller.get_host_controller(url)
+    it = iter(iterable)
+    while True:
+        controller.acquire()
+        start = time.monotonic()
+        try:
+            item = next(it)
+        except StopIteration:
+            controller.release(time.monotonic() - start)
+            return
+        except Exception as exc:
+            controller.release(time.monotonic() - start, exc)
+            raise
+        controller.release(time.monotonic() - start)
+        yield item
@@ -0,0 +1,66 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""File status which also describes the content
+
+"""
+
+from datalad.support.status import FileStatus
+from datalad.utils import auto_repr
+
+__docformat__ = 'restructuredtext'
+
+
+def get_checksum(value, digest):
+    """Return checksum in the form stored in the status, i.e. prefixed with digest
+
+    Parameters
+    ----------
+    value : str
+    digest : str
+      E.g. 'etag' (for S3 ETag), 'md5' or '.md5' (as deduced by
+      `parse_checksums` from the file extension)
+    """
+    return '%s:%s' % (digest.lstrip('.').lower(), value.strip('"'))
+
+
+@auto_repr
+class ChecksumFileStatus(FileStatus):
+    """FileStatus which also carries checksum of the content (e.g. S3 ETag)
+
+    If both statuses have checksums, different checksums make them different
+    regardless of size and mtime.  Identical checksums make it possible to
+    tell that only metadata (e.g. mtime) has changed, see `is_same_content`.
+    """
+
+    def __init__(self, size=None, mtime=None, filename=None, checksum=None):
+        super(ChecksumFileStatus, self).__init__(size=size, mtime=mtime, filename=filename)
+        self.checksum = checksum
+
+    @classmethod
+    def from_status(cls, status, checksum):
+        return cls(size=status.size, mtime=status.mtime,
+                   filename=status.filename, checksum=checksum)
+
+    def __eq__(self, other):
+        out = super(ChecksumFileStatus, self).__eq__(other)
+        if out is True and not self._same_checksum(other, missing=True):
+            return False
+        return out
+
+    def _same_checksum(self, other, missing):
+        other_checksum = getattr(other, 'checksum', None)
+        if not (self.checksum and other_checksum):
+            return missing
+        return self.checksum == other_checksum
+
+    def is_same_content(self, other):
+        """Return True if other status has the same checksum (and size, if known)"""
+        if not other or not self._same_checksum(other, missing=False):
+            return False
+        return self.size is None or other.size is None or self.size == other.size
@@ -0,0 +1,84 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+import pickle
+from copy import copy, deepcopy
+
+from datalad.utils import updated
+from datalad.tests.utils_pytest import (
+    assert_equal,
+    assert_false,
+    assert_in,
+    assert_not_in,
+    assert_raises,
+    ok_,
+)
+
+from ..data import LayeredDict
+
+
+def test_LayeredDict_basic():
+    d = LayeredDict({'a': 1}, b=2)
+    assert_equal(d, {'a': 1, 'b': 2})
+    assert_equal({'a': 1, 'b': 2}, d)
+    assert_equal(len(d), 2)
+    assert_equal(d.depth, 0)
+    assert_equal(d.get('c'), None)
+    assert_raises(KeyError, d.__getitem__, 'c')
+    assert_raises(KeyError, d.__delitem__, 'c')
+    del d['a']
+    assert_equal(d, {'b': 2})
+    assert_equal(repr(d), "LayeredDict({'b': 2})")
+
+
+def test_LayeredDict_copy():
+    value = ['mutable']
+    d = LayeredDict(a=value, b=2)
+    d2 = d.copy()
+    ok_(d2['a'] is value)
+    assert_equal(d2.depth, 1)
+    # modifications are not seen by the other copy
+    d2['c'] = 3
+    del d2['b']
+    d['a'] = 'changed'
+    assert_equal(d, {'a': 'changed', 'b': 2})
+    assert_equal(d2, {'a': value, 'c': 3})
+    assert_not_in('b', d2)
+    assert_equal(list(d2), ['a', 'c'])
+    assert_equal(len(d2), 2)
+    # derived via updated
+    d3 = updated(d2, {'b': 4})
+    ok_(isinstance(d3, LayeredDict))
+    assert_equal(d3, {'a': value, 'b': 4, 'c': 3})
+    assert_equal(d2, {'a': value, 'c': 3})
+    assert_equal(copy(d3), d3)
+    assert_equal(d3.pop('b'), 4)
+    assert_equal(d3.setdefault('e', 5), 5)
+    assert_equal(dict(**d3), {'a': value, 'c': 3, 'e': 5})
+
+
+def test_LayeredDict_squash():
+    d = LayeredDict(i=0)
+    for i in range(1, 30):
+        d = updated(d, {'i': i, 'k%d' % i: i})
+        if i % 3 == 0:
+            del d['k%d' % i]
+        ok_(d.depth <= LayeredDict.max_depth)
+    assert_equal(d['i'], 29)
+    assert_equal(len(d), 1 + 29 - 9)
+    assert_in('k1', d)
+    assert_false('k3' in d)
+
+
+def test_LayeredDict_pickle():
+    d = LayeredDict(a=1).copy()
+    d['b'] = [2]
+    for d_ in (pickle.loads(pickle.dumps(d)), deepcopy(d)):
+        ok_(isinstance(d_, LayeredDict))
+        assert_equal(d_, {'a': 1, 'b': [2]})
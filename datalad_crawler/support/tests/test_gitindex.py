@@ -0,0 +1,69 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+from os.path import join as opj, exists
+
+from datalad.support.gitrepo import GitRepo
+from datalad.tests.utils_pytest import (
+    assert_equal,
+    assert_false,
+    assert_in,
+    with_tree,
+)
+
+from ..gitindex import (
+    NULL_MODE,
+    NULL_SHA,
+    TemporaryIndex,
+    commit_tree,
+    get_staged_entries,
+    hash_file,
+)
+
+
+def _ls_tree(repo, treeish):
+    return set(repo.call_git(['ls-tree', '-r', '--name-only', treeish]).split())
+
+
+@with_tree(tree={'a': 'a', 'b': 'b', 'f_1.0': 'f1', 'f_2.0': 'f2', 'new': 'new'})
+def test_TemporaryIndex(path=None):
+    repo = GitRepo(path, create=True)
+    assert_equal(get_staged_entries(repo), {})
+    repo.add(['a', 'b'])
+    staged = get_staged_entries(repo)
+    assert_equal(set(staged), {'a', 'b'})
+    assert_equal(staged['a'], ('100644', hash_file(repo, opj(path, 'a'))))
+    repo.commit("initial")
+    head = repo.get_hexsha()
+
+    repo.remove(['b'])
+    repo.add(['f_1.0', 'f_2.0', 'new'])
+    staged = get_staged_entries(repo)
+    assert_equal(staged['b'], (NULL_MODE, NULL_SHA))
+    assert_equal(set(staged), {'b', 'f_1.0', 'f_2.0', 'new'})
+    index_before = repo.call_git(['ls-files', '-s'])
+
+    with TemporaryIndex(repo) as index:
+        index_path = index.path
+        index.read_tree(head)
+        index.update((p, staged[p]) for p in ('b', 'new'))
+        index.update([('f', staged['f_1.0'])])
+        commit1 = commit_tree(repo, index.write_tree(), [head], "version 1.0")
+        index.update([('f', staged['f_2.0'])])
+        commit2 = commit_tree(repo, index.write_tree(), [commit1], "version 2.0")
+    assert_false(exists(index_path))
+
+    # neither HEAD nor the index of the repository were changed
+    assert_equal(repo.get_hexsha(), head)
+    assert_equal(repo.call_git(['ls-files', '-s']), index_before)
+    assert_equal(_ls_tree(repo, commit1), {'a', 'f', 'new'})
+    assert_equal(repo.call_git(['show', '%s:f' % commit1]), 'f1')
+    assert_equal(repo.call_git(['show', '%s:f' % commit2]), 'f2')
+    assert_equal(repo.call_git(['rev-parse', commit2 + '^']).strip(), commit1)
+    assert_in('version 2.0', repo.call_git(['log', '-1', '--format=%s', commit2]))
@@ -0,0 +1,42 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from datalad.downloaders.providers import Providers
+from datalad.tests.utils_pytest import (
+    assert_equal,
+    assert_is_none,
+    assert_true,
+)
+
+from ..providers import ThreadProviders
+
+
+def test_thread_providers():
+    default = Providers.from_config_files()
+    providers = ThreadProviders()
+    assert_is_none(providers.get())
+    barrier = threading.Barrier(3)
+
+    def get():
+        # so all the threads of the pool get used
+        barrier.wait()
+        return providers.get()
+
+    with ThreadPoolExecutor(max_workers=3,
+                            initializer=providers.init_thread) as executor:
+        loaded = [f.result() for f in [executor.submit(get) for _ in range(3)]]
+    assert_true(all(isinstance(p, Providers) for p in loaded))
+    assert_equal(len(set(map(id, loaded))), 3)
+    assert_true(default not in loaded)
+    # default providers are not replaced
+    assert_true(Providers.from_config_files() is default)
+    assert_is_none(providers.get())
@@ -0,0 +1,151 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+from unittest.mock import patch
+
+from datalad.support.exceptions import AccessFailedError
+from datalad.tests.utils_pytest import (
+    assert_equal,
+    assert_false,
+    assert_is_none,
+    assert_raises,
+    assert_true,
+    patch_config,
+)
+
+from .. import ratecontrol
+from ..ratecontrol import (
+    HostController,
+    RateController,
+    get_controller,
+    is_throttling,
+    throttled_call,
+)
+
+
+class _ClientError(Exception):
+    """Mimics botocore's ClientError"""
+    def __init__(self, code, status):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code},
+                         'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+def _raise(exc):
+    raise exc
+
+
+def test_is_throttling():
+    assert_true(is_throttling(AccessFailedError("slow down", status=429)))
+    assert_true(is_throttling(AccessFailedError("unavailable", status=503)))
+    assert_true(is_throttling(_ClientError('SlowDown', 503)))
+    assert_true(is_throttling(_ClientError('Throttling', 400)))
+    assert_false(is_throttling(AccessFailedError("forbidden", status=403)))
+    assert_false(is_throttling(_ClientError('NoSuchKey', 404)))
+    assert_false(is_throttling(ValueError("whatever")))
+
+
+def test_host_controller_aimd():
+    c = HostController('example.com', max_window=10)
+    for _ in range(5):
+        c.acquire()
+        c.release(0.1)
+    # exponential start
+    assert_equal(c.window, 6)
+    assert_is_none(c.rate)
+
+    c.acquire()
+    c.acquire()
+    c.release(0.1, AccessFailedError("slow down", status=429))
+    assert_equal(c.window, 3)
+    assert_equal(c.rate, 10)  # 2 requests per 0.1 sec halved
+    # requests which were in flight do not decrease it any further
+    c.release(0.1, AccessFailedError("slow down", status=429))
+    assert_equal(c.window, 3)
+    assert_equal(c.get_metrics()['throttled'], 2)
+    assert_equal(c.get_metrics()['decreases'], 1)
+
+    # additive increase now
+    for _ in range(3):
+        c.acquire()
+        c.release(0.1)
+    assert_true(3.9 < c.window < 4)
+    assert_true(10.2 < c.rate < 10.4)
+
+    # not a failure due to the load
+    c.acquire()
+    c.release(0.1, AccessFailedError("not found", status=404))
+    assert_equal(c.get_metrics()['errors'], 0)
+    assert_equal(c.get_metrics()['inflight'], 0)
+
+
+def test_host_controller_latency():
+    c = HostController('example.com')
+    for _ in range(10):
+        c.acquire()
+        c.release(0.01)
+    window = c.window
+    # latency got considerably worse
+    for _ in range(5):
+        c.acquire()
+        c.release(1.)
+    assert_true(c.window < window)
+    assert_is_none(c.rate)
+
+
+def test_rate_controller_call():
+    controller = RateController(retries=2, min_rate=1000)
+    calls = []
+
+    def fetch(url, fail):
+        calls.append(url)
+        if len(calls) <= fail:
+            raise AccessFailedError("slow down", status=503)
+        return 'content'
+
+    assert_equal(controller.call('http://example.com/a', fetch, 'a', 2), 'content')
+    assert_equal(calls, ['a'] * 3)
+    calls[:] = []
+    # gives up eventually
+    assert_raises(AccessFailedError,
+                  controller.call, 'http://example.com/b', fetch, 'b', 5)
+    assert_equal(calls, ['b'] * 3)
+    # other failures are not retried
+    assert_raises(ValueError, controller.call, 'http://example.com/c', int, 'c')
+
+    metrics = controller.get_metrics()
+    assert_equal(list(metrics), ['example.com'])
+    assert_equal(metrics['example.com']['requests'], 7)
+    assert_equal(metrics['example.com']['throttled'], 5)
+
+
+def test_throttled_call():
+    with patch.object(ratecontrol, '_controller', None):
+        assert_is_none(get_controller())
+        assert_equal(throttled_call('http://example.com', int, '1'), 1)
+        # configuration is read only once
+        with patch_config({'datalad.crawl.ratecontrol': 'yes'}):
+            assert_is_none(get_controller())
+    with patch.object(ratecontrol, '_controller', None), \
+            patch_config({'datalad.crawl.ratecontrol': 'yes'}):
+        controller = get_controller()
+        assert_true(isinstance(controller, RateController))
+        # requests are retried by datalad downloaders already
+        assert_equal(controller.retries, 0)
+        assert_equal(throttled_call('http://example.com', int, '1'), 1)
+        assert_equal(
+            controller.get_metrics()['example.com']['requests'], 1)
+        assert_true(get_controller() is controller)
+        # the failure is passed along right away, slowing down the rest
+        assert_raises(AccessFailedError, throttled_call, 'http://example.com',
+                      _raise, AccessFailedError("slow down", status=503))
+        assert_equal(
+            controller.get_metrics()['example.com']['throttled'], 1)
+        assert_equal(
+            controller.get_metrics()['example.com']['requests'], 2)
@@ -0,0 +1,50 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+from datalad.support.status import FileStatus
+from datalad.tests.utils_pytest import (
+    assert_equal,
+    assert_false,
+    assert_not_equal,
+    assert_true,
+)
+
+from ..status import (
+    ChecksumFileStatus,
+    get_checksum,
+)
+
+
+def test_get_checksum():
+    assert_equal(get_checksum('"d41d8cd9"', 'etag'), 'etag:d41d8cd9')
+    assert_equal(get_checksum('d41d8cd9', '.MD5'), 'md5:d41d8cd9')
+
+
+def test_ChecksumFileStatus():
+    status = ChecksumFileStatus(size=1, mtime=10, checksum='etag:abc')
+    assert_equal(status, ChecksumFileStatus(size=1, mtime=10, checksum='etag:abc'))
+    # checksums are compared only if both known
+    assert_equal(status, FileStatus(size=1, mtime=10))
+    assert_equal(FileStatus(size=1, mtime=10), status)
+    assert_equal(status, ChecksumFileStatus(size=1, mtime=10))
+    assert_not_equal(status, ChecksumFileStatus(size=1, mtime=10, checksum='etag:def'))
+    assert_not_equal(ChecksumFileStatus(size=1, mtime=10, checksum='etag:def'), status)
+    assert_not_equal(status, ChecksumFileStatus(size=1, mtime=20, checksum='etag:abc'))
+
+    assert_true(status.is_same_content(
+        ChecksumFileStatus(size=1, mtime=20, checksum='etag:abc')))
+    assert_false(status.is_same_content(
+        ChecksumFileStatus(size=2, mtime=20, checksum='etag:abc')))
+    assert_false(status.is_same_content(
+        ChecksumFileStatus(size=1, mtime=10, checksum='etag:def')))
+    assert_false(status.is_same_content(FileStatus(size=1, mtime=10)))
+    assert_false(status.is_same_content(None))
+
+    assert_equal(ChecksumFileStatus.from_status(FileStatus(size=1, mtime=10), 'etag:abc'),
+                 status)
@@ -7,10 +7,14 @@
 #
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
+import re
+
 from ..versions import get_versions
+from ..versions import get_version_key
 from datalad.tests.utils_pytest import (
     assert_equal,
     assert_raises,
+    ok_,
 )
 from datalad.support.status import FileStatus
 from collections import OrderedDict as od
@@ -109,3 +113,14 @@ def test_get_versions_default_version():
                  ('1', {'f': 'f1'}),
                  ('2016', {'f': 'f', 'ds': ('ds', fstatus)})]))
 
+
+
+def test_get_versions_sorted():
+    # versions get sorted as versions, not as strings
+    assert_equal(
+        list(get_versions(['f1.10', 'f1.9', 'f1.9.1', 'f2.0'], r'(?<=f)[\d.]+')),
+        ['1.9', '1.9.1', '1.10', '2.0'])
+    ok_(get_version_key('1.9') < get_version_key('1.10'))
+    ok_(get_version_key('1.10') is get_version_key('1.10'))
+    # compiled regex could be provided as well
+    assert_equal(get_versions(['f1'], re.compile(r'\d+')), od([('1', {'f': 'f1'})]))
@@ -17,11 +17,18 @@ from os.path import basename
 
 from collections import OrderedDict
 from collections import defaultdict
+from functools import lru_cache
 
 from logging import getLogger
 lgr = getLogger('datalad.support.versions')
 
 
+@lru_cache(maxsize=10000)
+def get_version_key(version):
+    """Return a key to sort/compare versions by, cached since versions repeat a lot"""
+    return LooseVersion(version)
+
+
 def get_versions(vfpath_statuses, regex, overlay=True,
                  unversioned=None, default=None, always_versioned=None,
                  versioneer=None):
@@ -75,41 +82,40 @@ def get_versions(vfpath_statuses, regex, overlay=True,
         # we should add a check that if there is a gap in versions for some file
         # then we must ... puke?
 
+    regex_ = re.compile(regex)
+    always_versioned_ = re.compile(always_versioned) if always_versioned else None
+    # which group of the match provides the version (0 -- entire match)
+    if regex_.groups > 1:
+        version_group = 'version' if 'version' in regex_.groupindex else None
+    else:
+        version_group = regex_.groups
+
     # collect all versioned files for now in non-ordered dict
     # vfpaths = {}  # file -> [versions]
     all_versions = defaultdict(dict)  # version -> {fpath: (vfpath, status)}
     nunversioned = nversioned = 0
-    statuses = {}
     for entry in vfpath_statuses:
         if isinstance(entry, tuple):
             vfpath, status = entry
         else:
             vfpath, status = entry, None
-        statuses[vfpath] = status  # might come handy later
         # reapply regex to extract version
-        res = re.search(regex, vfpath)
+        res = regex_.search(vfpath)
         if not res:
             # unversioned
             nunversioned += 1
             fpath = vfpath
-            if always_versioned and re.match(always_versioned, basename(vfpath)):
+            if always_versioned_ and always_versioned_.match(basename(vfpath)):
                 version = _get_default_version(entry, default, status)
             else:
                 version = None
         else:
             nversioned += 1
             fpath = vfpath[:res.start()] + vfpath[res.end():]  # unversioned one
-            groups = res.groups()
-            if groups:
-                if len(groups) > 1:
-                    if 'version' not in res.groupdict():
-                        raise ValueError("Multiple groups found in regexp %r but no version group: %s"
-                                         % (regex, groups))
-                    version = res.groupdict().get('version')
-                else:
-                    version = groups[0]
-            else:
-                version = vfpath[res.start():res.end()]
+            if version_group is None:
+                raise ValueError("Multiple groups found in regexp %r but no version group: %s"
+                                 % (regex, res.groups()))
+            version = res.group(version_group)
             if versioneer:
                 version = versioneer(fpath, version, status)
 
@@ -147,7 +153,7 @@ def get_versions(vfpath_statuses, regex, overlay=True,
 
     # sort all the versions and place into an ordered dictionary, but strip None first
     had_None = None in all_versions
-    versions_sorted = list(map(str, sorted((LooseVersion(v) for v in all_versions if v is not None))))
+    versions_sorted = sorted((v for v in all_versions if v is not None), key=get_version_key)
     if had_None:
         versions_sorted = [None] + versions_sorted
 
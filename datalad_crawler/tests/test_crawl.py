@@ -12,14 +12,21 @@
 
 __docformat__ = 'restructuredtext'
 
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join as opj
 from unittest.mock import patch
 from unittest.mock import call
 
 
 from datalad.api import crawl
+from datalad_crawler.crawl import _crawl_subdataset
 
 from datalad.tests.utils_pytest import assert_cwd_unchanged
 from datalad.tests.utils_pytest import assert_equal
+from datalad.tests.utils_pytest import ok_
 from datalad.tests.utils_pytest import with_tempfile
 from datalad.support.stats import ActivityStats
 from datalad.utils import chpwd
@@ -40,7 +47,7 @@ def test_crawl_api_chdir(run_pipeline_=None, load_pipeline_from_config_=None, ch
 
     chpwd_.assert_called_with('somedir')
     load_pipeline_from_config_.assert_called_with('some_path_not_checked')
-    run_pipeline_.assert_called_with(['pipeline'], stats=ActivityStats(datasets_crawled=1))
+    run_pipeline_.assert_called_with(['pipeline'], stats=ActivityStats(datasets_crawled=1), profile=None)
 
 
 # XXX we could also mock run_pipeline to adjust stats etc more so we
@@ -90,3 +97,67 @@ def test_crawl_api_recursive(get_subdatasets_=None, run_pipeline_=None, load_pip
     )
     assert_equal(list(find_files('.*', tdir, exclude_vcs=False)),
                  [_path_(tdir, 'some.log')])  # no files were generated besides the log
+
+
+@patch('datalad_crawler.crawl.ProcessPoolExecutor', ThreadPoolExecutor)
+@patch('datalad.utils.chpwd')
+@patch('datalad.utils.get_logfilename', return_value="some.log")
+@patch('datalad_crawler.pipeline.get_repo_pipeline_script_path', return_value='script_path')
+@patch('datalad_crawler.pipeline.load_pipeline_from_config', return_value=['pipeline'])
+@patch('datalad_crawler.pipeline.run_pipeline', return_value=[])
+@patch('datalad.distribution.dataset.Dataset.subdatasets',
+       return_value=['path1', 'path1/path1_1', 'path1/path1_1/path1_1_1',
+                     'path2', 'path_to_fail'])
+@with_tempfile(mkdir=True)
+def test_crawl_api_recursive_jobs(get_subdatasets_=None, run_pipeline_=None,
+                                  load_pipeline_from_config_=None,
+                                  get_repo_pipeline_script_path_=None,
+                                  get_logfilename_=None, chpwd_=None, tdir=None):
+    events = []
+
+    def crawl_subdataset(ds_, profile=None, picklable=False):
+        # output must be passed back from a separate process
+        ok_(picklable)
+        events.append(('start', ds_))
+        time.sleep(0.01)
+        events.append(('end', ds_))
+        if ds_ == 'path_to_fail':
+            raise Exception("crawling failed")
+        return [ds_], ActivityStats(datasets_crawled=1, add_git=1).as_dict()
+
+    with chpwd(tdir), \
+            patch('datalad_crawler.crawl._crawl_subdataset', crawl_subdataset):
+        output, stats = crawl(recursive=True, jobs=3)
+    # output is in the order of subdatasets regardless of the order of completion
+    assert_equal(output, [[], ['path1'], ['path1/path1_1'], ['path1/path1_1/path1_1_1'],
+                          ['path2'], None])
+    assert_equal(stats, ActivityStats(datasets_crawled=6, datasets_crawl_failed=1, add_git=4))
+    # independent datasets were crawled in parallel
+    assert_equal(set(events[:3]),
+                 {('start', 'path1'), ('start', 'path2'), ('start', 'path_to_fail')})
+    # but nested ones only after their parents are done
+    ok_(events.index(('end', 'path1')) < events.index(('start', 'path1/path1_1')))
+    ok_(events.index(('end', 'path1/path1_1')) <
+        events.index(('start', 'path1/path1_1/path1_1_1')))
+
+
+@patch('datalad.utils.get_logfilename', return_value="some.log")
+@with_tempfile(mkdir=True)
+def test_crawl_subdataset(get_logfilename_=None, tdir=None):
+    output = [{'datalad_stats': ActivityStats(add_git=1), 'url': 'http://example.com',
+               'response': threading.Lock()}]
+    with chpwd(tdir), \
+            patch('datalad.api.crawl',
+                  return_value=(output, ActivityStats(add_git=1))) as crawl_:
+        assert_equal(_crawl_subdataset('path1/path1_1'),
+                     (output, ActivityStats(add_git=1)))
+        crawl_.assert_called_with(chdir='path1/path1_1', profile=None)
+
+        res = _crawl_subdataset('path1/path1_1', profile=opj(tdir, 'prof.json'),
+                                picklable=True)
+        crawl_.assert_called_with(chdir='path1/path1_1',
+                                  profile=opj(tdir, 'prof-path1-path1_1.json'))
+    # could be passed back from a separate process
+    output_, stats_ = pickle.loads(pickle.dumps(res))
+    assert_equal(output_, [{'url': 'http://example.com'}])
+    assert_equal(ActivityStats(**stats_), ActivityStats(add_git=1))
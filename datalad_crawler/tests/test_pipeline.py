@@ -7,8 +7,15 @@
 #
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
+import json
+import logging
+import os
+import sys
 from os.path import join as opj
 
+import pytest
+from unittest.mock import patch
+
 from datalad.tests.utils_pytest import skip_if_scrapy_without_selector
 skip_if_scrapy_without_selector()
 
@@ -17,8 +24,11 @@ from datalad_crawler.nodes.matches import *
 from datalad_crawler.pipeline import run_pipeline, FinishPipeline
 
 from datalad_crawler.nodes.misc import Sink, assign, range_node, interrupt_if
+from datalad_crawler.nodes.misc import switch
 from datalad_crawler.nodes.annex import Annexificator
 from datalad_crawler.pipeline import load_pipeline_from_module
+from datalad_crawler.pipeline import xrun_pipeline
+from datalad_crawler.support.data import LayeredDict
 
 from datalad.support.stats import ActivityStats
 
@@ -29,11 +39,21 @@ from datalad.tests.utils_pytest import skip_if_no_module
 from datalad.tests.utils_pytest import with_tempfile
 from datalad.tests.utils_pytest import skip_if_no_network
 from datalad.tests.utils_pytest import use_cassette
+from datalad.tests.utils_pytest import patch_config
+from datalad.tests.utils_pytest import swallow_logs
+from datalad.utils import updated
 
 from logging import getLogger
 lgr = getLogger('datalad.crawl.tests')
 
 
+@pytest.fixture(autouse=True, params=['recursive', 'iterative'])
+def engine(request):
+    """Run all the tests with both pipeline engines"""
+    with patch_config({'datalad.crawl.pipeline.engine': request.param}):
+        yield request.param
+
+
 class AssertOrder(object):
     """Helper to verify that nodes executed in correct order
 
@@ -299,3 +319,153 @@ def test_pipeline_stats_persist():
     assert_pipeline([n1, [n2, p]])
     assert_pipeline([[n1], n2])
     assert_pipeline([[n1, p], n2])
+
+
+def test_pipeline_engines_consistent():
+    # outputs of a deeper pipeline, with nested pipelines of all output modes,
+    # should be identical regardless of the engine
+    def finish_on(value):
+        def _finish_on(data):
+            if data.get('out2') == value:
+                raise FinishPipeline()
+            yield data
+        return _finish_on
+
+    def get_pipeline(output):
+        return [
+            {'output': output},
+            range_node(3, "out1"),
+            [
+                {'output': 'last-output'},
+                range_node(2, "out2"),
+            ],
+            [
+                {'output': 'outputs'},
+                range_node(2, "out3"),
+                [range_node(2, "out4")],
+                assign({'x': 1}),
+            ],
+            [
+                finish_on(5),
+            ],
+            [],
+            finish_on(1) if output == 'outputs' else assign({'y': 2}),
+        ]
+
+    for output in ('input', 'last-output', 'outputs', 'input+outputs'):
+        target = list(xrun_pipeline(get_pipeline(output), engine='recursive'))
+        eq_(list(xrun_pipeline(get_pipeline(output), engine='iterative')), target)
+        eq_(run_pipeline(get_pipeline(output)) or [], target)
+        with patch_config({'datalad.crawl.pipeline.layered': 'yes'}):
+            out = list(xrun_pipeline(get_pipeline(output)))
+        eq_(out, target)
+        ok_(all(isinstance(d, LayeredDict) for d in out))
+
+
+def test_pipeline_unknown_engine():
+    assert_raises(ValueError, run_pipeline, [range_node(1)], engine='bogus')
+
+
+def test_pipeline_node_labels():
+    class StrCounting(object):
+        """Node which counts how many times it was converted into a str"""
+        nstr = 0
+
+        def __call__(self, data):
+            for i in range(3):
+                yield updated(data, {'i': i})
+
+        def __str__(self):
+            StrCounting.nstr += 1
+            return 'StrCounting'
+
+    node = StrCounting()
+    pipeline = [range_node(4), node, [node]]
+    # at default log level no label gets produced
+    run_pipeline(pipeline)
+    eq_(StrCounting.nstr, 0)
+    # and if logged -- only once per run
+    with swallow_logs(new_level=logging.DEBUG) as cml:
+        run_pipeline(pipeline)
+        assert_in('Node: StrCounting', cml.out)
+    eq_(StrCounting.nstr, 1)
+
+
+def test_pipeline_nested_plan():
+    from datalad_crawler import pipeline as pipeline_mod
+    sink = Sink()
+    pipeline = [range_node(5), switch('output', {i: [sink] for i in range(5)})]
+    with patch.object(pipeline_mod, 'InstrumentationPlan',
+                      wraps=pipeline_mod.InstrumentationPlan) as plan:
+        run_pipeline(pipeline)
+    # pipelines ran by switch for every item share the plan of the pipeline
+    eq_(plan.call_count, 1)
+    eq_(len(sink.data), 5)
+    ok_(pipeline_mod.get_active_plan() is None)
+
+
+@with_tempfile
+def test_pipeline_profile(filename=None):
+    class Doubling(object):
+        _custom_str = 'Doubling'
+
+        def __call__(self, data):
+            for i in range(2):
+                yield updated(data, {'j': i})
+
+    doubling = Doubling()
+    sink = Sink()
+    pipeline = [
+        range_node(3),
+        [{'output': 'outputs'}, doubling],
+        switch('j', {0: [sink], 1: None}),
+    ]
+    with swallow_logs(new_level=logging.INFO) as cml:
+        run_pipeline(pipeline, profile=filename)
+        assert_in('Profile of the pipeline nodes', cml.out)
+        assert_in('Doubling', cml.out)
+    eq_(len(sink.data), 6 // 2)
+    with open(filename) as f:
+        profile = json.load(f)
+    ok_(profile['total']['wall'] > 0)
+
+    def get_profile(prefix):
+        profiles = [p for p in profile['nodes'] if p['label'].startswith(prefix)]
+        eq_(len(profiles), 1)
+        return profiles[0]['calls'], profiles[0]['items_out']
+
+    eq_(get_profile('Doubling'), (3, 6))
+    eq_(get_profile('switch('), (6, 6))
+    # nodes within pipelines ran by switch are profiled as well
+    eq_(get_profile('Sink('), (3, 3))
+    for p in profile['nodes']:
+        ok_(p['wall'] >= 0)
+
+    # could be enabled via configuration
+    with patch_config({'datalad.crawl.pipeline.profile': filename}), \
+            swallow_logs(new_level=logging.INFO) as cml:
+        os.unlink(filename)
+        run_pipeline([range_node(2)])
+        assert_in('Profile of the pipeline nodes', cml.out)
+    with open(filename) as f:
+        eq_(json.load(f)['nodes'][0]['items_out'], 2)
+
+
+@with_tempfile
+def test_pipeline_profile_subprocess(filename=None):
+    from datalad.runner.runner import WitlessRunner
+    run = WitlessRunner.run
+
+    def sleeping(data):
+        WitlessRunner().run([sys.executable, '-c', 'import time; time.sleep(0.3)'])
+        yield data
+
+    run_pipeline([sleeping], profile=filename)
+    with open(filename) as f:
+        profile = json.load(f)['nodes'][0]
+    # time waiting on the subprocess is accounted for, but not as cpu time
+    ok_(profile['subprocess'] >= 0.3)
+    ok_(profile['wall'] >= profile['subprocess'])
+    ok_(profile['cpu'] < profile['subprocess'])
+    # timing is done only while profiling
+    ok_(WitlessRunner.run is run)